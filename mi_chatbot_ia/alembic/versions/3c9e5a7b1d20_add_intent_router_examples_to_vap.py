@@ -0,0 +1,37 @@
+"""Añadir intent_router_examples_json a virtual_agent_profiles
+
+Revision ID: 3c9e5a7b1d20
+Revises: 799346040a50
+Create Date: 2026-10-16 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c9e5a7b1d20'
+down_revision: Union[str, None] = '799346040a50'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'virtual_agent_profiles',
+        sa.Column(
+            'intent_router_examples_json',
+            postgresql.JSONB(astext_type=sa.Text()),
+            nullable=True,
+            comment="Frases de ejemplo por herramienta para el enrutador por embeddings (ej. {'DATABASE_TOOL': ['mis notas', ...]})."
+        )
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('virtual_agent_profiles', 'intent_router_examples_json')
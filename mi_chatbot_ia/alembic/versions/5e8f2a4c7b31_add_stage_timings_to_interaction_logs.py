@@ -0,0 +1,28 @@
+"""Añadir stage_timings_ms a interaction_logs
+
+Revision ID: 5e8f2a4c7b31
+Revises: 3c9e5a7b1d20
+Create Date: 2026-10-16 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e8f2a4c7b31'
+down_revision: Union[str, None] = '3c9e5a7b1d20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('interaction_logs', sa.Column('stage_timings_ms', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('interaction_logs', 'stage_timings_ms')
@@ -0,0 +1,37 @@
+"""Añadir farewell_templates_json a virtual_agent_profiles
+
+Revision ID: 7a1c3e9d2f48
+Revises: 5e8f2a4c7b31
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a1c3e9d2f48'
+down_revision: Union[str, None] = '5e8f2a4c7b31'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'virtual_agent_profiles',
+        sa.Column(
+            'farewell_templates_json',
+            postgresql.JSONB(astext_type=sa.Text()),
+            nullable=True,
+            comment="Plantillas de despedida que se rotan sin llamar al LLM (ej. {'with_name': ['¡Hasta luego, {user_name}!'], 'without_name': [...]})."
+        )
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('virtual_agent_profiles', 'farewell_templates_json')
@@ -0,0 +1,36 @@
+"""Añadir fallback_config_ids a llm_model_configs
+
+Revision ID: 8b2d4f6a1c59
+Revises: 7a1c3e9d2f48
+Create Date: 2026-10-16 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b2d4f6a1c59'
+down_revision: Union[str, None] = '7a1c3e9d2f48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'llm_model_configs',
+        sa.Column(
+            'fallback_config_ids',
+            sa.JSON(),
+            nullable=True,
+            comment="IDs de LLMModelConfig a los que se pasa, en orden, si este proveedor falla o su circuit breaker está abierto."
+        )
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('llm_model_configs', 'fallback_config_ids')
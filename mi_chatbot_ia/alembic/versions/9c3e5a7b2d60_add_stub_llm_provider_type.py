@@ -0,0 +1,31 @@
+"""Añadir STUB a llm_provider_type_enum
+
+Revision ID: 9c3e5a7b2d60
+Revises: 8b2d4f6a1c59
+Create Date: 2026-10-16 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c3e5a7b2d60'
+down_revision: Union[str, None] = '8b2d4f6a1c59'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # ALTER TYPE ... ADD VALUE no puede ejecutarse dentro de una transacción en PostgreSQL < 12.
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE llm_provider_type_enum ADD VALUE IF NOT EXISTS 'STUB'")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # PostgreSQL no permite quitar valores de un enum: se deja 'STUB' en el tipo.
+    # Basta con no tener configuraciones que lo usen.
+    pass
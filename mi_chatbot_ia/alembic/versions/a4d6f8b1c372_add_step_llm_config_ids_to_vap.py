@@ -0,0 +1,37 @@
+"""Añadir step_llm_config_ids_json a virtual_agent_profiles
+
+Revision ID: a4d6f8b1c372
+Revises: 9c3e5a7b2d60
+Create Date: 2026-10-16 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4d6f8b1c372'
+down_revision: Union[str, None] = '9c3e5a7b2d60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'virtual_agent_profiles',
+        sa.Column(
+            'step_llm_config_ids_json',
+            postgresql.JSONB(astext_type=sa.Text()),
+            nullable=True,
+            comment="LLMModelConfig por paso del pipeline (ej. {'routing': 3, 'extraction': 3, 'condense': 3, 'answer': 1}). Los pasos sin entrada usan llm_model_config_id."
+        )
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('virtual_agent_profiles', 'step_llm_config_ids_json')
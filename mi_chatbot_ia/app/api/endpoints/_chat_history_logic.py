@@ -1,13 +1,102 @@
 # app/api/endpoints/_chat_history_logic.py (Versión ASÍNCRONA Final con Redis)
 
+import asyncio
 import json
 from typing import List, Optional
 
 # Ya no importamos nada de SQLAlchemy aquí.
 from langchain_core.chat_history import BaseChatMessageHistory
-from langchain_core.messages import BaseMessage, messages_from_dict, message_to_dict
+from langchain_core.messages import BaseMessage, SystemMessage, messages_from_dict, message_to_dict
 from redis.asyncio import Redis as AsyncRedis
 
+from app.config import settings
+from app.services import conversation_state_service
+
+
+GREETING_TRIGGER_MESSAGE = "__INICIAR_CHAT__"
+SUMMARY_MESSAGE_PREFIX = "Resumen de la conversación anterior (preguntas del usuario): "
+
+# RPUSH + LTRIM atómicos que además pliegan las preguntas de los mensajes descartados
+# en el resumen acumulado (GET + SET dentro del mismo script: sin carreras entre turnos).
+_APPEND_AND_SUMMARIZE_LUA = """
+local key = KEYS[1]
+local summary_key = KEYS[2]
+local max_stored = tonumber(ARGV[1])
+local ttl = tonumber(ARGV[2])
+local max_summary_chars = tonumber(ARGV[3])
+local greeting = ARGV[4]
+for i = 5, #ARGV do
+    redis.call('RPUSH', key, ARGV[i])
+end
+local overflow = redis.call('LLEN', key) - max_stored
+if overflow > 0 then
+    local evicted = redis.call('LRANGE', key, 0, overflow - 1)
+    redis.call('LTRIM', key, overflow, -1)
+    local parts = {}
+    local previous_summary = redis.call('GET', summary_key)
+    if previous_summary and previous_summary ~= '' then
+        table.insert(parts, previous_summary)
+    end
+    local added = 0
+    for _, item in ipairs(evicted) do
+        local ok, message = pcall(cjson.decode, item)
+        if ok and type(message) == 'table' and message.type == 'human' and type(message.data) == 'table'
+            and type(message.data.content) == 'string' and message.data.content ~= greeting then
+            local question = string.match(message.data.content, '^%s*(.-)%s*$')
+            if question ~= '' then
+                table.insert(parts, question)
+                added = added + 1
+            end
+        end
+    end
+    if added > 0 then
+        local summary = table.concat(parts, '; ')
+        -- Se conserva lo más reciente si el resumen crece demasiado (sin partir un carácter UTF-8).
+        if #summary > max_summary_chars then
+            summary = '...' .. (string.gsub(string.sub(summary, -max_summary_chars), '^[\\128-\\191]+', ''))
+        end
+        if ttl > 0 then
+            redis.call('SET', summary_key, summary, 'EX', ttl)
+        else
+            redis.call('SET', summary_key, summary)
+        end
+    end
+else
+    overflow = 0
+end
+if ttl > 0 then
+    redis.call('EXPIRE', key, ttl)
+end
+return overflow
+"""
+
+_append_scripts = {}
+
+
+def _is_summary_message(message: BaseMessage) -> bool:
+    return isinstance(message, SystemMessage) and message.content.startswith(SUMMARY_MESSAGE_PREFIX)
+
+
+def get_history_window(messages: List[BaseMessage], window_size: int) -> List[BaseMessage]:
+    """
+    Últimos `window_size` mensajes para un handler concreto (0 = sin historial).
+    El resumen acumulado NO forma parte de la ventana: ver `get_history_summary`.
+    """
+    conversation = messages[1:] if messages and _is_summary_message(messages[0]) else messages
+    if window_size <= 0:
+        return []
+    return conversation[-window_size:]
+
+
+def get_history_summary(messages: List[BaseMessage]) -> str:
+    """
+    Texto del resumen acumulado (o "" si no hay). Se añade al prompt de sistema:
+    Bedrock/Anthropic no aceptan un mensaje de sistema en mitad del historial.
+    """
+    if messages and _is_summary_message(messages[0]):
+        return messages[0].content
+    return ""
+
 class FullyCustomChatMessageHistory(BaseChatMessageHistory):
     """
     Historial de chat ASÍNCRONO basado en Redis para alto rendimiento.
@@ -24,7 +113,10 @@ class FullyCustomChatMessageHistory(BaseChatMessageHistory):
             self.redis_client = redis_client
 
         self.session_id = session_id
-        self.key = f"message_store:{self.session_id}"
+        # Mismo hash-tag que el estado de la sesión: ambas claves caen en el mismo slot de Redis Cluster.
+        self.key = conversation_state_service.get_session_history_key(self.session_id)
+        self.legacy_key = conversation_state_service.get_legacy_history_key(self.session_id)
+        self.summary_key = conversation_state_service.get_session_summary_key(self.session_id)
         self.ttl = ttl_seconds
 
     @property
@@ -32,39 +124,97 @@ class FullyCustomChatMessageHistory(BaseChatMessageHistory):
         """Propiedad desaconsejada. Usar get_messages_async en su lugar."""
         return await self.get_messages_async()
         
-    async def get_messages_async(self) -> List[BaseMessage]:
-        """Obtiene los mensajes de forma asíncrona desde Redis."""
+    async def get_messages_async(self, max_messages: Optional[int] = None) -> List[BaseMessage]:
+        """
+        Obtiene de Redis solo los últimos `max_messages` mensajes (LRANGE con índices
+        negativos); `None` trae todo lo almacenado. Si hay resumen acumulado de los
+        turnos descartados, va primero como SystemMessage: usar `get_history_window`
+        y `get_history_summary` para separarlo antes de enviarlo al LLM.
+        """
         if not self.redis_client:
-            return self._messages
+            return self._messages[-max_messages:] if max_messages else list(self._messages)
+
+        start_index = -max_messages if max_messages else 0
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.lrange(self.key, start_index, -1)
+            if settings.CHAT_HISTORY_SUMMARY_ENABLED:
+                pipe.get(self.summary_key)
+            if settings.SESSION_LEGACY_KEYS_MIGRATION_ENABLED:
+                pipe.exists(self.legacy_key)
+            results = await pipe.execute()
+
+        _items = results[0]
+        summary = results[1] if settings.CHAT_HISTORY_SUMMARY_ENABLED else None
+        if settings.SESSION_LEGACY_KEYS_MIGRATION_ENABLED and not _items and results[-1]:
+            _items = await self._migrate_legacy_items(max_messages)
 
-        _items = await self.redis_client.lrange(self.key, 0, -1)
         items = [json.loads(m) for m in _items] # El cliente con decode_responses=True ya devuelve strings
         messages = messages_from_dict(items)
+        if summary:
+            messages.insert(0, SystemMessage(content=f"{SUMMARY_MESSAGE_PREFIX}{summary}"))
         return messages
 
+    async def _migrate_legacy_items(self, max_messages: Optional[int]) -> List[str]:
+        """Mueve el historial de la clave antigua (message_store:*) a la nueva y devuelve la ventana pedida."""
+        legacy_items = await self.redis_client.lrange(self.legacy_key, 0, -1)
+        if not legacy_items:
+            return []
+        # Las dos claves no comparten slot (RENAME fallaría en Cluster): se copia y se borra.
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.rpush(self.key, *legacy_items)
+            if settings.CHAT_HISTORY_MAX_STORED_MESSAGES:
+                pipe.ltrim(self.key, -settings.CHAT_HISTORY_MAX_STORED_MESSAGES, -1)
+            if self.ttl:
+                pipe.expire(self.key, self.ttl)
+            pipe.delete(self.legacy_key)
+            await pipe.execute()
+        print(f"CHAT_HISTORY: Historial antiguo de la sesión {self.session_id} migrado ({len(legacy_items)} mensajes).")
+        return legacy_items[-max_messages:] if max_messages else legacy_items
+
     async def add_messages(self, messages: List[BaseMessage]) -> None:
         """Método desaconsejado. Usar add_messages_async en su lugar."""
         await self.add_messages_async(messages)
         
     async def add_messages_async(self, messages: List[BaseMessage]) -> None:
-        """Añade mensajes de forma asíncrona a la lista de Redis."""
+        """
+        Añade mensajes a la lista de Redis y la recorta a `CHAT_HISTORY_MAX_STORED_MESSAGES`
+        (LTRIM). Con el resumen activado, los mensajes descartados se pliegan en el resumen.
+        """
         if not self.redis_client:
             self._messages.extend(messages)
             return
 
+        payloads = [json.dumps(message_to_dict(message)) for message in messages]
+        max_stored = settings.CHAT_HISTORY_MAX_STORED_MESSAGES
+
+        if max_stored and settings.CHAT_HISTORY_SUMMARY_ENABLED:
+            await self._get_append_script()(
+                keys=[self.key, self.summary_key],
+                args=[max_stored, self.ttl or 0, settings.CHAT_HISTORY_SUMMARY_MAX_CHARS, GREETING_TRIGGER_MESSAGE, *payloads]
+            )
+            return
+
         async with self.redis_client.pipeline() as pipe:
-            for message in messages:
-                pipe.rpush(self.key, json.dumps(message_to_dict(message)))
+            pipe.rpush(self.key, *payloads)
+            if max_stored:
+                pipe.ltrim(self.key, -max_stored, -1)
             if self.ttl:
                 pipe.expire(self.key, self.ttl)
             await pipe.execute()
 
+    def _get_append_script(self):
+        script = _append_scripts.get(id(self.redis_client))
+        if script is None:
+            script = self.redis_client.register_script(_APPEND_AND_SUMMARIZE_LUA)
+            _append_scripts[id(self.redis_client)] = script
+        return script
+
     async def clear_async(self) -> None:
         """Limpia el historial de forma asíncrona."""
         if not self.redis_client:
             self._messages = []
             return
-        await self.redis_client.delete(self.key)
+        await self.redis_client.delete(self.key, self.summary_key)
 
     def clear(self) -> None:
         """Limpia el historial. En un entorno async, esto puede ser problemático."""
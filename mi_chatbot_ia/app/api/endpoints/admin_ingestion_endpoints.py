@@ -1,7 +1,7 @@
 # mi_chatbot_ia/app/api/endpoints/admin_ingestion_endpoints.py
 
 import traceback
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 # --- IMPORTACIÓN CORREGIDA ---
 # Nos aseguramos de que APIRouter esté importado desde fastapi.
@@ -13,13 +13,14 @@ from fastapi import (
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from langchain_postgres.vectorstores import PGVector
+from redis.asyncio import Redis as AsyncRedis
 
 
 # Dependencias locales de tu aplicación
-from app.api.dependencies import get_vector_store, get_crud_db
+from app.api.dependencies import get_vector_store, get_crud_db, get_redis_client
 from app.security.role_auth import require_roles
 from app.models.app_user import AppUser
-from app.services import ingestion_service
+from app.services import ingestion_service, semantic_cache_service
 
 from app.crud import crud_context_definition # Asegúrate de tener esta importación
 from pydantic import BaseModel # Para el cuerpo de la petición
@@ -53,6 +54,7 @@ async def upload_and_ingest_documents(
     # --- Inyección de Dependencias ---
     db: AsyncSession = Depends(get_crud_db),
     vector_store: PGVector = Depends(get_vector_store),
+    redis_client: Optional[AsyncRedis] = Depends(get_redis_client),
     current_user: AppUser = Depends(require_roles(roles=ROLES_CAN_INGEST, menu_name=MENU_GESTION_CONTENIDO))
 ) -> Dict[str, Any]:
     """
@@ -85,6 +87,8 @@ async def upload_and_ingest_documents(
             db_session=db,
             vector_store=vector_store
         )
+        # Los documentos del contexto cambiaron: las respuestas cacheadas ya no son válidas.
+        await semantic_cache_service.bump_ingest_version_async(redis_client, context_id)
         
         return {
             "detail": f"Proceso de ingesta completado. Exitosos: {result['successful_files']}, Fallidos: {result['failed_files']}.",
@@ -115,6 +119,7 @@ async def delete_ingested_document(
     request_data: DeleteDocumentRequest,
     db: AsyncSession = Depends(get_crud_db),
     vector_store: PGVector = Depends(get_vector_store), 
+    redis_client: Optional[AsyncRedis] = Depends(get_redis_client),
     current_user: AppUser = Depends(require_roles(roles=ROLES_CAN_INGEST, menu_name=MENU_GESTION_CONTENIDO))
 ):
     context_id = request_data.context_id
@@ -155,6 +160,7 @@ async def delete_ingested_document(
             
             chunks_eliminados = result.rowcount
             print(f"DELETE_API: Se eliminaron {chunks_eliminados} chunks para '{filename}' del contexto ID {context_id}.")
+            await semantic_cache_service.bump_ingest_version_async(redis_client, context_id)
 
             return {
                 "detail": f"Documento '{filename}' eliminado exitosamente del contexto '{context.name}'.",
@@ -2,7 +2,8 @@
 
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Header
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Optional
+from redis.asyncio import Redis as AsyncRedis
 
 from app.db.session import get_crud_db_session
 from app.crud import crud_api_client
@@ -15,6 +16,8 @@ from app.schemas.schemas import (
 )
 from app.models.app_user import AppUser
 from app.security.role_auth import require_roles
+from app.api.dependencies import get_redis_client
+from app.services import tenant_config_service
 
 # =======================================================
 # === ROUTER #1: PARA EL PANEL DE ADMINISTRACIÓN (PRIVADO) ===
@@ -45,24 +48,29 @@ async def read_api_client_by_id_endpoint(api_client_id: int, db: AsyncSession =
     return db_api_client
 
 @router.put("/{api_client_id}", response_model=ApiClientResponse)
-async def update_existing_api_client_endpoint(api_client_id: int, api_client_update_in: ApiClientUpdate, db: AsyncSession = Depends(get_crud_db_session), current_user: AppUser = Depends(require_roles(roles=["SuperAdmin"], menu_name=MENU_API_CLIENTS))):
+async def update_existing_api_client_endpoint(api_client_id: int, api_client_update_in: ApiClientUpdate, db: AsyncSession = Depends(get_crud_db_session), redis_client: Optional[AsyncRedis] = Depends(get_redis_client), current_user: AppUser = Depends(require_roles(roles=["SuperAdmin"], menu_name=MENU_API_CLIENTS))):
     db_api_client_to_update = await crud_api_client.get_api_client_by_id(db, api_client_id)
     if not db_api_client_to_update:
         raise HTTPException(status_code=404, detail="Cliente API a actualizar no encontrado.")
-    return await crud_api_client.update_api_client(db, db_api_client_to_update, api_client_update_in)
+    updated_client = await crud_api_client.update_api_client(db, db_api_client_to_update, api_client_update_in)
+    await tenant_config_service.publish_invalidation_async(redis_client, api_client_id)
+    return updated_client
 
 @router.post("/{api_client_id}/regenerate_key", response_model=ApiClientWithPlainKeyResponse)
-async def regenerate_api_key_for_client_endpoint(api_client_id: int, db: AsyncSession = Depends(get_crud_db_session), current_user: AppUser = Depends(require_roles(roles=["SuperAdmin"], menu_name=MENU_API_CLIENTS))):
+async def regenerate_api_key_for_client_endpoint(api_client_id: int, db: AsyncSession = Depends(get_crud_db_session), redis_client: Optional[AsyncRedis] = Depends(get_redis_client), current_user: AppUser = Depends(require_roles(roles=["SuperAdmin"], menu_name=MENU_API_CLIENTS))):
     db_api_client_to_regen = await crud_api_client.get_api_client_by_id(db, api_client_id)
     if not db_api_client_to_regen:
         raise HTTPException(status_code=404, detail="Cliente API no encontrado para regenerar key.")
-    return await crud_api_client.regenerate_api_key(db, db_api_client_to_regen)
+    regenerated_client = await crud_api_client.regenerate_api_key(db, db_api_client_to_regen)
+    await tenant_config_service.publish_invalidation_async(redis_client, api_client_id)
+    return regenerated_client
 
 @router.delete("/{api_client_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_api_client_endpoint(api_client_id: int, db: AsyncSession = Depends(get_crud_db_session), current_user: AppUser = Depends(require_roles(roles=["SuperAdmin"], menu_name=MENU_API_CLIENTS))):
+async def delete_api_client_endpoint(api_client_id: int, db: AsyncSession = Depends(get_crud_db_session), redis_client: Optional[AsyncRedis] = Depends(get_redis_client), current_user: AppUser = Depends(require_roles(roles=["SuperAdmin"], menu_name=MENU_API_CLIENTS))):
     deleted_client = await crud_api_client.delete_api_client(db, api_client_id)
     if not deleted_client:
         raise HTTPException(status_code=404, detail="Cliente API no encontrado para eliminar.")
+    await tenant_config_service.publish_invalidation_async(redis_client, api_client_id)
     return None
 
 @router.put("/{api_client_id}/webchat-ui-config", response_model=ApiClientResponse)
@@ -4,21 +4,22 @@
 import time
 import traceback
 import asyncio
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
 import json
 from operator import itemgetter
 import re
+from dataclasses import dataclass
 from urllib.parse import quote_plus
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
-from sqlalchemy.orm import selectinload
 from redis.asyncio import Redis as AsyncRedis
 
 # === LangChain Imports ===
 from langchain_core.messages import HumanMessage, AIMessage, get_buffer_string
 from langchain_core.prompts import ChatPromptTemplate, PromptTemplate, MessagesPlaceholder # <-- ASEGURAR ESTA LÍNEA
-from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+from langchain_core.runnables import Runnable, RunnableLambda, RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
 from langchain_core.documents import Document as LangchainCoreDocument
 from langchain_core.language_models.chat_models import BaseChatModel
@@ -34,10 +35,17 @@ from app.config import settings
 # Herramientas de seguridad
 from app.security.api_key_auth import get_validated_api_client
 # Servicios (como el de caché)
-from app.services import cache_service
+from app.services import (
+    cache_service, semantic_cache_service, tenant_config_service, intent_router_service,
+    question_condenser_service, metrics_service, prompt_registry, greeting_cache_service,
+    farewell_service, single_flight_service, llm_memo_service
+)
+from app.services.metrics_service import stage_timer
+from app.services.admission_control_service import admission_controller, AdmissionRejected
+# Estado de conversación (un hash de Redis por sesión, escritura atómica con Lua)
+from app.services.conversation_state_service import get_conversation_state_async, save_conversation_state_async
 
 # CRUD (Importamos las versiones ASÍNCRONAS donde sea necesario)
-from app.crud import crud_virtual_agent_profile, crud_llm_model_config
 from app.crud.crud_interaction_log import create_interaction_log_async
 
 # Modelos y Schemas (Las "plantillas" de nuestros datos)
@@ -47,7 +55,7 @@ from app.models.virtual_agent_profile import VirtualAgentProfile
 from app.schemas.schemas import ChatRequest, ChatResponse
 
 # Lógica específica de la aplicación
-from ._chat_history_logic import FullyCustomChatMessageHistory
+from ._chat_history_logic import FullyCustomChatMessageHistory, get_history_summary, get_history_window
 from app.tools.sql_tools import run_db_query_chain
 
 router = APIRouter(tags=["Chat"])
@@ -55,6 +63,24 @@ router = APIRouter(tags=["Chat"])
 # --- Constantes y Clases de Excepción ---
 CONV_STATE_AWAITING_NAME = "awaiting_name_confirmation"
 CONV_STATE_AWAITING_TOOL_PARAMS = "awaiting_tool_parameters"
+# Callback asíncrono que recibe cada token de la respuesta (endpoint de streaming).
+TokenCallback = Callable[[str], Awaitable[None]]
+# Intenciones cuya respuesta no depende del estado de la sesión y pueden servirse desde caché.
+RESPONSE_CACHEABLE_INTENTS = {"RAG_DOCUMENTAL"}
+# Mensajes de historial que se leen de Redis por turno: lo que necesite el handler más exigente
+# (y al menos 2, para distinguir el turno de captura del nombre).
+HISTORY_FETCH_WINDOW = max(settings.CHAT_HISTORY_WINDOW_SIZE_RAG, settings.CHAT_HISTORY_WINDOW_SIZE_SQL, 2)
+
+@dataclass(frozen=True)
+class TurnLLMs:
+    """
+    LLM de cada paso del pipeline para el turno (ver `vap.step_llm_config_ids_json`). No son
+    chat models sino los Runnables de `get_cached_llm`: breaker, failover y medición por paso.
+    """
+    answer: Runnable
+    routing: Runnable
+    extraction: Runnable
+    condense: Runnable
 
 class AuthRequiredError(Exception):
     """Excepción especial para indicar que se requiere login."""
@@ -67,105 +93,9 @@ async def _handle_human_handoff(uid: str, q: str) -> Dict[str, str]:
     ticket_id = f"TICKET-{int(time.time())}"
     return {"ticket_id": ticket_id, "response_text": f"He creado un ticket de soporte ({ticket_id})."}
 
-# --- Funciones de Gestión de Estado ASÍNCRONAS ---
-
-def _get_conversation_state_key(session_id: str) -> str:
-    """Devuelve la clave estandarizada para el NOMBRE del estado de la conversación."""
-    return f"conv:state:{session_id}"
-
-def _get_tool_params_key(session_id: str) -> str:
-    """Devuelve la clave estandarizada para los PARÁMETROS PARCIALES de la herramienta."""
-    return f"conv:params:{session_id}"
-
-def _get_user_name_key(session_id: str) -> str:
-    """Devuelve la clave para el nombre de usuario de la sesión."""
-    return f"conv:username:{session_id}"
-
-async def get_conversation_state_async(redis_client: Optional[AsyncRedis], session_id: str) -> Dict[str, Any]:
-    """Recupera el estado completo de la conversación de forma asíncrona."""
-    if not redis_client:
-        return {"state_name": None, "partial_parameters": {}}
-        
-    state_key = _get_conversation_state_key(session_id)
-    params_key = _get_tool_params_key(session_id)
-    username_key = _get_user_name_key(session_id)
-
-    state, params, username  = await asyncio.gather(
-        cache_service.get_generic_cache_async(redis_client, state_key),
-        cache_service.get_generic_cache_async(redis_client, params_key),
-        cache_service.get_generic_cache_async(redis_client, username_key)
-    )
-    
-    return {
-        "state_name": state if isinstance(state, str) else None,
-        "partial_parameters": params if isinstance(params, dict) else {},
-        "user_name": username if isinstance(username, str) else None
-    }
-
-async def save_conversation_state_async(
-    redis_client: Optional[AsyncRedis], 
-    session_id: str, 
-    state_name: Optional[str], 
-    partial_params: Optional[Dict[str, Any]], 
-    ttl_seconds: int = 300
-):
-    """Guarda el estado. Ahora también maneja el 'user_name' si viene en partial_params."""
-    if not redis_client: return
-        
-    state_key = _get_conversation_state_key(session_id)
-    params_key = _get_tool_params_key(session_id)
-    username_key = _get_user_name_key(session_id)
-
-    # Preparamos los parámetros de herramienta sin el nombre de usuario
-    tool_params_to_save = partial_params.copy() if partial_params else {}
-    user_name_to_save = tool_params_to_save.pop("user_name", None)
-
-    tasks = []
-    
-    # Manejar estado y parámetros de herramienta
-    if state_name is None:
-        tasks.extend([
-            cache_service.delete_generic_cache_async(redis_client, state_key),
-            cache_service.delete_generic_cache_async(redis_client, params_key)
-        ])
-    else:
-        tasks.append(cache_service.set_generic_cache_async(redis_client, state_key, state_name, ttl_seconds=ttl_seconds))
-        if tool_params_to_save: # Solo guardamos si hay algo que guardar
-            tasks.append(cache_service.set_generic_cache_async(redis_client, params_key, tool_params_to_save, ttl_seconds=ttl_seconds))
-        else:
-            tasks.append(cache_service.delete_generic_cache_async(redis_client, params_key))
-
-    # Manejar nombre de usuario por separado (con un TTL más largo quizás)
-    if user_name_to_save:
-        tasks.append(cache_service.set_generic_cache_async(redis_client, username_key, user_name_to_save, ttl_seconds=180)) # Guardamos el nombre por 1 hora
-
-    if tasks:
-        await asyncio.gather(*tasks)
-
 # --- GRUPO 4: AGENTES Y HANDLERS DE LÓGICA ---
 
-async def master_router_agent(
-    question: str,
-    has_db_capability: bool,
-    has_doc_capability: bool,
-    llm: BaseChatModel
-
-) -> str:
-    """
-    Decide qué herramienta usar: RAG, BD o Despedida.
-    """
-    if not has_db_capability and not has_doc_capability: return "NO_CAPABILITY"
-
-    # Si solo tiene una capacidad, la decisión es directa, a menos que sea una despedida.
-    is_farewell_simple_check = any(word in question.lower() for word in ["gracias", "adiós", "chao", "hasta luego", "eso es todo"])
-    if is_farewell_simple_check:
-        return "FAREWELL_HANDLER"
-
-    if has_db_capability and not has_doc_capability: return "DATABASE_TOOL"
-    if has_doc_capability and not has_db_capability: return "DOCUMENT_RETRIEVER"
-
-
-   
+def _build_router_chain(llm: BaseChatModel):
     prompt = ChatPromptTemplate.from_messages([
          
         (f"system",
@@ -177,11 +107,15 @@ async def master_router_agent(
          "3. `FAREWELL_HANDLER`: Úsala si el usuario se está despidiendo o agradeciendo para finalizar la conversación. Ejemplos: 'gracias', 'eso es todo por ahora', 'adiós'.\n"),
         ("human", "Pregunta del usuario: {question}\n\nRespuesta JSON (solo la clave 'tool_to_use'):"),
     ])
-    
-    chain = prompt | llm | JsonOutputParser()
+    return prompt | llm_memo_service.memoize("router", llm, llm | JsonOutputParser())
+
+async def _llm_router(question: str, llm: BaseChatModel) -> str:
+    """Enrutador original por LLM (JSON). Se usa como respaldo del enrutador por embeddings."""
+    chain = prompt_registry.get_chain("router", llm, lambda: _build_router_chain(llm))
     
     try:
-        response = await chain.ainvoke({"question": question})
+        with stage_timer("router_llm"):
+            response = await chain.ainvoke({"question": question})
         selected_tool = response.get("tool_to_use")
         if selected_tool in ["DOCUMENT_RETRIEVER", "DATABASE_TOOL", "FAREWELL_HANDLER"]:
             print(f"MASTER_ROUTER: Herramienta seleccionada: {selected_tool}")
@@ -191,24 +125,93 @@ async def master_router_agent(
 
     return "DOCUMENT_RETRIEVER"
 
-async def handle_greeting(vap: VirtualAgentProfile, llm: BaseChatModel, req: ChatRequest) -> Dict[str, Any]:
-    """Maneja el saludo inicial. Tu lógica original se mantiene."""
-    log = {"intent": "GREETING"}
-    chain = ChatPromptTemplate.from_template(vap.greeting_prompt) | llm | StrOutputParser()
+async def master_router_agent(
+    question: str,
+    has_db_capability: bool,
+    has_doc_capability: bool,
+    llm: BaseChatModel,
+    embedding_model=None,
+    vap: Optional[VirtualAgentProfile] = None,
+    routing_log: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    Decide qué herramienta usar: RAG, BD o Despedida.
+    Primero intenta con el enrutador local por embeddings; solo consulta al LLM si el
+    margen entre las dos mejores clases es bajo. La decisión se deja en `routing_log`.
+    """
+    if routing_log is None: routing_log = {}
+    if not has_db_capability and not has_doc_capability: return "NO_CAPABILITY"
+
+    # Si solo tiene una capacidad, la decisión es directa, a menos que sea una despedida.
+    is_farewell_simple_check = any(word in question.lower() for word in ["gracias", "adiós", "chao", "hasta luego", "eso es todo"])
+    if is_farewell_simple_check:
+        routing_log.update({"router": "keyword", "selected_tool": "FAREWELL_HANDLER"})
+        return "FAREWELL_HANDLER"
+
+    if has_db_capability and not has_doc_capability:
+        routing_log.update({"router": "single_capability", "selected_tool": "DATABASE_TOOL"})
+        return "DATABASE_TOOL"
+    if has_doc_capability and not has_db_capability:
+        routing_log.update({"router": "single_capability", "selected_tool": "DOCUMENT_RETRIEVER"})
+        return "DOCUMENT_RETRIEVER"
+
+    # --- Enrutador local por embeddings ---
+    decision = None
+    if settings.INTENT_ROUTER_ENABLED:
+        with stage_timer("router_embedding"):
+            decision = await intent_router_service.classify_async(embedding_model, question, vap)
+    if decision:
+        routing_log.update(decision.as_log())
+        is_confident = decision.margin >= settings.INTENT_ROUTER_MIN_MARGIN
+        print(f"INTENT_ROUTER: '{decision.label}' (confianza {decision.confidence:.3f}, margen {decision.margin:.3f}, "
+              f"{'seguro' if is_confident else 'dudoso -> LLM'}{', modo sombra' if settings.INTENT_ROUTER_SHADOW_MODE else ''}).")
+        if is_confident and not settings.INTENT_ROUTER_SHADOW_MODE:
+            routing_log.update({"router": "embedding", "selected_tool": decision.label})
+            return decision.label
+
+    # --- Respaldo (o modo sombra): enrutador por LLM ---
+    selected_tool = await _llm_router(question, llm)
+    routing_log.update({"router": "llm", "selected_tool": selected_tool})
+    if decision:
+        routing_log["embedding_agrees_with_llm"] = decision.label == selected_tool
+    return selected_tool
+
+async def handle_greeting(
+    vap: VirtualAgentProfile, llm: BaseChatModel, req: ChatRequest, redis_client: Optional[AsyncRedis] = None
+) -> Dict[str, Any]:
+    """
+    Maneja el saludo inicial. Sin nombre de usuario (el caso normal) se sirve una de las
+    variantes pregeneradas del agente, sin llamar al LLM.
+    """
+    log, metadata = {"intent": "GREETING"}, {}
+    chain = prompt_registry.get_chain(
+        "greeting", llm, lambda: ChatPromptTemplate.from_template(vap.greeting_prompt) | llm | StrOutputParser(), vap=vap
+    )
     # Cambiamos "Usuario" por "" para no inyectar un nombre falso.
-    final_bot_response = await chain.ainvoke({"user_name": req.user_name or ""})
+    user_name = req.user_name or ""
+
+    async def _generate_greeting() -> str:
+        return await chain.ainvoke({"user_name": user_name})
+
+    if settings.GREETING_CACHE_ENABLED and not user_name.strip():
+        with stage_timer("greeting"):
+            final_bot_response = await greeting_cache_service.get_greeting_async(redis_client, vap, _generate_greeting)
+        metadata = {"greeting_from_pool": True}
+    else:
+        with stage_timer("greeting_llm"):
+            final_bot_response = await _generate_greeting()
     
     next_state, next_params = None, None
     if vap.name_confirmation_prompt:
         next_state = CONV_STATE_AWAITING_NAME
         next_params = {}
         
-    return {"response": final_bot_response, "metadata": {}, "log": log, "next_state": next_state, "next_params": next_params}
+    return {"response": final_bot_response, "metadata": metadata, "log": log, "next_state": next_state, "next_params": next_params}
 
 async def handle_name_and_query_extraction(
     req: ChatRequest,
     vap: VirtualAgentProfile,
-    llm: BaseChatModel,
+    llms: TurnLLMs,
     user_dni: Optional[str],
     history_list: List,
     active_contexts: List[ContextDefinition],
@@ -248,11 +251,18 @@ async def handle_name_and_query_extraction(
         "Tu JSON de análisis:"
     )
 
-    extraction_prompt_template = ChatPromptTemplate.from_template(extraction_prompt_template_str)
-    extraction_chain = extraction_prompt_template | llm | JsonOutputParser()
+    # El texto solo depende del VAP (su nombre): la cadena se compila una vez por agente.
+    extraction_llm = llms.extraction
+    extraction_chain = prompt_registry.get_chain(
+        "name_and_query_extraction", extraction_llm,
+        lambda: ChatPromptTemplate.from_template(extraction_prompt_template_str)
+        | llm_memo_service.memoize("name_and_query_extraction", extraction_llm, extraction_llm | JsonOutputParser()),
+        vap=vap
+    )
 
     try:
-        extraction_result = await extraction_chain.ainvoke({"user_input": req.message.strip()})
+        with stage_timer("name_extraction_llm"):
+            extraction_result = await extraction_chain.ainvoke({"user_input": req.message.strip()})
         extracted_name_raw = extraction_result.get("extracted_name")
         follow_up_query = extraction_result.get("follow_up_query")
     except Exception as e:
@@ -278,7 +288,7 @@ async def handle_name_and_query_extraction(
         new_req = req.copy(update={"message": follow_up_query})
         
         result = await handle_new_question(
-            req=new_req, user_dni=user_dni, llm=llm, history_list=[],
+            req=new_req, user_dni=user_dni, llms=llms, history_list=[],
             active_contexts=active_contexts, all_allowed_contexts=all_allowed_contexts, vap=vap, 
             db=db, vector_store=vector_store, app_state=app_state, redis_client=redis_client
         )
@@ -332,15 +342,15 @@ async def handle_name_confirmation(question: str, vap: VirtualAgentProfile, llm:
         "Texto del usuario: \"{user_provided_name}\"\n"
         "JSON:"
     )
-    extraction_chain = (
-        ChatPromptTemplate.from_template(extraction_prompt_template) 
-        | llm 
-        | JsonOutputParser()
+    extraction_chain = prompt_registry.get_chain(
+        "name_confirmation", llm,
+        lambda: ChatPromptTemplate.from_template(extraction_prompt_template) | llm | JsonOutputParser()
     )
     
     extracted_name = "" # <-- Empezamos con un valor seguro
     try:
-        extraction_result = await extraction_chain.ainvoke({"user_provided_name": question.strip()})
+        with stage_timer("name_extraction_llm"):
+            extraction_result = await extraction_chain.ainvoke({"user_provided_name": question.strip()})
         # Usamos .get() que devuelve None por defecto si no encuentra la clave
         name_from_llm = extraction_result.get("extracted_name")
         if name_from_llm: # Solo procesamos si el LLM devolvió algo
@@ -367,14 +377,7 @@ async def handle_name_confirmation(question: str, vap: VirtualAgentProfile, llm:
         "next_params": {"user_name": extracted_name}
     }
 
-async def is_name_or_query_classifier_chain(question: str, llm: BaseChatModel) -> bool:
-    """
-    Clasifica si la entrada de un usuario es un nombre o una consulta directa.
-    
-    Devuelve:
-        - True si la entrada parece ser un nombre o una presentación.
-        - False si la entrada es una pregunta o una consulta.
-    """
+def _build_name_or_query_classifier_chain(llm: BaseChatModel):
     classifier_prompt = ChatPromptTemplate.from_messages([
         ("system",
          "Eres un clasificador de intenciones llamado Hered-IA experto y muy rápido. El asistente virtual acaba de preguntar al usuario su nombre. "
@@ -386,10 +389,21 @@ async def is_name_or_query_classifier_chain(question: str, llm: BaseChatModel) -
         ("human", "Respuesta del usuario: \"{user_input}\"\n\nJSON:")
     ])
     
-    chain = classifier_prompt | llm | JsonOutputParser()
+    return classifier_prompt | llm_memo_service.memoize("name_or_query_classifier", llm, llm | JsonOutputParser())
+
+async def is_name_or_query_classifier_chain(question: str, llm: BaseChatModel) -> bool:
+    """
+    Clasifica si la entrada de un usuario es un nombre o una consulta directa.
+    
+    Devuelve:
+        - True si la entrada parece ser un nombre o una presentación.
+        - False si la entrada es una pregunta o una consulta.
+    """
+    chain = prompt_registry.get_chain("name_or_query_classifier", llm, lambda: _build_name_or_query_classifier_chain(llm))
     
     try:
-        response = await chain.ainvoke({"user_input": question})
+        with stage_timer("name_extraction_llm"):
+            response = await chain.ainvoke({"user_input": question})
         # Devuelve el valor booleano, con un fallback seguro a 'False' si hay algún problema
         return response.get("is_name", False) 
     except Exception as e:
@@ -397,56 +411,32 @@ async def is_name_or_query_classifier_chain(question: str, llm: BaseChatModel) -
         return False # Si el LLM falla, es más seguro tratarlo como una consulta para no atascar al bot.
 
 
+
 # En app/api/endpoints/chat_api_endpoints.py
 
-async def handle_farewell(vap: VirtualAgentProfile, req: ChatRequest, llm: BaseChatModel) -> Dict[str, Any]:
-    """Maneja la despedida de forma controlada y robusta, construyendo el prompt en Python."""
+async def handle_farewell(vap: VirtualAgentProfile, req: ChatRequest) -> Dict[str, Any]:
+    """
+    Maneja la despedida SIN llamar al LLM: rota las plantillas del agente
+    (`farewell_templates_json`, o las por defecto) y las personaliza con el nombre cacheado.
+    """
     log = {"intent": "FAREWELL"}
 
-    # --- LÓGICA CLAVE: PREPARAMOS LA VARIABLE DEL NOMBRE EN PYTHON ---
     # Usamos nuestra lista negra para asegurar que no pasen valores no deseados.
     INVALID_NAME_VALUES = {'', 'null', 'none', 'n/a', 'usuario', ':null'}
-    user_name_for_prompt = ""
+    user_name_for_farewell = ""
     if req.user_name and str(req.user_name).strip().lower() not in INVALID_NAME_VALUES:
-        user_name_for_prompt = req.user_name.strip()
+        user_name_for_farewell = req.user_name.strip()
 
-    # --- CONSTRUCCIÓN DINÁMICA DE LA INSTRUCCIÓN DE PERSONALIZACIÓN ---
-    # Aquí está la magia: decidimos en Python qué instrucción simple le daremos al LLM.
-    if user_name_for_prompt:
-        # CASO 1: Tenemos un nombre real. La instrucción es directa.
-        personalization_instruction = (
-            f"El nombre del usuario es **{user_name_for_prompt}**. "
-            f"Personaliza la despedida dirigiéndote a él por su nombre (ej. '¡Hasta luego, {user_name_for_prompt}!')."
-        )
-        print(f"FAREWELL_LOGIC: Se usará el nombre '{user_name_for_prompt}' para la despedida.")
-    else:
-        # CASO 2: NO tenemos nombre. La instrucción también es directa.
-        personalization_instruction = (
-            "No se ha proporcionado el nombre del usuario. "
-            "Genera una despedida amable y general sin usar ningún nombre."
-        )
-        print("FAREWELL_LOGIC: No se usará nombre para la despedida (genérica).")
-        
-    # --- PROMPT FINAL SIMPLIFICADO ---
-    # El prompt ahora es muy tonto. Solo inserta la instrucción que ya preparamos.
-    farewell_prompt_template = (
-        "Tu única tarea es generar una despedida corta y amable para un usuario. "
-        "{instruction}. " # <-- Aquí va nuestra instrucción ya procesada.
-        "Agradécele siempre por la conversación y anímale a volver si tiene más dudas. "
-        "Termina con un emoji amigable."
-    )
-    
-    chain = ChatPromptTemplate.from_template(farewell_prompt_template) | llm | StrOutputParser()
+    with stage_timer("farewell"):
+        final_bot_response = farewell_service.render_farewell(vap, user_name_for_farewell)
+    print(f"FAREWELL_LOGIC: Despedida por plantilla ({'con nombre' if user_name_for_farewell else 'genérica'}).")
 
-    # Invocamos la cadena con la instrucción específica que creamos.
-    final_bot_response = await chain.ainvoke({"instruction": personalization_instruction})
-        
-    return {"response": final_bot_response, "metadata": {}, "log": log, "next_state": None, "next_params": None}
+    return {"response": final_bot_response, "metadata": {"farewell_from_template": True}, "log": log, "next_state": None, "next_params": None}
 
 async def handle_tool_clarification(
     req: ChatRequest, 
     conversation_state: Dict, 
-    llm: BaseChatModel, 
+    llms: TurnLLMs, 
     history_list: List, 
     active_contexts: List[ContextDefinition]
 ) -> Dict[str, Any]:
@@ -462,13 +452,14 @@ async def handle_tool_clarification(
     # Llama a la cadena SQL y le pasa los parámetros parciales que teníamos guardados en Redis
     tool_call_result = await run_db_query_chain(
         question=req.message,
-        chat_history_str=get_buffer_string(history_list),
+        chat_history_str=get_buffer_string(get_history_window(history_list, settings.CHAT_HISTORY_WINDOW_SIZE_SQL)),
         db_conn_config=target_context.db_connection_config,
         processing_config=target_context.processing_config or {},
-        llm=llm,
+        llm=llms.answer,
         user_dni=req.user_dni, 
         user_name=req.user_name,
-        partial_params_from_redis=conversation_state.get("partial_parameters")
+        partial_params_from_redis=conversation_state.get("partial_parameters"),
+        extraction_llm=llms.extraction
     )
     
     final_bot_response = tool_call_result.get("final_answer")
@@ -484,16 +475,66 @@ async def handle_tool_clarification(
         next_params["context_id"] = target_context.id # Mantenemos el ID del contexto
     
     return {"response": final_bot_response, "metadata": metadata, "log": log, "next_state": next_state, "next_params": next_params}
-# En app/api/endpoints/chat_api_endpoints.py
 
-# En app/api/endpoints/chat_api_endpoints.py
 
-# UBICACIÓN: app/api/endpoints/chat_api_endpoints.py
+def _format_docs(docs: List[LangchainCoreDocument]) -> str:
+    return "\n\n".join(d.page_content for d in docs)
+
+def _build_standalone_question_chain(condense_q_prompt: PromptTemplate, llm: BaseChatModel):
+    """
+    Cadena de condensación. Entrada: {"question", "chat_history": List[BaseMessage]}.
+    El prompt de condensación recibe el historial como texto plano.
+    """
+    return RunnablePassthrough.assign(
+        chat_history=lambda x: get_buffer_string(x["chat_history"])
+    ) | condense_q_prompt | llm | StrOutputParser()
+
+async def _condense_question_async(llm: BaseChatModel, req: ChatRequest, history_list: List) -> str:
+    """
+    Devuelve la pregunta independiente. Solo llama al LLM cuando hay historial útil y la
+    pregunta parece un seguimiento; el resultado se cachea por (sesión, turno, pregunta).
+    """
+    usable_history = question_condenser_service.get_usable_history(history_list)
+    should_condense, reason = question_condenser_service.needs_condensation(req.message, usable_history)
+    if not should_condense:
+        print(f"CONDENSE: Se omite la llamada al LLM ({reason}).")
+        return req.message
+
+    # El historial llega recortado a una ventana: la clave usa su contenido, no su longitud.
+    history_marker = question_condenser_service.get_history_marker(history_list)
+    cached = question_condenser_service.get_cached_condensed(req.session_id, history_marker, req.message)
+    if cached:
+        print("CONDENSE: Pregunta independiente recuperada de caché.")
+        return cached
+
+    print(f"CONDENSE: Condensando con el LLM ({reason}).")
+    condense_chain = prompt_registry.get_chain(
+        "rag_condense", llm,
+        lambda: _build_standalone_question_chain(PromptTemplate.from_template(settings.DEFAULT_RAG_CONDENSE_QUESTION_TEMPLATE), llm)
+    )
+    with stage_timer("condense_llm"):
+        standalone_question = await condense_chain.ainvoke(
+            {"question": req.message, "chat_history": history_list}
+        )
+    question_condenser_service.set_cached_condensed(req.session_id, history_marker, req.message, standalone_question)
+    return standalone_question or req.message
+
+def _build_rag_answer_chain(answer_prompt: ChatPromptTemplate, llm: BaseChatModel):
+    """
+    Genera la respuesta final. Entrada: {"chat_history", "conversation_summary", "standalone_question", "context_docs"}.
+    El historial va como LISTA de mensajes y 'question' es la pregunta independiente;
+    el resumen acumulado (o "") se añade al final del prompt de sistema.
+    Devuelve texto, por lo que admite `astream` para emitir tokens.
+    """
+    return RunnablePassthrough.assign(
+        question=itemgetter("standalone_question"),
+        context=itemgetter("context_docs") | RunnableLambda(_format_docs),
+    ) | answer_prompt | llm | StrOutputParser()
 
 async def handle_new_question(
     req: ChatRequest, 
     user_dni: Optional[str],
-    llm: BaseChatModel, 
+    llms: TurnLLMs, 
     history_list: List,
     active_contexts: List[ContextDefinition], 
     all_allowed_contexts: List[ContextDefinition],
@@ -501,10 +542,14 @@ async def handle_new_question(
     db: AsyncSession,
     vector_store: PGVector,
     app_state: AppState,
-    redis_client: Optional[AsyncRedis]
+    redis_client: Optional[AsyncRedis],
+    on_token: Optional[TokenCallback] = None,
+    routing_log: Optional[Dict[str, Any]] = None
 ) -> Dict[str, Any]:
     """
     Maneja una nueva pregunta con una capa de seguridad explícita y flujo de datos corregido.
+    Si se recibe `on_token`, la respuesta RAG se emite token a token mientras se genera.
+    La decisión de enrutado (herramienta, enrutador usado, confianzas) se deja en `routing_log`.
     """
     # --- 1. Determinar contextos y capacidades ---
     active_db_ctx = next((c for c in active_contexts if c.main_type == ContextMainType.DATABASE_QUERY), None)
@@ -514,7 +559,10 @@ async def handle_new_question(
     has_doc_capability = any(c.main_type == ContextMainType.DOCUMENTAL for c in all_allowed_contexts)
     
     # --- 2. Enrutar Intención ---
-    selected_tool = await master_router_agent(req.message, has_db_capability, has_doc_capability, llm)
+    selected_tool = await master_router_agent(
+        req.message, has_db_capability, has_doc_capability, llms.routing,
+        embedding_model=app_state.embedding_model, vap=vap, routing_log=routing_log
+    )
     
     # <<<<<<<<<<<<<<<<< LA NUEVA LÓGICA COMIENZA AQUÍ >>>>>>>>>>>>>>>>>
 
@@ -548,7 +596,7 @@ async def handle_new_question(
     if selected_tool == "FAREWELL_HANDLER":
         print("SECURITY_GATE: Intención de despedida detectada. Llamando a handle_farewell.")
         # <<< LA CORRECCIÓN ES AÑADIR `req=req` A LA LLAMADA
-        return await handle_farewell(vap=vap, req=req, llm=llm)
+        return await handle_farewell(vap=vap, req=req)
 
 
     # --- CASO A: Intención es usar Base de Datos ---
@@ -567,13 +615,14 @@ async def handle_new_question(
         print("SECURITY_GATE: Permitido. Ejecutando DATABASE_TOOL (primer turno).")
         tool_call_result = await run_db_query_chain(
             question=req.message, 
-            chat_history_str=get_buffer_string(history_list),
+            chat_history_str=get_buffer_string(get_history_window(history_list, settings.CHAT_HISTORY_WINDOW_SIZE_SQL)),
             db_conn_config=active_db_ctx.db_connection_config, 
             processing_config=active_db_ctx.processing_config or {},
-            llm=llm, 
+            llm=llms.answer, 
             user_dni=req.user_dni,
             user_name=req.user_name,
-            partial_params_from_redis=None  # <-- Clave: Es una pregunta nueva, no hay estado previo.
+            partial_params_from_redis=None,  # <-- Clave: Es una pregunta nueva, no hay estado previo.
+            extraction_llm=llms.extraction
         )
         
         final_bot_response = tool_call_result.get("final_answer")
@@ -601,56 +650,72 @@ async def handle_new_question(
         print("SECURITY_GATE: Permitido. Ejecutando DOCUMENT_RETRIEVER (RAG).")
         
         # Esta limpieza de mensajes específicos es una buena práctica, la conservamos
-        clean_history_list = [msg for msg in history_list if not (isinstance(msg, AIMessage) and ("nota final del curso es" in msg.content or "son las siguientes:" in msg.content))]
-
-        # Prompt para volver la pregunta actual una pregunta independiente usando el historial
-        condense_q_prompt = PromptTemplate.from_template(settings.DEFAULT_RAG_CONDENSE_QUESTION_TEMPLATE)
+        rag_history_list = get_history_window(history_list, settings.CHAT_HISTORY_WINDOW_SIZE_RAG)
+        clean_history_list = [msg for msg in rag_history_list if not (isinstance(msg, AIMessage) and ("nota final del curso es" in msg.content or "son las siguientes:" in msg.content))]
 
         #  ¡EL CAMBIO MÁS IMPORTANTE! 
         # El prompt final se ensambla dinámicamente, tratando cada parte como un bloque.
         # Esto evita la contaminación del historial y permite que el LLM lo entienda nativamente.
-        answer_prompt = ChatPromptTemplate.from_messages([
-            ("system", vap.system_prompt), # Tu prompt principal de la BD (ya modificado).
-            MessagesPlaceholder(variable_name="chat_history"), # Aquí LangChain insertará la lista de mensajes.
-            ("human", "{question}") # La pregunta final independiente del usuario.
-        ])
+        # Solo depende del VAP: la cadena de respuesta se compila una vez por agente y LLM.
+        answer_chain = prompt_registry.get_chain(
+            "rag_answer", llms.answer,
+            lambda: _build_rag_answer_chain(ChatPromptTemplate.from_messages([
+                ("system", vap.system_prompt + "{conversation_summary}"), # Tu prompt principal de la BD (+ resumen de turnos antiguos).
+                MessagesPlaceholder(variable_name="chat_history"), # Aquí LangChain insertará la lista de mensajes.
+                ("human", "{question}") # La pregunta final independiente del usuario.
+            ]), llms.answer),
+            vap=vap
+        )
         
         retriever = vector_store.as_retriever(search_kwargs={"k": 3, "filter": {"context_name": active_doc_ctx.name}})
 
-        def format_docs(docs: List[LangchainCoreDocument]):
-            return "\n\n".join(d.page_content for d in docs)
-
-        # 1. Cadena para crear la pregunta independiente (mantiene la conversación fluida)
-        standalone_question_chain = RunnablePassthrough.assign(
-            chat_history=lambda x: get_buffer_string(clean_history_list)
-        ) | condense_q_prompt | llm | StrOutputParser()
-        
-        # 2. Cadena para recuperar documentos usando la pregunta independiente
-        retrieved_documents_chain = RunnablePassthrough.assign(
-            standalone_question=standalone_question_chain
-        ).assign(context_docs=itemgetter("standalone_question") | retriever)
-        
-        # 3. Cadena final que une todo
-        # Nota cómo pasamos 'chat_history' como una lista y 'question' como el string independiente.
-        final_rag_chain = (
-            retrieved_documents_chain |
-            RunnablePassthrough.assign(
-                # Pasamos el historial como una LISTA de mensajes, no como un texto plano.
-                chat_history=lambda x: clean_history_list, 
-                question=itemgetter("standalone_question"),
-                context=itemgetter("context_docs") | RunnableLambda(format_docs),
-            ) |
-            answer_prompt | llm | StrOutputParser()
-        )
+        # 1. Condensar (como mucho) UNA vez: la pregunta independiente sirve tanto para la caché semántica como para el retriever.
+        history_summary = get_history_summary(history_list)
+        rag_input = {
+            "question": req.message, "chat_history": clean_history_list,
+            "conversation_summary": f"\n\n{history_summary}" if history_summary else ""
+        }
+        standalone_question = await _condense_question_async(llms.condense, req, clean_history_list)
+        print(f"RAG_PIPELINE: Pregunta independiente: '{standalone_question}'.")
+
+        # 2. Caché semántica por (agente, contexto documental)
+        question_vector = None
+        if settings.SEMANTIC_CACHE_ENABLED:
+            with stage_timer("semantic_cache"):
+                question_vector = await semantic_cache_service.embed_question_async(app_state.embedding_model, standalone_question)
+                semantic_hit = await semantic_cache_service.lookup_async(redis_client, vap, active_doc_ctx.id, question_vector)
+            if semantic_hit:
+                metadata = dict(semantic_hit.get("metadata_details_json") or {})
+                metadata["semantic_cache_hit"] = {"similarity": round(semantic_hit["similarity"], 4), "matched_question": semantic_hit["matched_question"]}
+                return {"response": semantic_hit["bot_response"], "metadata": metadata, "log": {"intent": "RAG_DOCUMENTAL"}, "next_state": None, "next_params": None}
+
+        # 3. Recuperar y responder (por separado, para medir cada etapa)
+        with stage_timer("retrieve"):
+            source_documents = await retriever.ainvoke(standalone_question)
+        answer_input = {**rag_input, "standalone_question": standalone_question, "context_docs": source_documents}
+        with stage_timer("answer_llm"):
+            if on_token is None:
+                final_bot_response = await answer_chain.ainvoke(answer_input)
+            else:
+                # Streaming: los tokens se emiten a medida que el LLM los genera (vía `astream` del adaptador).
+                answer_parts: List[str] = []
+                async for token in answer_chain.astream(answer_input):
+                    answer_parts.append(token)
+                    await on_token(token)
+                final_bot_response = "".join(answer_parts)
+        print(f"RAG_PIPELINE: Documentos recuperados: {len(source_documents)}.")
 
-        chain_input = {"question": req.message}
-        final_bot_response = await final_rag_chain.ainvoke(chain_input)
-        
-        retrieved_data = await retrieved_documents_chain.ainvoke(chain_input)
-        source_documents = retrieved_data.get("context_docs", [])
-        
         metadata = {"source_documents": [{"source": doc.metadata.get("source", "N/A"), "page": doc.metadata.get("page_number", "N/A")} for doc in source_documents]} # Ajusta "page_number" si usas otro nombre
         log = {"intent": "RAG_DOCUMENTAL"}
+
+        # Una respuesta personalizada con el nombre del usuario no se comparte en la caché semántica.
+        is_personalized = bool(req.user_name and req.user_name.strip() and req.user_name.strip().lower() in (final_bot_response or "").lower())
+        if question_vector is not None and not is_personalized:
+            with stage_timer("semantic_cache"):
+                await semantic_cache_service.store_async(
+                    redis_client, vap, active_doc_ctx.id, standalone_question, question_vector,
+                    {"bot_response": final_bot_response, "metadata_details_json": metadata}
+                )
         
         return {"response": final_bot_response, "metadata": metadata, "log": log, "next_state": None, "next_params": None}  
     
@@ -662,10 +727,11 @@ async def handle_new_question(
 # VERSIÓN FINAL, COMPLETA Y VERIFICADA DE route_request.
 
 async def route_request(
-    req: ChatRequest, user_dni: Optional[str], conversation_state: Dict, llm: BaseChatModel, history_list: List,
+    req: ChatRequest, user_dni: Optional[str], conversation_state: Dict, llms: TurnLLMs, history_list: List,
     active_contexts: List[ContextDefinition], all_allowed_contexts: List[ContextDefinition],
     vap: VirtualAgentProfile, db: AsyncSession, 
-    redis_client: Optional[AsyncRedis], vector_store: PGVector, app_state: AppState
+    redis_client: Optional[AsyncRedis], vector_store: PGVector, app_state: AppState,
+    on_token: Optional[TokenCallback] = None
 ) -> Dict[str, Any]:
     """
     Orquesta la llamada al handler correcto. Diseño verificado para mantener la
@@ -677,7 +743,7 @@ async def route_request(
     # Maneja exclusivamente el primer mensaje si es la señal de inicio.
     if not history_list and req.message == "__INICIAR_CHAT__":
         print("ROUTE_LOGIC: Turno 1. Llamando a handle_greeting.")
-        return await handle_greeting(vap, llm, req)
+        return await handle_greeting(vap, llms.answer, req, redis_client)
     
     # --- REGLA 2: Potencial turno de nombre/consulta combinada. [NUEVA LÓGICA DELEGADA] ---
     # Detecta si estamos en el turno de pedir el nombre.
@@ -689,7 +755,7 @@ async def route_request(
         print("ROUTE_LOGIC: Estado AWAITING_NAME detectado. Delegando a handle_name_and_query_extraction.")
         return await handle_name_and_query_extraction(
             # Se le pasan todas las herramientas necesarias para que pueda operar de forma autónoma.
-            req=req, vap=vap, llm=llm, user_dni=user_dni, history_list=history_list,
+            req=req, vap=vap, llms=llms, user_dni=user_dni, history_list=history_list,
             active_contexts=active_contexts, all_allowed_contexts=all_allowed_contexts, db=db,
             vector_store=vector_store, app_state=app_state, redis_client=redis_client
         )
@@ -698,108 +764,229 @@ async def route_request(
     # Si estamos a mitad de una conversación multi-turno con una herramienta, se continúa ese flujo.
     if current_state == CONV_STATE_AWAITING_TOOL_PARAMS:
         print("ROUTE_LOGIC: Estado 'AWAITING_TOOL_PARAMS' detectado. Llamando a handle_tool_clarification.")
-        return await handle_tool_clarification(req, conversation_state, llm, history_list, active_contexts)
+        return await handle_tool_clarification(req, conversation_state, llms, history_list, active_contexts)
     
     # --- REGLA 4: Pregunta nueva por defecto. [LÓGICA INTACTA] ---
     # Si ninguna de las condiciones anteriores se cumple, es una pregunta estándar.
     print("ROUTE_LOGIC: No hay estado de conversación activo. Enrutando como nueva pregunta.")
-    return await handle_new_question(
-        req=req, user_dni=user_dni, llm=llm, history_list=history_list, active_contexts=active_contexts,
+    routing_log: Dict[str, Any] = {}
+    result = await handle_new_question(
+        req=req, user_dni=user_dni, llms=llms, history_list=history_list, active_contexts=active_contexts,
         all_allowed_contexts=all_allowed_contexts, vap=vap, db=db, vector_store=vector_store,
-        app_state=app_state, redis_client=redis_client
+        app_state=app_state, redis_client=redis_client, on_token=on_token, routing_log=routing_log
     )
+    # La decisión del enrutador viaja en los metadatos y queda en el log de interacción,
+    # para medir la precisión del enrutador por embeddings frente al LLM.
+    if routing_log:
+        result["metadata"] = {**(result.get("metadata") or {}), "routing": routing_log}
+    return result
+# --- Caché de Respuestas (L1 en memoria + Redis) ---
+
+def _is_response_cacheable_turn(
+    req: ChatRequest, conversation_state: Dict, history_list: List,
+    vap: VirtualAgentProfile, redis_client: Optional[AsyncRedis]
+) -> bool:
+    """
+    Solo los turnos 'sin estado' pueden consultar o poblar la caché de respuestas:
+    nada de saludo inicial, ni captura de nombre, ni clarificaciones de herramientas.
+    """
+    if not settings.RESPONSE_CACHE_ENABLED or req.message == "__INICIAR_CHAT__":
+        return False
+    if conversation_state.get("state_name"):
+        return False
+    if len(history_list) == 1 and redis_client is None and vap.name_confirmation_prompt:
+        return False
+    return True
+
+def _is_history_independent_question(req: ChatRequest, history_list: List) -> bool:
+    """
+    La respuesta RAG depende de la conversación (condensación y `chat_history` del prompt), pero la
+    clave exacta solo lleva la pregunta: se comparte únicamente si no hay historial útil o si la
+    pregunta se vale por sí sola (el condensador no la reescribiría).
+    """
+    rag_history = get_history_window(history_list, settings.CHAT_HISTORY_WINDOW_SIZE_RAG)
+    usable_history = question_condenser_service.get_usable_history(rag_history)
+    should_condense, _ = question_condenser_service.needs_condensation(req.message, usable_history)
+    return not should_condense
+
+def _is_response_cacheable_result(req: ChatRequest, handler_result: Dict[str, Any]) -> bool:
+    """Decide si el resultado de un turno puede compartirse con otros usuarios del mismo cliente."""
+    intent = (handler_result.get("log") or {}).get("intent")
+    if intent not in RESPONSE_CACHEABLE_INTENTS or handler_result.get("next_state"):
+        return False
+    response_text = handler_result.get("response") or ""
+    # Una respuesta personalizada con el nombre del usuario no se debe servir a otros.
+    if req.user_name and req.user_name.strip() and req.user_name.strip().lower() in response_text.lower():
+        return False
+    return True
+
+def _to_shared_response(req: ChatRequest, handler_result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Parte del resultado que se puede compartir (caché o single-flight): nunca el estado de sesión."""
+    if not _is_response_cacheable_result(req, handler_result):
+        return None
+    return {
+        "bot_response": handler_result.get("response"),
+        "metadata_details_json": dict(handler_result.get("metadata") or {}),
+        "intent": (handler_result.get("log") or {}).get("intent")
+    }
+
+def _handler_result_from_shared(shared_response: Dict[str, Any], origin_flag: str) -> Dict[str, Any]:
+    """Reconstruye un resultado de handler a partir de una respuesta compartida, sin estado que guardar."""
+    shared_metadata = dict(shared_response.get("metadata_details_json") or {})
+    shared_metadata[origin_flag] = True
+    return {
+        "response": shared_response.get("bot_response"),
+        "metadata": shared_metadata,
+        "log": {"intent": shared_response.get("intent")},
+        "next_state": None, "next_params": None
+    }
+
 # ==========================================================
 # ======>   EL ENDPOINT FINAL (UNIFICADO Y ROBUSTO)      <======
 # ==========================================================
 
-@router.post("/api/v1/chat/", response_model=ChatResponse)
-async def process_chat_message(
+# --- Prólogo del turno: configuración (Postgres) y estado de sesión (Redis) ---
+
+async def _load_turn_configuration(
+    app_state: AppState, client: ApiClientModel, req: ChatRequest
+) -> Tuple[List[ContextDefinition], List[ContextDefinition], VirtualAgentProfile, Dict[str, Any]]:
+    """
+    Devuelve contextos, perfil de agente y, por paso del pipeline, configuración LLM (con sus respaldos),
+    temperatura y max_tokens desde la configuración compilada del cliente API: en caliente no hace
+    ninguna consulta a la BD.
+    """
+    with stage_timer("config_load"):
+        compiled = await tenant_config_service.get_compiled_tenant_config(app_state.AsyncCrudSessionLocal, client)
+    try:
+        view = compiled.view_for(bool(req.is_authenticated_user))
+    except tenant_config_service.TenantConfigError as e:
+        raise HTTPException(e.status_code, e.detail)
+    return list(compiled.all_allowed_contexts), list(view.active_contexts), view.vap, view.step_llms
+
+async def _load_session_state(
+    history: FullyCustomChatMessageHistory, redis_client: Optional[AsyncRedis], session_id: str
+) -> Tuple[List, Dict[str, Any]]:
+    """Lee historial y estado de conversación de Redis en paralelo."""
+    with stage_timer("session_load"):
+        history_list, conversation_state = await asyncio.gather(
+            history.get_messages_async(max_messages=HISTORY_FETCH_WINDOW),
+            get_conversation_state_async(redis_client, session_id)
+        )
+    return history_list, conversation_state
+
+async def _run_chat_turn(
     req: ChatRequest,
-    # --- Inyección de Dependencias Completa ---
-    client: ApiClientModel = Depends(get_validated_api_client),
-    db: AsyncSession = Depends(get_crud_db),
-    app_state: AppState = Depends(get_app_state),
-    redis_client: Optional[AsyncRedis] = Depends(get_redis_client),
-    vector_store: PGVector = Depends(get_vector_store)
-):
+    client: ApiClientModel,
+    db: AsyncSession,
+    app_state: AppState,
+    redis_client: Optional[AsyncRedis],
+    vector_store: PGVector,
+    on_token: Optional[TokenCallback] = None
+) -> ChatResponse:
+    """
+    Ejecuta un turno completo de chat: carga de dependencias, enrutado, estado,
+    log de interacción e historial. Compartido por el endpoint normal y el de streaming.
+    """
     start_time, question, s_id = time.time(), req.message, req.session_id
     log: Dict[str, Any] = {"user_dni": req.user_dni or s_id, "api_client_name": client.name, "user_message": question}
     history = FullyCustomChatMessageHistory(s_id, redis_client=redis_client)
     final_bot_response, metadata_response = "Lo siento, ha ocurrido un error.", {}
+    # Incluye la etapa 'auth' si la dependencia de autenticación ya la midió en esta petición.
+    stage_timings = metrics_service.start_turn_timings()
 
     try:
         # --- 1. CARGA DE DEPENDENCIAS ---
-        api_client_settings = client.settings or {}
-        allowed_ctx_ids = api_client_settings.get("allowed_context_ids", [])
-        if not allowed_ctx_ids: raise HTTPException(403, "API Key sin contextos.")
-
-        stmt_base = select(ContextDefinition).where(ContextDefinition.id.in_(allowed_ctx_ids), ContextDefinition.is_active == True)
-        all_allowed_contexts_stmt = stmt_base.options(selectinload(ContextDefinition.db_connection_config))
-        all_allowed_contexts = (await db.execute(all_allowed_contexts_stmt)).scalars().unique().all()
-
-        if req.is_authenticated_user:
-            active_contexts = all_allowed_contexts
-        else:
-            active_contexts = [c for c in all_allowed_contexts if c.is_public]
-
-        if not active_contexts: raise HTTPException(404, "No hay contextos válidos para esta solicitud.")
-
-        
-
-        
-            
-        vap_id = api_client_settings.get("default_virtual_agent_profile_id_override") or active_contexts[0].virtual_agent_profile_id
-        vap = await crud_virtual_agent_profile.get_fully_loaded_profile(db, vap_id)
-        llm_cfg_id = (api_client_settings.get("default_llm_model_config_id_override") or vap.llm_model_config_id or active_contexts[0].default_llm_model_config_id)
-        llm_config = await crud_llm_model_config.get_llm_model_config_by_id(db, llm_cfg_id)
-        if not llm_config: raise HTTPException(404, "Configuración LLM no encontrada.")
-        
-        # === ¡AQUÍ ESTÁ LA NUEVA LÓGICA DE DECISIÓN! ===
-        final_temperature = 0.3 # Valor de fallback por si todo falla
-
-        # 1. Empezamos con la temperatura por defecto del MODELO
-        if llm_config.default_temperature is not None:
-            final_temperature = llm_config.default_temperature
-            print(f"TEMPERATURE_LOGIC: Usando temp. del modelo: {final_temperature}")
-
-        # 2. Si el AGENTE tiene un override, ESTE GANA.
-        #    (Asegúrate de que tu tabla `virtual_agent_profiles` tenga la columna `temperature_override`)
-        if hasattr(vap, 'temperature_override') and vap.temperature_override is not None:
-            final_temperature = vap.temperature_override
-            print(f"TEMPERATURE_LOGIC: ¡OVERRIDE! Usando temp. del agente: {final_temperature}")
-
-        # 3. Llamamos a get_cached_llm con la temperatura final decidida.
-        llm = await app_state.get_cached_llm(
-            model_config=llm_config,
-            temperature_to_use=final_temperature
+        # La configuración (compilada por cliente) y el estado de la sesión (Redis) son independientes:
+        # se cargan en paralelo para que el prólogo cueste un solo "viaje" en lugar de cinco.
+        prologue_start = time.perf_counter()
+        (all_allowed_contexts, active_contexts, vap, step_llms), (history_list, conversation_state) = await asyncio.gather(
+            _load_turn_configuration(app_state, client, req),
+            _load_session_state(history, redis_client, s_id)
         )
-        # Corrección 1: Llamada al método de caché de LLM en AppState        
-        # Corrección 4: Llamada al método async de historial
-        history_list = await history.get_messages_async()
-        log["llm_model_used"] = llm_config.display_name
-
-        # --- 2. RECUPERAR ESTADO Y DELEGAR AL ENRUTADOR ---
-        conversation_state = await get_conversation_state_async(redis_client, s_id)
+        print(f"PERF: Prólogo del turno cargado en {(time.perf_counter() - prologue_start) * 1000:.1f} ms.")
         
+        # LLM por paso (enrutado, extracción, condensación, respuesta); la temperatura (modelo, o override
+        # del agente) ya viene resuelta en la configuración compilada. Los adaptadores salen de la caché.
+        print(f"TEMPERATURE_LOGIC: Usando temperatura {step_llms['answer'].temperature}.")
+        with stage_timer("llm_client"):
+            step_adapters = {
+                step: await app_state.get_cached_llm(
+                    model_config=step_llm.llm_config,
+                    temperature_to_use=step_llm.temperature,
+                    max_tokens_override=step_llm.max_tokens_override,
+                    fallback_configs=step_llm.fallback_llm_configs,
+                    step=step
+                )
+                for step, step_llm in step_llms.items()
+            }
+        llms = TurnLLMs(**step_adapters)
+        log["llm_model_used"] = step_llms["answer"].llm_config.display_name
+
+        # --- 2. DELEGAR AL ENRUTADOR (el estado ya se recuperó en el prólogo) ---
         if conversation_state.get("user_name"):
             req.user_name = conversation_state["user_name"]
             print(f"SESSION_LOGIC: Nombre '{req.user_name}' recuperado de Redis para la sesión {s_id}.")
 
-        handler_result = await route_request(
-            req=req,
-            user_dni=req.user_dni, 
-            conversation_state=conversation_state, 
-            llm=llm, 
-            history_list=history_list,
-            active_contexts=active_contexts, 
-            all_allowed_contexts=all_allowed_contexts,
-            vap=vap, 
-            db=db,
-            redis_client=redis_client, 
-            vector_store=vector_store, 
-            app_state=app_state
-
+        # La clave usa los contextos ACTIVOS: así una respuesta de un contexto privado
+        # nunca se sirve a un usuario no autenticado.
+        active_ctx_ids = [c.id for c in active_contexts]
+        # Un seguimiento ("¿y cuándo vence?") depende del historial de ESTA sesión: ni se lee/escribe
+        # en la caché ni se une a una petición en vuelo de otra sesión.
+        is_shareable_turn = (
+            _is_response_cacheable_turn(req, conversation_state, history_list, vap, redis_client)
+            and _is_history_independent_question(req, history_list)
         )
+        cached_response = None
+        if is_shareable_turn:
+            with stage_timer("response_cache"):
+                # Agente y versión de ingesta de cada contexto: editar o re-ingestar cambia la clave.
+                cache_scope = await cache_service.get_response_cache_scope_async(redis_client, vap, active_ctx_ids)
+                cached_response = await cache_service.get_cached_response_async(
+                    redis_client, client.id, active_ctx_ids, question, cache_scope
+                )
+
+        if cached_response:
+            handler_result = _handler_result_from_shared(cached_response, "response_cache_hit")
+        else:
+            async def _compute_turn() -> Dict[str, Any]:
+                # Solo el trabajo que llama al LLM pasa por el control de admisión (cola acotada con plazo).
+                async with admission_controller.admit(client.id, getattr(client, "parsed_settings_object", None)):
+                    with stage_timer("route"):
+                        return await route_request(
+                            req=req,
+                            user_dni=req.user_dni, 
+                            conversation_state=conversation_state, 
+                            llms=llms, 
+                            history_list=history_list,
+                            active_contexts=active_contexts, 
+                            all_allowed_contexts=all_allowed_contexts,
+                            vap=vap, 
+                            db=db,
+                            redis_client=redis_client, 
+                            vector_store=vector_store, 
+                            app_state=app_state,
+                            on_token=on_token
+                        )
+
+            if is_shareable_turn:
+                # Preguntas idénticas en vuelo: solo una recorre la tubería; las demás reciben su respuesta.
+                flight_key = cache_service.get_response_cache_key(client.id, active_ctx_ids, question, cache_scope)
+                own_result, shared_result = await single_flight_service.run_single_flight(
+                    redis_client, flight_key, _compute_turn,
+                    lambda result: _to_shared_response(req, result)
+                )
+                if shared_result is not None:
+                    handler_result = _handler_result_from_shared(shared_result, "single_flight_shared")
+                else:
+                    handler_result = own_result
+                    shareable_response = _to_shared_response(req, handler_result)
+                    if shareable_response is not None:
+                        with stage_timer("response_cache"):
+                            await cache_service.set_cached_response_async(
+                                redis_client, client.id, active_ctx_ids, question, cache_scope, shareable_response
+                            )
+            else:
+                handler_result = await _compute_turn()
         
         # --- 3. PROCESAR RESULTADO Y GESTIONAR ESTADO ---
         final_bot_response = handler_result.get("response")
@@ -807,14 +994,26 @@ async def process_chat_message(
         log.update(handler_result.get("log", {}))
         
         # Corrección 2: Llamada a la función de guardado con todos sus parámetros
-        await save_conversation_state_async(
-            redis_client, s_id, handler_result.get("next_state"), handler_result.get("next_params")
-        )
+        with stage_timer("state_save"):
+            await save_conversation_state_async(
+                redis_client, s_id, handler_result.get("next_state"), handler_result.get("next_params")
+            )
 
     except AuthRequiredError as auth_exc:
         log.update(auth_exc.payload)
         final_bot_response = log.get("bot_response")
         metadata_response = log.get("metadata_details_json", {})
+
+    except AdmissionRejected as busy_exc:
+        # Rechazo rápido (429): no se llega al LLM ni se toca el estado de la sesión.
+        log["error_message"] = f"ServerBusy: {busy_exc.reason}"
+        final_bot_response = "En este momento hay muchas consultas. Por favor, inténtalo de nuevo en unos segundos."
+        metadata_response = {"error_type": "ServerBusy", "retry_after_seconds": busy_exc.retry_after_seconds}
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=final_bot_response,
+            headers={"Retry-After": str(busy_exc.retry_after_seconds)}
+        )
     
     except Exception as e:
         traceback.print_exc()
@@ -834,19 +1033,116 @@ async def process_chat_message(
         try:
             log_to_save = log.copy()
             log_to_save["metadata_details_json"] = json.dumps(metadata_response, default=str)
+            # Copia: la etapa 'persist' de abajo no puede formar parte del propio log.
+            log_to_save["stage_timings_ms"] = dict(stage_timings)
             
-            await create_interaction_log_async(db, log_to_save)
-            
-            if "error_message" not in log:
-                await history.add_messages_async([HumanMessage(content=question), AIMessage(content=final_bot_response)])
+            with stage_timer("persist"):
+                log_writer = app_state.interaction_log_writer
+                if log_writer:
+                    await log_writer.submit(log_to_save)
+                else:
+                    await create_interaction_log_async(db, log_to_save)
+                
+                if "error_message" not in log:
+                    await history.add_messages_async([HumanMessage(content=question), AIMessage(content=final_bot_response)])
 
         except Exception as final_e:
             print(f"CRITICAL: Fallo al guardar log/historial en 'finally': {final_e}")
             traceback.print_exc()
 
+        metrics_service.observe_chat_turn(stage_timings, log["response_time_ms"], log.get("intent"))
+
     return ChatResponse(
         session_id=s_id,
         original_message=question,
         bot_response=final_bot_response.strip() if final_bot_response else "No se pudo generar una respuesta.",
         metadata_details_json=metadata_response
+    )
+
+
+@router.post("/api/v1/chat/", response_model=ChatResponse)
+async def process_chat_message(
+    req: ChatRequest,
+    # --- Inyección de Dependencias Completa ---
+    client: ApiClientModel = Depends(get_validated_api_client),
+    db: AsyncSession = Depends(get_crud_db),
+    app_state: AppState = Depends(get_app_state),
+    redis_client: Optional[AsyncRedis] = Depends(get_redis_client),
+    vector_store: PGVector = Depends(get_vector_store)
+):
+    return await _run_chat_turn(req, client, db, app_state, redis_client, vector_store)
+
+
+# ==========================================================
+# ======>      VARIANTE EN STREAMING (SERVER-SENT EVENTS) <======
+# ==========================================================
+
+# Referencias fuertes a los turnos en curso para que el GC no los cancele si el cliente se desconecta.
+_background_chat_turns: set = set()
+
+def _format_sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@router.post("/api/v1/chat/stream")
+async def stream_chat_message(
+    req: ChatRequest,
+    client: ApiClientModel = Depends(get_validated_api_client),
+    app_state: AppState = Depends(get_app_state),
+    redis_client: Optional[AsyncRedis] = Depends(get_redis_client),
+    vector_store: PGVector = Depends(get_vector_store)
+):
+    """
+    Igual que `/api/v1/chat/` pero emite la respuesta como SSE:
+    - `token`: fragmentos de texto a medida que el LLM los genera.
+    - `end`: el `ChatResponse` completo (intención, fuentes, etc.) al terminar.
+    El log de interacción y el historial se escriben cuando el turno termina.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def _on_token(token: str) -> None:
+        if token:
+            await queue.put(("token", token))
+
+    async def _run_turn_in_background() -> None:
+        # La sesión se abre aquí y no vía Depends: las dependencias con `yield` se
+        # cierran antes de que termine de enviarse un StreamingResponse.
+        try:
+            async with app_state.AsyncCrudSessionLocal() as db:
+                chat_response = await _run_chat_turn(req, client, db, app_state, redis_client, vector_store, on_token=_on_token)
+            await queue.put(("end", chat_response))
+        except HTTPException as e:
+            await queue.put(("error", e.detail))
+        except Exception as e:
+            traceback.print_exc()
+            await queue.put(("error", f"{e.__class__.__name__}: {e}"))
+
+    async def _event_generator():
+        turn_task = asyncio.create_task(_run_turn_in_background())
+        _background_chat_turns.add(turn_task)
+        turn_task.add_done_callback(_background_chat_turns.discard)
+        tokens_sent = False
+        try:
+            while True:
+                kind, payload = await queue.get()
+                if kind == "token":
+                    tokens_sent = True
+                    yield _format_sse_event("token", {"text": payload})
+                elif kind == "end":
+                    # Respuestas que no pasan por el LLM en streaming (saludo, SQL, caché...) se envían en un solo bloque.
+                    if not tokens_sent and payload.bot_response:
+                        yield _format_sse_event("token", {"text": payload.bot_response})
+                    yield _format_sse_event("end", payload.model_dump())
+                    break
+                else:
+                    yield _format_sse_event("error", {"detail": payload})
+                    break
+        finally:
+            # Si el cliente se desconecta, el turno termina igualmente para dejar log e historial consistentes.
+            if not turn_task.done():
+                print(f"CHAT_STREAM: Cliente desconectado en la sesión {req.session_id}; el turno continúa en segundo plano.")
+
+    return StreamingResponse(
+        _event_generator(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
\ No newline at end of file
@@ -4,11 +4,14 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 import json
+from redis.asyncio import Redis as AsyncRedis
 
 # --- Importaciones clave para la depuración ---
 from pydantic import ValidationError
 
 from app.db.session import get_crud_db_session
+from app.api.dependencies import get_redis_client
+from app.services import semantic_cache_service, tenant_config_service
 from app.schemas.schemas import (
     ContextDefinitionCreate,
     ContextDefinitionUpdate,
@@ -146,6 +149,7 @@ async def update_existing_context_definition_endpoint(
     context_id: int,
     context_update_in: ContextDefinitionUpdate,
     db: AsyncSession = Depends(get_crud_db_session),
+    redis_client: Optional[AsyncRedis] = Depends(get_redis_client),
     current_user: AppUser = Depends(require_roles(ROLES_MANAGE_CONTEXTS))
 ):
     print(f"CONTEXT_DEF_API (Update): Admin '{current_user.username_ad}' actualizando contexto ID: {context_id}")
@@ -164,6 +168,8 @@ async def update_existing_context_definition_endpoint(
         updated_context_obj = await crud_context_definition.update_context_definition(
             db=db, db_context_orm_obj=db_context, context_in=context_update_in
         )
+        await semantic_cache_service.bump_ingest_version_async(redis_client, context_id)
+        await tenant_config_service.publish_invalidation_async(redis_client)
         return updated_context_obj
     except ValueError as ve:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(ve))
@@ -176,6 +182,7 @@ async def update_existing_context_definition_endpoint(
 async def delete_context_definition_endpoint(
     context_id: int,
     db: AsyncSession = Depends(get_crud_db_session),
+    redis_client: Optional[AsyncRedis] = Depends(get_redis_client),
     current_user: AppUser = Depends(require_roles(ROLES_MANAGE_CONTEXTS))
 ):
     print(f"CONTEXT_DEF_API (Delete): Admin '{current_user.username_ad}' eliminando contexto ID: {context_id}")
@@ -183,4 +190,6 @@ async def delete_context_definition_endpoint(
     deleted_context = await crud_context_definition.delete_context_definition(db=db, context_id=context_id)
     if deleted_context is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Definición de Contexto no encontrada para eliminar.")
+    await semantic_cache_service.bump_ingest_version_async(redis_client, context_id)
+    await tenant_config_service.publish_invalidation_async(redis_client)
     return None
\ No newline at end of file
@@ -1,12 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
+from redis.asyncio import Redis as AsyncRedis
 
 from app.db.session import get_crud_db_session
 from app.schemas.schemas import LLMModelConfigCreate, LLMModelConfigUpdate, LLMModelConfigResponse
 from app.crud import crud_llm_model_config
 from app.models.app_user import AppUser
 from app.security.role_auth import require_roles
+from app.api.dependencies import get_redis_client
+from app.services import tenant_config_service
 
 router = APIRouter(prefix="/api/v1/admin/llm-models", tags=["Admin - LLM Models"])
 
@@ -46,18 +49,22 @@ async def read_llm_model_config_by_id(model_id: int, db: AsyncSession = Depends(
     return response
 
 @router.put("/{model_id}", response_model=LLMModelConfigResponse)
-async def update_existing_llm_model_config(model_id: int, model_in: LLMModelConfigUpdate, db: AsyncSession = Depends(get_crud_db_session), current_user: AppUser = Depends(require_roles(ROLES_CAN_MANAGE_LLM_CONFIGS))):
+async def update_existing_llm_model_config(model_id: int, model_in: LLMModelConfigUpdate, db: AsyncSession = Depends(get_crud_db_session), redis_client: Optional[AsyncRedis] = Depends(get_redis_client), current_user: AppUser = Depends(require_roles(ROLES_CAN_MANAGE_LLM_CONFIGS))):
     db_model = await crud_llm_model_config.get_llm_model_config_by_id(db, model_id=model_id)
     if not db_model:
         raise HTTPException(status_code=404, detail="Configuración a actualizar no encontrada.")
+    if model_in.fallback_config_ids and model_id in model_in.fallback_config_ids:
+        raise HTTPException(status_code=400, detail="Una configuración no puede ser su propio respaldo.")
     updated_model_db = await crud_llm_model_config.update_llm_model_config(db=db, db_model=db_model, model_in=model_in)
+    await tenant_config_service.publish_invalidation_async(redis_client)
     response = LLMModelConfigResponse.model_validate(updated_model_db)
     response.has_api_key = bool(updated_model_db.api_key_encrypted)
     return response
 
 @router.delete("/{model_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_llm_model_configuration(model_id: int, db: AsyncSession = Depends(get_crud_db_session), current_user: AppUser = Depends(require_roles(ROLES_CAN_MANAGE_LLM_CONFIGS))):
+async def delete_llm_model_configuration(model_id: int, db: AsyncSession = Depends(get_crud_db_session), redis_client: Optional[AsyncRedis] = Depends(get_redis_client), current_user: AppUser = Depends(require_roles(ROLES_CAN_MANAGE_LLM_CONFIGS))):
     success = await crud_llm_model_config.delete_llm_model_config(db, model_id=model_id)
     if not success:
         raise HTTPException(status_code=404, detail="Configuración no encontrada para eliminar.")
+    await tenant_config_service.publish_invalidation_async(redis_client)
     return None
\ No newline at end of file
@@ -1,9 +1,11 @@
 # app/api/endpoints/virtual_agent_profile_endpoints.py
 
-from fastapi import APIRouter, Depends, HTTPException, status
+import traceback
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from app.services import prompt_generator_service
+from redis.asyncio import Redis as AsyncRedis
+from app.services import prompt_generator_service, farewell_service
 
 from app.db.session import get_crud_db_session
 from app.schemas.schemas import (
@@ -16,6 +18,9 @@ from app.schemas.schemas import (
 from app.crud import crud_virtual_agent_profile, crud_llm_model_config
 from app.models.app_user import AppUser
 from app.security.role_auth import require_roles
+from app.api.dependencies import get_redis_client, get_app_state
+from app.core.app_state import AppState
+from app.services import tenant_config_service
 
 # Definimos el prefijo para todo el router.
 router = APIRouter(
@@ -74,6 +79,7 @@ async def update_existing_virtual_agent_profile(
     profile_id: int,
     profile_in: VirtualAgentProfileUpdate,
     db: AsyncSession = Depends(get_crud_db_session),
+    redis_client: Optional[AsyncRedis] = Depends(get_redis_client),
     current_user: AppUser = Depends(require_roles(ROLES_CAN_MANAGE_VAPS)),
 ):
     db_profile = await crud_virtual_agent_profile.get_virtual_agent_profile_by_id(db, profile_id=profile_id)
@@ -82,20 +88,73 @@ async def update_existing_virtual_agent_profile(
     
     # Aquí puedes añadir la lógica de validación para el nombre, llm_model_config_id, etc.
     
-    return await crud_virtual_agent_profile.update_virtual_agent_profile(db=db, db_profile=db_profile, profile_in=profile_in)
+    updated_profile = await crud_virtual_agent_profile.update_virtual_agent_profile(db=db, db_profile=db_profile, profile_in=profile_in)
+    await tenant_config_service.publish_invalidation_async(redis_client)
+    return updated_profile
 
 
 @router.delete("/{profile_id}", status_code=status.HTTP_204_NO_CONTENT, summary="Delete Virtual Agent Profile")
 async def delete_virtual_agent_profile_entry( 
     profile_id: int,
     db: AsyncSession = Depends(get_crud_db_session),
+    redis_client: Optional[AsyncRedis] = Depends(get_redis_client),
     current_user: AppUser = Depends(require_roles(ROLES_CAN_MANAGE_VAPS)),
 ):
     deleted_profile = await crud_virtual_agent_profile.delete_virtual_agent_profile(db, profile_id=profile_id)
     if not deleted_profile:
         raise HTTPException(status_code=404, detail="Perfil de Agente Virtual no encontrado para eliminar.")
+    await tenant_config_service.publish_invalidation_async(redis_client)
     return None
 
+@router.post(
+    "/{profile_id}/farewell-templates/generate",
+    response_model=VirtualAgentProfileResponse,
+    summary="[IA] Precalcula Variantes de Despedida para un Agente"
+)
+async def generate_farewell_templates_endpoint(
+    profile_id: int,
+    count: int = Query(5, ge=1, le=10),
+    db: AsyncSession = Depends(get_crud_db_session),
+    redis_client: Optional[AsyncRedis] = Depends(get_redis_client),
+    app_state: AppState = Depends(get_app_state),
+    current_user: AppUser = Depends(require_roles(ROLES_CAN_MANAGE_VAPS)),
+):
+    """
+    Genera con el LLM del agente variantes de despedida (con y sin `{user_name}`) y las
+    guarda en `farewell_templates_json`. El chat las rota sin volver a llamar al LLM.
+    """
+    db_profile = await crud_virtual_agent_profile.get_virtual_agent_profile_by_id(db, profile_id=profile_id, load_relations=True)
+    if not db_profile:
+        raise HTTPException(status_code=404, detail="Perfil de Agente Virtual no encontrado.")
+    if not db_profile.llm_model_config:
+        raise HTTPException(status_code=400, detail="El perfil no tiene un LLMModelConfig asociado.")
+
+    try:
+        # Temperatura alta a propósito: se buscan variantes distintas entre sí.
+        llm = await app_state.get_cached_llm(model_config=db_profile.llm_model_config, temperature_to_use=0.9)
+        variants = await farewell_service.generate_farewell_variants_async(llm, db_profile, count)
+    except Exception as e:
+        print(f"ERROR INESPERADO en generate_farewell_templates_endpoint: {e}")
+        traceback.print_exc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Error al generar las despedidas con el LLM del agente."
+        )
+
+    # Si el LLM no devolvió variantes válidas para un tipo, se conservan las que ya había.
+    templates = dict(db_profile.farewell_templates_json or {})
+    for key, values in variants.items():
+        if values:
+            templates[key] = values
+    if not any(variants.values()):
+        raise HTTPException(status_code=502, detail="El LLM no devolvió despedidas válidas.")
+
+    updated_profile = await crud_virtual_agent_profile.update_virtual_agent_profile(
+        db=db, db_profile=db_profile, profile_in=VirtualAgentProfileUpdate(farewell_templates_json=templates)
+    )
+    await tenant_config_service.publish_invalidation_async(redis_client)
+    return updated_profile
+
 # --- ENDPOINT DEL ASISTENTE IA ---
 
 @router.post(
@@ -1,6 +1,6 @@
 # app/config.py
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import Optional, List, Any
+from typing import Optional, List, Any, Dict
 from dotenv import load_dotenv
 import os
 
@@ -40,6 +40,117 @@ class Settings(BaseSettings):
 
     # Tiempo de expiración para las entradas del caché en segundos (1 hora por defecto).
     CACHE_EXPIRATION_SECONDS: int = 3600
+
+    # Caché de respuestas del chat: L1 en memoria (por proceso) delante de Redis (L2).
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_L1_MAX_ENTRIES: int = 1000
+    RESPONSE_CACHE_L1_TTL_SECONDS: int = 300
+
+    # Caché semántica de respuestas RAG (similitud coseno sobre la pregunta independiente).
+    SEMANTIC_CACHE_ENABLED: bool = True
+    SEMANTIC_CACHE_SIMILARITY_THRESHOLD: float = 0.92
+    SEMANTIC_CACHE_MAX_ENTRIES_PER_CONTEXT: int = 500
+    SEMANTIC_CACHE_TTL_SECONDS: int = 3600
+
+    # Configuración compilada por cliente API (contextos, VAP, LLM). Se invalida por pub/sub;
+    # el TTL es solo una red de seguridad por si se pierde un mensaje.
+    TENANT_CONFIG_TTL_SECONDS: int = 600
+
+    # Caché de API keys validadas (por hash). Las claves inválidas se cachean menos tiempo.
+    API_KEY_CACHE_MAX_ENTRIES: int = 1000
+    API_KEY_CACHE_TTL_SECONDS: int = 300
+    API_KEY_NEGATIVE_CACHE_TTL_SECONDS: int = 30
+
+    # Enrutador de intención por embeddings (sustituye la llamada al LLM del master_router_agent).
+    # Si el margen entre las dos mejores clases es menor que INTENT_ROUTER_MIN_MARGIN, se consulta al LLM.
+    # En modo sombra se usa siempre el LLM y solo se registra la decisión del enrutador local.
+    INTENT_ROUTER_ENABLED: bool = True
+    INTENT_ROUTER_MIN_MARGIN: float = 0.08
+    INTENT_ROUTER_SHADOW_MODE: bool = False
+
+    # Condensación de la pregunta (RAG): se omite la llamada al LLM si no hay historial útil
+    # o si la pregunta no hace referencia a turnos anteriores.
+    CONDENSE_MIN_STANDALONE_WORDS: int = 4
+    CONDENSE_CACHE_MAX_ENTRIES: int = 2000
+    CONDENSE_CACHE_TTL_SECONDS: int = 900
+
+    # Escritura de logs de interacción en segundo plano (cola acotada + INSERT multi-fila por lotes).
+    # Política de desbordamiento: "drop_newest" | "drop_oldest" | "block" (espera hasta
+    # INTERACTION_LOG_BLOCK_TIMEOUT_SECONDS y, si sigue llena, descarta el log).
+    INTERACTION_LOG_ASYNC_ENABLED: bool = True
+    INTERACTION_LOG_QUEUE_MAX_SIZE: int = 5000
+    INTERACTION_LOG_BATCH_SIZE: int = 100
+    INTERACTION_LOG_FLUSH_INTERVAL_SECONDS: float = 1.0
+    INTERACTION_LOG_OVERFLOW_POLICY: str = "drop_oldest"
+    INTERACTION_LOG_BLOCK_TIMEOUT_SECONDS: float = 0.5
+    INTERACTION_LOG_SHUTDOWN_TIMEOUT_SECONDS: float = 10.0
+
+    # Estado de conversación en un hash de Redis por sesión (ver conversation_state_service).
+    # La migración lee también las claves antiguas (conv:*, message_store:*) si el hash no existe.
+    CONVERSATION_STATE_TTL_SECONDS: int = 300
+    CONVERSATION_USER_NAME_TTL_SECONDS: int = 180
+    SESSION_LEGACY_KEYS_MIGRATION_ENABLED: bool = True
+
+    # Registro de cadenas LangChain precompiladas por (cadena, VAP, adaptador LLM) con expulsión LRU.
+    PROMPT_REGISTRY_MAX_ENTRIES: int = 512
+    PROMPT_REGISTRY_TTL_SECONDS: int = 24 * 3600
+
+    # Saludo inicial (__INICIAR_CHAT__) servido desde un pool de variantes pregeneradas por agente.
+    GREETING_CACHE_ENABLED: bool = True
+    GREETING_POOL_SIZE: int = 5
+    GREETING_POOL_TTL_SECONDS: int = 7 * 24 * 3600
+    GREETING_POOL_REFRESH_SECONDS: int = 24 * 3600
+    GREETING_POOL_L1_TTL_SECONDS: int = 300
+
+    # Coalescencia (single-flight) de preguntas idénticas sin estado: una sola petición calcula,
+    # las demás (del mismo worker o de otros, vía lock + clave de resultado en Redis) esperan su respuesta.
+    SINGLE_FLIGHT_ENABLED: bool = True
+    SINGLE_FLIGHT_LOCK_TTL_SECONDS: int = 60
+    SINGLE_FLIGHT_RESULT_TTL_SECONDS: int = 30
+    SINGLE_FLIGHT_WAIT_TIMEOUT_SECONDS: float = 30.0
+    SINGLE_FLIGHT_POLL_INTERVAL_SECONDS: float = 0.1
+
+    # Control de admisión delante del trabajo que llama al LLM: límites de concurrencia global y
+    # por cliente API (sus settings pueden sobrescribir los valores por defecto), con cola acotada y plazo.
+    ADMISSION_CONTROL_ENABLED: bool = True
+    ADMISSION_GLOBAL_MAX_CONCURRENCY: int = 32
+    ADMISSION_GLOBAL_MAX_QUEUE: int = 128
+    ADMISSION_DEFAULT_CLIENT_MAX_CONCURRENCY: int = 8
+    ADMISSION_DEFAULT_CLIENT_MAX_QUEUE: int = 32
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 10.0
+
+    # Hilos dedicados a las llamadas síncronas de boto3 (Bedrock), fuera del executor por defecto del loop.
+    BEDROCK_EXECUTOR_MAX_WORKERS: int = 16
+
+    # Adaptadores LLM (LangChain) en una LRU por (config id, updated_at, temperatura, max_tokens).
+    LLM_ADAPTER_CACHE_MAX_ENTRIES: int = 64
+    LLM_ADAPTER_CACHE_TTL_SECONDS: int = 24 * 3600
+    LLM_ADAPTER_PREWARM_ENABLED: bool = True
+
+    # Circuit breaker por LLMModelConfig (ventana deslizante de errores y latencia) y failover
+    # a sus `fallback_config_ids`. La apertura se comparte entre workers por Redis.
+    LLM_CIRCUIT_BREAKER_ENABLED: bool = True
+    LLM_BREAKER_WINDOW_SECONDS: int = 60
+    LLM_BREAKER_MIN_CALLS: int = 5
+    LLM_BREAKER_ERROR_RATE_THRESHOLD: float = 0.5
+    LLM_BREAKER_SLOW_CALL_MS: float = 20000
+    LLM_BREAKER_SLOW_CALL_RATE_THRESHOLD: float = 0.8
+    LLM_BREAKER_OPEN_SECONDS: int = 30
+    LLM_BREAKER_REDIS_SYNC_SECONDS: float = 1.0
+
+    # Memoización de sub-llamadas deterministas (enrutador, clasificador, extracciones).
+    # Opt-in; solo aplica si la temperatura efectiva del adaptador es <= LLM_MEMO_MAX_TEMPERATURE.
+    LLM_MEMO_ENABLED: bool = False
+    LLM_MEMO_MAX_TEMPERATURE: float = 0.2
+    LLM_MEMO_L1_MAX_ENTRIES: int = 5000
+    LLM_MEMO_DEFAULT_TTL_SECONDS: int = 900
+    # TTL por call site (nombre usado en `llm_memo_service.memoize`).
+    LLM_MEMO_TTL_SECONDS: Dict[str, int] = {
+        "router": 3600,
+        "name_or_query_classifier": 3600,
+        "name_and_query_extraction": 1800,
+        "sql_tool_usage": 600,
+    }
     # ==========================================================
 
     # --- Configuración LLM y Embeddings ---
@@ -80,6 +191,11 @@ class Settings(BaseSettings):
     MAX_RETRIEVED_CHUNKS_RAG: int = 8
     CHAT_HISTORY_WINDOW_SIZE_RAG: int = 6
     CHAT_HISTORY_WINDOW_SIZE_SQL: int = 0 
+    # Historial en Redis: se guardan como mucho CHAT_HISTORY_MAX_STORED_MESSAGES (LTRIM al añadir).
+    # Con el resumen activado, las preguntas de los turnos recortados se acumulan en un mensaje de resumen.
+    CHAT_HISTORY_MAX_STORED_MESSAGES: int = 40
+    CHAT_HISTORY_SUMMARY_ENABLED: bool = False
+    CHAT_HISTORY_SUMMARY_MAX_CHARS: int = 1500
 
     # --- PROMPTS POR DEFECTO / FALLBACK ---
 
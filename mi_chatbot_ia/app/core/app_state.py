@@ -2,7 +2,7 @@
 
 import asyncio
 import traceback
-from typing import Dict, Optional
+from typing import Dict, Optional, Sequence
 
 # --- Librerías de Terceros ---
 # Usamos el módulo asyncio de la librería redis oficial
@@ -17,7 +17,7 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, Session
 from langchain_community.embeddings import SentenceTransformerEmbeddings
 from langchain_postgres.vectorstores import PGVector
-from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.runnables import Runnable
 from pathlib import Path
 
 # --- Módulos Locales ---
@@ -53,7 +53,11 @@ class AppState:
         
         # Clientes de servicios externos y cachés
         self.redis_client: Optional[AsyncRedis] = None
-        self.llm_adapter_cache: Dict[int, BaseChatModel] = {}
+        # Los adaptadores LLM viven en app.services.llm_adapter_cache (LRU acotada y versionada).
+
+        # Tareas de fondo (listener de invalidación de configuración, etc.)
+        self.config_invalidation_task: Optional[asyncio.Task] = None
+        self.interaction_log_writer = None  # InteractionLogWriter (import local para evitar ciclos)
 
     async def initialize(self):
         """
@@ -167,12 +171,54 @@ class AppState:
             FastAPICache.init(InMemoryBackend())
             print("      -> ADVERTENCIA: REDIS_URL no configurada. Usando caché en memoria.")
         
+        # Los circuit breakers de los LLM comparten su apertura entre workers por Redis;
+        # la memoización de sub-llamadas usa Redis como L2
+        from app.services import circuit_breaker_service, llm_memo_service
+        circuit_breaker_service.set_redis_client(self.redis_client)
+        llm_memo_service.set_redis_client(self.redis_client)
+
+        # Invalidación de la configuración compilada de clientes (pub/sub entre workers)
+        from app.services import tenant_config_service
+        from app.security import api_key_cache
+        # La caché de API keys se invalida con los mismos mensajes (por cliente API o total).
+        tenant_config_service.register_invalidation_handler(api_key_cache.invalidate_client)
+        if self.redis_client:
+            self.config_invalidation_task = asyncio.create_task(
+                tenant_config_service.run_invalidation_listener(self.redis_client)
+            )
+
+        # Adaptadores LLM de los agentes activos, construidos antes de la primera petición
+        if settings.LLM_ADAPTER_PREWARM_ENABLED:
+            from app.services import llm_adapter_cache
+            try:
+                warmed = await llm_adapter_cache.prewarm_async(self.AsyncCrudSessionLocal)
+                print(f"      -> Éxito: {warmed} adaptador(es) LLM precalentados.")
+            except Exception as e:
+                print(f"      -> ADVERTENCIA: Falló el precalentamiento de adaptadores LLM: {e}")
+
+        # Escritor de logs de interacción por lotes (el chat ya no espera el INSERT)
+        if settings.INTERACTION_LOG_ASYNC_ENABLED:
+            from app.services.interaction_log_writer import InteractionLogWriter
+            self.interaction_log_writer = InteractionLogWriter(self.AsyncCrudSessionLocal)
+            self.interaction_log_writer.start()
+
         print("--- [INIT] Todos los recursos inicializados con éxito. ---\n")
 
     async def close(self):
         """
         Cierra limpiamente las conexiones al apagar la aplicación.
         """
+        if self.config_invalidation_task:
+            self.config_invalidation_task.cancel()
+            try:
+                await self.config_invalidation_task
+            except asyncio.CancelledError:
+                pass
+            print("INFO:     [SHUTDOWN] Listener de invalidación de configuración detenido.")
+        if self.interaction_log_writer:
+            # Se drena ANTES de cerrar el pool CRUD: necesita conexiones para los últimos lotes.
+            await self.interaction_log_writer.stop()
+            print("INFO:     [SHUTDOWN] Escritor de logs de interacción drenado.")
         if self.async_crud_engine:
             await self.async_crud_engine.dispose()
             print("INFO:     [SHUTDOWN] Pool de conexión CRUD cerrado.")
@@ -182,36 +228,23 @@ class AppState:
         if self.redis_client:
             await self.redis_client.close()
             print("INFO:     [SHUTDOWN] Conexión a Redis cerrada.")
+        from app.llm_integrations.bedrock_executor import shutdown_bedrock_executor
+        shutdown_bedrock_executor()
 
-    # En app/core/app_state.py, DENTRO de la clase AppState:
-
-    async def get_cached_llm(self, model_config, temperature_to_use: float) -> BaseChatModel:
+    async def get_cached_llm(
+        self, model_config, temperature_to_use: float,
+        max_tokens_override: Optional[int] = None, fallback_configs: Sequence = (), step: Optional[str] = None
+    ) -> Runnable:
         """
-        Obtiene un adaptador de LLM desde el caché. La clave del caché ahora
-        incluye la temperatura para asegurar que se usan instancias distintas.
+        Obtiene un adaptador de LLM desde la caché acotada. La clave incluye el `updated_at`
+        del config, la temperatura y el max_tokens, así que una edición del config nunca
+        reutiliza el cliente viejo. El adaptador va protegido por su circuit breaker y,
+        si se pasan `fallback_configs`, con failover hacia ellos. `step` (paso del pipeline)
+        añade la medición de latencia por paso y modelo.
         """
-        # --- Imports locales para evitar dependencias circulares ---
-        from app.llm_integrations import langchain_llm_adapter
-        from langchain_core.language_models.chat_models import BaseChatModel
-
-        # La clave del caché ahora es una combinación del ID del modelo y la temperatura.
-        # Esto es crucial para que agentes diferentes no reusen el mismo objeto si tienen temps distintas.
-        cache_key = f"llm_{model_config.id}_temp_{temperature_to_use:.2f}"
-        
-        if cache_key in self.llm_adapter_cache:
-            print(f"LLM_CACHE_HIT: Reusando '{model_config.display_name}' con Temp {temperature_to_use:.2f} desde caché.")
-            return self.llm_adapter_cache[cache_key]
-        
-        print(f"LLM_CACHE_MISS: Creando nueva instancia de '{model_config.display_name}' con Temp {temperature_to_use:.2f}.")
-        
-        # Le pasamos la temperatura decidida al adaptador. El adaptador ya no piensa, solo ejecuta.
-        adapter_instance: BaseChatModel = langchain_llm_adapter.get_langchain_llm_adapter(
-            config=model_config,
-            temperature_to_use=temperature_to_use
-        )
-        
-        self.llm_adapter_cache[cache_key] = adapter_instance
-        return adapter_instance
+        # --- Import local para evitar dependencias circulares ---
+        from app.services import llm_adapter_cache
+        return llm_adapter_cache.get_resilient_llm(model_config, temperature_to_use, max_tokens_override, fallback_configs, step)
 
 # ==========================================================
 # ======>   FUNCIÓN DE ARRANQUE PARA SER USADA EN main.py  <======
@@ -54,6 +54,7 @@ from .crud_llm_model_config import (
     create_llm_model_config,
     get_llm_model_config_by_id,
     get_llm_model_config_by_identifier,
+    get_active_llm_model_configs_by_ids,
     get_llm_model_configs,
     update_llm_model_config,
     delete_llm_model_config
@@ -66,7 +67,8 @@ from .crud_virtual_agent_profile import (
     get_virtual_agent_profile_by_name,
     get_virtual_agent_profiles,
     update_virtual_agent_profile,
-    delete_virtual_agent_profile
+    delete_virtual_agent_profile,
+    get_profile_with_llm_config
 )
 
 # --- Para HumanAgent y HumanAgentGroup (NUEVO) ---
@@ -94,7 +96,7 @@ from .crud_user import (
     delete_user,
     get_contexts_for_user_dni  # <-- AÑADIR ESTA LÍNEA
 )
-from .crud_interaction_log import create_interaction_log_async
+from .crud_interaction_log import create_interaction_log_async, create_interaction_logs_bulk_async
 
 # Creamos un alias. Ahora create_interaction_log también apunta a la función async.
 create_interaction_log = create_interaction_log_async
@@ -8,6 +8,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 from app.models.api_client import ApiClient as ApiClientModel
+from app.security import api_key_cache
 from app.models.context_definition import ContextDefinition as ContextDefinitionModel
 from app.schemas.schemas import (
     ApiClientCreate, 
@@ -72,6 +73,11 @@ async def get_api_client_by_hashed_key(db: AsyncSession, hashed_api_key: str) ->
         return await _prepare_api_client_object_for_response(db, db_api_client)
     return None
 
+async def get_api_client_by_hashed_key_lean(db: AsyncSession, hashed_api_key: str) -> Optional[ApiClientModel]:
+    """Búsqueda mínima para autenticación: una sola consulta, sin detalles de contextos."""
+    stmt = select(ApiClientModel).filter(ApiClientModel.hashed_api_key == hashed_api_key)
+    return (await db.execute(stmt)).scalars().first()
+
 async def create_api_client(db: AsyncSession, api_client_in: ApiClientCreate) -> ApiClientModel:
     plain_text_api_key = generate_api_key()
     hashed_api_key = hash_api_key(plain_text_api_key)
@@ -87,6 +93,8 @@ async def create_api_client(db: AsyncSession, api_client_in: ApiClientCreate) ->
     db.add(db_api_client)
     await db.commit()
     await db.refresh(db_api_client)
+    # Por si la nueva clave quedó cacheada como inválida antes de existir.
+    api_key_cache.invalidate_hash(hashed_api_key)
     
     setattr(db_api_client, 'api_key_plain', plain_text_api_key) 
     return await _prepare_api_client_object_for_response(db, db_api_client)
@@ -100,6 +108,7 @@ async def update_api_client(db: AsyncSession, db_api_client_orm: ApiClientModel,
             setattr(db_api_client_orm, field_name, new_value)
     await db.commit()
     await db.refresh(db_api_client_orm)
+    api_key_cache.invalidate_client(db_api_client_orm.id)
     return await _prepare_api_client_object_for_response(db, db_api_client_orm)
 
 async def regenerate_api_key(db: AsyncSession, db_api_client_orm: ApiClientModel) -> ApiClientModel:
@@ -107,6 +116,9 @@ async def regenerate_api_key(db: AsyncSession, db_api_client_orm: ApiClientModel
     db_api_client_orm.hashed_api_key = hash_api_key(new_plain_text_key)
     await db.commit()
     await db.refresh(db_api_client_orm)
+    # La clave anterior deja de ser válida de inmediato.
+    api_key_cache.invalidate_client(db_api_client_orm.id)
+    api_key_cache.invalidate_hash(db_api_client_orm.hashed_api_key)
     setattr(db_api_client_orm, 'api_key_plain', new_plain_text_key)
     return await _prepare_api_client_object_for_response(db, db_api_client_orm)
 
@@ -115,6 +127,7 @@ async def delete_api_client(db: AsyncSession, api_client_id: int) -> Optional[Ap
     if db_api_client:
         await db.delete(db_api_client)
         await db.commit()
+        api_key_cache.invalidate_client(api_client_id)
         return db_api_client 
     return None
 
@@ -125,4 +138,5 @@ async def update_api_client_webchat_config(db: AsyncSession, api_client_id: int,
     db_api_client.webchat_ui_config = config_in.model_dump(mode='json')
     await db.commit()
     await db.refresh(db_api_client)
+    api_key_cache.invalidate_client(api_client_id)
     return await _prepare_api_client_object_for_response(db, db_api_client)
\ No newline at end of file
@@ -1,8 +1,9 @@
 # app/crud/crud_interaction_log.py (Versión Corregida y Robusta)
 
+from sqlalchemy import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.interaction_log import InteractionLog as InteractionLogModel
-from typing import Dict, Any
+from typing import Dict, Any, List
 
 async def create_interaction_log_async(db: AsyncSession, log_data: Dict[str, Any]) -> InteractionLogModel:
     """Crea un log de interacción de forma asíncrona y robusta."""
@@ -22,4 +23,22 @@ async def create_interaction_log_async(db: AsyncSession, log_data: Dict[str, Any
     except Exception as e:
         print(f"CRUD: ERROR al crear log: {e}")
         await db.rollback() # Hacemos rollback si algo falla.
-        raise
\ No newline at end of file
+        raise
+
+async def create_interaction_logs_bulk_async(db: AsyncSession, logs_data: List[Dict[str, Any]]) -> int:
+    """
+    Inserta varios logs de interacción en un solo INSERT multi-fila (sin SELECT posterior).
+    Devuelve cuántos se insertaron.
+    """
+    if not logs_data:
+        return 0
+    model_keys = InteractionLogModel.__table__.columns.keys()
+    rows = [{k: v for k, v in log_data.items() if k in model_keys} for log_data in logs_data]
+    try:
+        await db.execute(insert(InteractionLogModel), rows)
+        await db.commit()
+        return len(rows)
+    except Exception as e:
+        print(f"CRUD: ERROR al insertar lote de {len(rows)} logs: {e}")
+        await db.rollback()
+        raise
@@ -48,6 +48,16 @@ async def get_llm_model_config_by_id(db: AsyncSession, model_id: int) -> Optiona
     result = await db.execute(select(LLMModelConfigModel).filter(LLMModelConfigModel.id == model_id))
     return result.scalars().first()
 
+async def get_active_llm_model_configs_by_ids(db: AsyncSession, model_ids: List[int]) -> List[LLMModelConfigModel]:
+    """Configs activos con esos IDs, en el MISMO orden de `model_ids` (p.ej. la cadena de failover)."""
+    if not model_ids:
+        return []
+    result = await db.execute(select(LLMModelConfigModel).filter(
+        LLMModelConfigModel.id.in_(model_ids), LLMModelConfigModel.is_active == True
+    ))
+    configs_by_id = {config.id: config for config in result.scalars().all()}
+    return [configs_by_id[model_id] for model_id in model_ids if model_id in configs_by_id]
+
 async def get_llm_model_config_by_identifier(db: AsyncSession, identifier: str) -> Optional[LLMModelConfigModel]:
     result = await db.execute(select(LLMModelConfigModel).filter(LLMModelConfigModel.model_identifier == identifier))
     return result.scalars().first()
@@ -95,6 +105,9 @@ async def update_llm_model_config(db: AsyncSession, *, db_model: LLMModelConfigM
     db.add(db_model)
     await db.commit()
     await db.refresh(db_model)
+    # Hook de invalidación: los adaptadores construidos con el config anterior se descartan ya.
+    from app.services import llm_adapter_cache
+    llm_adapter_cache.invalidate_config(db_model.id)
     return db_model
 
 async def delete_llm_model_config(db: AsyncSession, model_id: int) -> bool:
@@ -102,5 +115,7 @@ async def delete_llm_model_config(db: AsyncSession, model_id: int) -> bool:
     if db_model:
         await db.delete(db_model)
         await db.commit()
+        from app.services import llm_adapter_cache
+        llm_adapter_cache.invalidate_config(model_id)
         return True
     return False
\ No newline at end of file
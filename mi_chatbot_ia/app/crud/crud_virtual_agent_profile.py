@@ -1,7 +1,8 @@
 # app/crud/crud_virtual_agent_profile.py
-from typing import Optional, List, Any
+from typing import Optional, List, Any, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy import func
 from sqlalchemy.orm import selectinload
 
 from app.models.virtual_agent_profile import VirtualAgentProfile as VAPModel
@@ -70,4 +71,31 @@ async def get_fully_loaded_profile(db: AsyncSession, profile_id: int) -> Optiona
     Wrapper que asegura que un perfil se obtiene con todas sus relaciones cargadas.
     Llama a la función existente con los parámetros correctos.
     """
-    return await get_virtual_agent_profile_by_id(db, profile_id=profile_id, load_relations=True)
\ No newline at end of file
+    return await get_virtual_agent_profile_by_id(db, profile_id=profile_id, load_relations=True)
+
+async def get_profile_with_llm_config(
+    db: AsyncSession,
+    profile_id: int,
+    llm_model_config_id_override: Optional[int] = None,
+    fallback_llm_model_config_id: Optional[int] = None
+) -> Tuple[Optional[VAPModel], Optional[LLMModelConfigModel]]:
+    """
+    Carga el perfil y su configuración LLM EFECTIVA en una sola consulta (JOIN).
+    Prioridad del LLM: override del cliente API > LLM del perfil > default del contexto.
+    """
+    if llm_model_config_id_override:
+        llm_join_condition = LLMModelConfigModel.id == llm_model_config_id_override
+    elif fallback_llm_model_config_id:
+        llm_join_condition = LLMModelConfigModel.id == func.coalesce(VAPModel.llm_model_config_id, fallback_llm_model_config_id)
+    else:
+        llm_join_condition = LLMModelConfigModel.id == VAPModel.llm_model_config_id
+
+    stmt = (
+        select(VAPModel, LLMModelConfigModel)
+        .outerjoin(LLMModelConfigModel, llm_join_condition)
+        .filter(VAPModel.id == profile_id)
+    )
+    row = (await db.execute(stmt)).first()
+    if row is None:
+        return None, None
+    return row[0], row[1]
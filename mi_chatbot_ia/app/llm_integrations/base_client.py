@@ -1,5 +1,6 @@
 # app/llm_integrations/base_client.py
 from abc import ABC, abstractmethod
+from typing import AsyncIterator
 from app.models.llm_model_config import LLMModelConfig
 
 class LLMClient(ABC):
@@ -16,4 +17,11 @@ class LLMClient(ABC):
         """
         Método principal para interactuar con el LLM.
         """
-        pass
\ No newline at end of file
+        pass
+
+    async def stream(self, full_prompt: str) -> AsyncIterator[str]:
+        """
+        Emite la respuesta por fragmentos. Por defecto, un único fragmento con la respuesta
+        completa; los clientes con streaming nativo (Bedrock) lo sobrescriben.
+        """
+        yield await self.invoke(full_prompt)
@@ -1,8 +1,12 @@
 # app/llm_integrations/bedrock_client.py
 
+import asyncio
+import threading
 import boto3
 import json
+from typing import AsyncIterator
 from .base_client import LLMClient
+from .bedrock_executor import run_in_bedrock_executor
 from app.models.llm_model_config import LLMModelConfig
 from app.utils.security_utils import decrypt_data
 
@@ -73,20 +77,69 @@ class BedrockClient(LLMClient):
             raise
 
     async def invoke(self, full_prompt: str) -> str:
-        body, accept, contentType = self._prepare_request(full_prompt)
+        """Invoca el modelo en el pool de Bedrock: el event loop sigue atendiendo mientras tanto."""
         try:
-            # ### [MEJORA] ### Usar invoke_model_with_response_stream sería aún mejor para el futuro, pero invoke_model es más simple por ahora.
-            response = self.client.invoke_model(
-                body=body,
-                modelId=self.model_name, # Aquí va 'anthropic.claude-3-haiku-20240307-v1:0'
-                accept=accept,
-                contentType=contentType
-            )
-            return self._parse_response(response)
+            return await run_in_bedrock_executor(self._invoke_sync, full_prompt)
         except Exception as e:
             print(f"Error invocando el modelo de Bedrock {self.model_name}: {e}")
             raise
 
+    def _invoke_sync(self, full_prompt: str) -> str:
+        # La lectura del 'body' (StreamingBody) también es E/S bloqueante: se hace en el mismo hilo.
+        body, accept, contentType = self._prepare_request(full_prompt)
+        response = self.client.invoke_model(
+            body=body,
+            modelId=self.model_name, # Aquí va 'anthropic.claude-3-haiku-20240307-v1:0'
+            accept=accept,
+            contentType=contentType
+        )
+        return self._parse_response(response)
+
+    async def stream(self, full_prompt: str) -> AsyncIterator[str]:
+        """
+        Emite el texto a medida que Bedrock lo genera (`invoke_model_with_response_stream`).
+        Un hilo del pool recorre el EventStream y pasa cada fragmento al loop por una cola.
+        """
+        body, accept, contentType = self._prepare_request(full_prompt)
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop_requested = threading.Event()
+        end_of_stream = object()
+
+        def _produce() -> None:
+            try:
+                response = self.client.invoke_model_with_response_stream(
+                    body=body, modelId=self.model_name, accept=accept, contentType=contentType
+                )
+                for event in response.get('body'):
+                    if stop_requested.is_set():
+                        break
+                    chunk = event.get('chunk')
+                    if not chunk:
+                        continue
+                    text = self._parse_stream_chunk(json.loads(chunk['bytes']))
+                    if text:
+                        loop.call_soon_threadsafe(queue.put_nowait, text)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, end_of_stream)
+
+        producer = run_in_bedrock_executor(_produce)
+        try:
+            while True:
+                item = await queue.get()
+                if item is end_of_stream:
+                    break
+                if isinstance(item, Exception):
+                    print(f"Error en el stream del modelo de Bedrock {self.model_name}: {item}")
+                    raise item
+                yield item
+        finally:
+            # Si el consumidor corta antes (cliente desconectado), el hilo deja de leer el stream.
+            stop_requested.set()
+            await asyncio.shield(producer)
+
     def _prepare_request(self, prompt: str):
         """Prepara el 'body' y headers correctos según la familia del modelo."""
         # ### [MEJORA] ### Hacemos esto más robusto y configurable.
@@ -131,4 +184,19 @@ class BedrockClient(LLMClient):
         elif "meta" in self.model_name:
             return response_body.get('generation', '')
         else:
-            raise NotImplementedError(f"El parser de respuesta para '{self.model_name}' no está implementado.")
\ No newline at end of file
+            raise NotImplementedError(f"El parser de respuesta para '{self.model_name}' no está implementado.")
+
+    def _parse_stream_chunk(self, chunk: dict) -> str:
+        """Texto de un evento de `invoke_model_with_response_stream` según el proveedor."""
+        if "anthropic" in self.model_name:
+            if chunk.get('type') == 'content_block_delta':
+                return chunk.get('delta', {}).get('text', '')
+            return ""
+        elif "cohere" in self.model_name:
+            if 'generations' in chunk:
+                return chunk['generations'][0].get('text', '')
+            return chunk.get('text', '')
+        elif "meta" in self.model_name:
+            return chunk.get('generation', '')
+        else:
+            raise NotImplementedError(f"El parser de stream para '{self.model_name}' no está implementado.")
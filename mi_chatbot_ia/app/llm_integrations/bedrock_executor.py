@@ -0,0 +1,42 @@
+# app/llm_integrations/bedrock_executor.py
+"""
+Pool de hilos dedicado y acotado para las llamadas síncronas de boto3 a Bedrock.
+
+`boto3` no tiene API asíncrona: llamar a `invoke_model`/`converse` desde una corrutina
+bloquea el event loop durante toda la generación (y con él, todas las demás peticiones
+del worker). Aquí esas llamadas se ejecutan en un pool propio, separado del executor
+por defecto del loop, para que una ráfaga de Bedrock no deje sin hilos al resto
+(`asyncio.to_thread`, LangChain, etc.). El tamaño se ajusta con `BEDROCK_EXECUTOR_MAX_WORKERS`.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Callable, Any
+
+from app.config import settings
+
+
+_bedrock_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _bedrock_executor
+    if _bedrock_executor is None:
+        _bedrock_executor = ThreadPoolExecutor(
+            max_workers=settings.BEDROCK_EXECUTOR_MAX_WORKERS, thread_name_prefix="bedrock"
+        )
+    return _bedrock_executor
+
+
+def run_in_bedrock_executor(fn: Callable[..., Any], *args, **kwargs) -> "asyncio.Future":
+    """Ejecuta `fn(*args, **kwargs)` en el pool de Bedrock. Devuelve un awaitable."""
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(_get_executor(), functools.partial(fn, *args, **kwargs))
+
+
+def shutdown_bedrock_executor() -> None:
+    """Cierra el pool (apagado de la app). Las llamadas en curso terminan en segundo plano."""
+    global _bedrock_executor
+    if _bedrock_executor is not None:
+        _bedrock_executor.shutdown(wait=False, cancel_futures=True)
+        _bedrock_executor = None
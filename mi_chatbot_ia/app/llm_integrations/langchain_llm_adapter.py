@@ -2,6 +2,7 @@
 import os
 import json
 import boto3
+from typing import Optional
 
 # --- LangChain Imports ---
 from langchain_core.language_models.chat_models import BaseChatModel
@@ -14,10 +15,10 @@ from langchain_openai import ChatOpenAI
 from app.models.llm_model_config import LLMModelConfig, LLMProviderType
 from app.utils.security_utils import decrypt_data
 
-def get_langchain_llm_adapter(config: LLMModelConfig, temperature_to_use: float) -> BaseChatModel:
+def get_langchain_llm_adapter(config: LLMModelConfig, temperature_to_use: float, max_tokens_override: Optional[int] = None) -> BaseChatModel:
     """
-    Crea y devuelve una instancia de LangChain usando la configuración y la TEMPERATURA EXACTA
-    proporcionada. Ya no toma decisiones, solo construye.
+    Crea y devuelve una instancia de LangChain usando la configuración, la TEMPERATURA EXACTA
+    y el max_tokens (override o el del modelo) proporcionados. Ya no toma decisiones, solo construye.
     """
     provider = config.provider
     print(f"LANGCHAIN_ADAPTER: Construyendo '{config.display_name}' con Temp: {temperature_to_use:.2f}")
@@ -32,7 +33,7 @@ def get_langchain_llm_adapter(config: LLMModelConfig, temperature_to_use: float)
 
     # --- Parámetros de Modelo ---
     model_identifier = config.model_identifier.strip()
-    max_tokens = config.default_max_tokens # No necesitamos overrides aquí
+    max_tokens = max_tokens_override or config.default_max_tokens
 
     # ==========================================================
     # ======>        CONSTRUCCIÓN POR PROVEEDOR            <======
@@ -71,6 +72,13 @@ def get_langchain_llm_adapter(config: LLMModelConfig, temperature_to_use: float)
         
         return ChatBedrock(client=bedrock_client, model_id=model_identifier, model_kwargs=model_kwargs)
         
+    elif provider == LLMProviderType.STUB:
+        # Import local: solo se usa en entornos de prueba de carga.
+        from .stub_chat_model import StubChatModel
+        from .stub_client import StubResponder, get_stub_config_data
+        print(f"LANGCHAIN_ADAPTER: Usando el proveedor STUB (simulado) para '{model_identifier}'.")
+        return StubChatModel(responder=StubResponder(get_stub_config_data(config), max_tokens), model_name=model_identifier)
+
     elif provider == LLMProviderType.OPENAI:
         if not api_key: raise ValueError("Proveedor OpenAI requiere una API Key.")
         openai_params = {"model": model_identifier, "temperature": temperature_to_use, "api_key": api_key}
@@ -6,6 +6,7 @@ from .google_client import GoogleGeminiClient
 from .ollama_client import OllamaClient 
 from .bedrock_client import BedrockClient # <-- ¡NUEVO IMPORT!
 from .openai_client import OpenAIClient  # <-- ¡NUEVO IMPORT!
+from .stub_client import StubClient
 # Cuando agregues más, impórtalos aquí. Ej: from .openai_client import OpenAIClient
 
 def get_llm_client(config: LLMModelConfig) -> LLMClient:
@@ -28,6 +29,7 @@ def get_llm_client(config: LLMModelConfig) -> LLMClient:
         LLMProviderType.OLLAMA: OllamaClient,
         LLMProviderType.BEDROCK: BedrockClient, # <-- ¡NUEVA LÍNEA MÁGICA!
         LLMProviderType.OPENAI: OpenAIClient, # <-- ¡NUEVA LÍNEA!
+        LLMProviderType.STUB: StubClient,
 
         # ===> AQUÍ ES DONDE AÑADIRÁS LOS OTROS PROVEEDORES EN EL FUTURO <===
         # LLMProviderType.OPENAI: OpenAIClient,
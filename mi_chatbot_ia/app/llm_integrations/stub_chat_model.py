@@ -0,0 +1,85 @@
+# app/llm_integrations/stub_chat_model.py
+"""
+Adaptador LangChain del proveedor STUB (ver `stub_client.StubResponder`). Se comporta
+como cualquier `BaseChatModel`: sirve en `prompt | llm | JsonOutputParser()`, en
+`.astream()` del endpoint de streaming y detrás de los circuit breakers.
+"""
+import asyncio
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from .stub_client import StubResponder, StubLLMError
+
+
+def _messages_to_prompt(messages: List[BaseMessage]) -> str:
+    return "\n".join(str(message.content) for message in messages)
+
+
+class StubChatModel(BaseChatModel):
+    responder: StubResponder
+    model_name: str = "stub"
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _fail_if_scripted(self) -> None:
+        if self.responder.should_fail():
+            raise StubLLMError(f"Fallo simulado del proveedor STUB '{self.model_name}'.")
+
+    def _generate(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any
+    ) -> ChatResult:
+        kind, text = self.responder.respond(_messages_to_prompt(messages))
+        time.sleep(self.responder.total_seconds(kind, text))
+        self._fail_if_scripted()
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any
+    ) -> ChatResult:
+        kind, text = self.responder.respond(_messages_to_prompt(messages))
+        await asyncio.sleep(self.responder.total_seconds(kind, text))
+        self._fail_if_scripted()
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        kind, text = self.responder.respond(_messages_to_prompt(messages))
+        time.sleep(self.responder.sample_latency_seconds(kind))
+        self._fail_if_scripted()
+        delay = self.responder.seconds_per_token()
+        for token in self.responder.split_tokens(text):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+            if delay:
+                time.sleep(delay)
+
+    async def _astream(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        kind, text = self.responder.respond(_messages_to_prompt(messages))
+        await asyncio.sleep(self.responder.sample_latency_seconds(kind))
+        self._fail_if_scripted()
+        delay = self.responder.seconds_per_token()
+        for token in self.responder.split_tokens(text):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+            if delay:
+                await asyncio.sleep(delay)
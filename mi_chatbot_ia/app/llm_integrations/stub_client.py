@@ -0,0 +1,241 @@
+# app/llm_integrations/stub_client.py
+"""
+Proveedor STUB: un "LLM" local, determinista y sin coste, para pruebas de carga y de
+latencia del pipeline de chat sin gastar cuota de los proveedores reales.
+
+Responde según el tipo de prompt que reconoce (JSON válido para el enrutador, el
+clasificador nombre/consulta, las extracciones y los parámetros de herramientas SQL;
+texto libre para el resto) y simula la latencia y la velocidad de streaming. Todo se
+configura en el `config_json` del LLMModelConfig:
+
+    {
+      "seed": 42,
+      "latency": {"distribution": "lognormal", "mean_ms": 800, "stddev_ms": 300, "min_ms": 50, "max_ms": 10000},
+      "latency_by_kind": {"router": {"distribution": "fixed", "mean_ms": 150}},
+      "tokens_per_second": 40,
+      "failure_rate": 0.0,
+      "text_tokens": 80,
+      "default_text": "...",
+      "scripted_responses": [{"match": "regex sobre el prompt", "response": "texto" | {...}}]
+    }
+
+Distribuciones: `fixed`, `uniform` (min/max), `normal` y `lognormal` (media/desviación).
+La latencia muestreada es el tiempo hasta el primer token; después cada token tarda
+`1 / tokens_per_second`. Con la misma semilla y el mismo orden de llamadas, la secuencia
+de latencias se repite.
+"""
+import asyncio
+import json
+import math
+import random
+import re
+import threading
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator
+
+from .base_client import LLMClient
+from app.models.llm_model_config import LLMModelConfig
+
+
+KIND_ROUTER = "router"
+KIND_NAME_OR_QUERY = "name_or_query"
+KIND_NAME_AND_QUERY_EXTRACTION = "name_and_query_extraction"
+KIND_NAME_EXTRACTION = "name_extraction"
+KIND_TOOL_PARAMETERS = "tool_parameters"
+KIND_CONDENSE = "condense"
+KIND_TEXT = "text"
+
+_DEFAULT_TEXT = (
+    "Claro, con gusto te ayudo. Según la información disponible, el proceso se realiza desde la "
+    "intranet: ingresa con tu usuario institucional, abre la sección correspondiente y sigue los "
+    "pasos indicados en pantalla. Si algo no funciona, puedes escribir a la mesa de ayuda indicando "
+    "tu código y una breve descripción del problema. ¿Hay algo más en lo que pueda ayudarte?"
+)
+_NAME_PATTERN = re.compile(
+    r"\b(?:me llamo|soy|mi nombre es|ll[aá]mame|llamarme)\s+([A-Za-zÁÉÍÓÚÑáéíóúñ]+)", re.IGNORECASE
+)
+_FAREWELL_PATTERN = re.compile(r"\b(gracias|adi[oó]s|chau|hasta luego|eso es todo)\b", re.IGNORECASE)
+_DATABASE_PATTERN = re.compile(r"\b(notas?|promedio|calificaci[oó]n(es)?|horario|pagos?|deuda)\b", re.IGNORECASE)
+_TOKEN_PATTERN = re.compile(r"\S+\s*")
+
+
+def _last_match(pattern: str, prompt: str) -> Optional[str]:
+    """Último grupo que casa: los ejemplos del prompt van antes que el mensaje real."""
+    matches = re.findall(pattern, prompt, re.DOTALL)
+    return matches[-1].strip() if matches else None
+
+
+class StubResponder:
+    """Lógica común del proveedor STUB (la usan `StubClient` y `StubChatModel`)."""
+
+    def __init__(self, config_data: Optional[Dict[str, Any]] = None, max_tokens: Optional[int] = None):
+        self.config_data = config_data or {}
+        self.max_tokens = max_tokens
+        self.tokens_per_second = float(self.config_data.get("tokens_per_second") or 0)
+        self.failure_rate = float(self.config_data.get("failure_rate") or 0)
+        self._rng = random.Random(self.config_data.get("seed", 0))
+        self._rng_lock = threading.Lock()  # `_generate` síncrono puede correr en hilos.
+        self._scripted: List[Tuple[re.Pattern, Any]] = [
+            (re.compile(item["match"], re.IGNORECASE | re.DOTALL), item.get("response", ""))
+            for item in self.config_data.get("scripted_responses") or []
+            if item.get("match")
+        ]
+
+    # --- Clasificación del prompt ---
+
+    @staticmethod
+    def classify_prompt(prompt: str) -> str:
+        if "'is_name'" in prompt:
+            return KIND_NAME_OR_QUERY
+        if "'tool_to_use' y 'parameters'" in prompt:
+            return KIND_TOOL_PARAMETERS
+        if "tool_to_use" in prompt and "DOCUMENT_RETRIEVER" in prompt:
+            return KIND_ROUTER
+        if "follow_up_query" in prompt:
+            return KIND_NAME_AND_QUERY_EXTRACTION
+        if "extracted_name" in prompt:
+            return KIND_NAME_EXTRACTION
+        if "Pregunta de Seguimiento:" in prompt:
+            return KIND_CONDENSE
+        return KIND_TEXT
+
+    # --- Respuestas ---
+
+    def respond(self, prompt: str) -> Tuple[str, str]:
+        """Devuelve (tipo de prompt, texto de la respuesta)."""
+        kind = self.classify_prompt(prompt)
+        for pattern, response in self._scripted:
+            if pattern.search(prompt):
+                return kind, response if isinstance(response, str) else json.dumps(response, ensure_ascii=False)
+
+        if kind == KIND_ROUTER:
+            question = _last_match(r"Pregunta del usuario:\s*(.+?)\n", prompt) or prompt
+            if _FAREWELL_PATTERN.search(question):
+                tool = "FAREWELL_HANDLER"
+            elif _DATABASE_PATTERN.search(question):
+                tool = "DATABASE_TOOL"
+            else:
+                tool = "DOCUMENT_RETRIEVER"
+            return kind, json.dumps({"tool_to_use": tool})
+
+        if kind == KIND_NAME_OR_QUERY:
+            user_input = _last_match(r'Respuesta del usuario:\s*"(.*?)"', prompt) or prompt
+            return kind, json.dumps({"is_name": bool(_NAME_PATTERN.search(user_input)) and "?" not in user_input})
+
+        if kind == KIND_NAME_AND_QUERY_EXTRACTION:
+            user_input = _last_match(r'Mensaje:\s*"(.*?)"', prompt) or ""
+            name_match = _NAME_PATTERN.search(user_input)
+            follow_up = (
+                re.sub(r"^[\s,.;]*(y\s+)?", "", user_input[name_match.end():]) if name_match else user_input
+            ).strip()
+            if not name_match and len(follow_up.split()) <= 2:
+                follow_up = ""  # Saludo simple: no se inventa una consulta.
+            return kind, json.dumps({
+                "extracted_name": name_match.group(1).capitalize() if name_match else None,
+                "follow_up_query": follow_up or None,
+            }, ensure_ascii=False)
+
+        if kind == KIND_NAME_EXTRACTION:
+            user_input = _last_match(r'Texto del usuario:\s*"(.*?)"', prompt) or prompt
+            name_match = _NAME_PATTERN.search(user_input)
+            if name_match:
+                name = name_match.group(1)
+            else:
+                words = user_input.split()
+                name = words[0] if len(words) == 1 else None
+            return kind, json.dumps({"extracted_name": name.capitalize() if name else None}, ensure_ascii=False)
+
+        if kind == KIND_TOOL_PARAMETERS:
+            tool_block = _last_match(r"```json\s*(.*?)\s*```", prompt)
+            try:
+                tool = json.loads(tool_block) if tool_block else {}
+            except json.JSONDecodeError:
+                tool = {}
+            parameters = {p.get("name"): None for p in tool.get("parameters") or [] if isinstance(p, dict) and p.get("name")}
+            return kind, json.dumps({"tool_to_use": tool.get("tool_name"), "parameters": parameters}, ensure_ascii=False)
+
+        if kind == KIND_CONDENSE:
+            return kind, _last_match(r"Pregunta de Seguimiento:\s*(.+?)(?:\n|$)", prompt) or ""
+
+        return kind, self._free_text()
+
+    def _free_text(self) -> str:
+        base_tokens = _TOKEN_PATTERN.findall(self.config_data.get("default_text") or _DEFAULT_TEXT)
+        target = int(self.config_data.get("text_tokens") or len(base_tokens))
+        if self.max_tokens:
+            target = min(target, self.max_tokens)
+        tokens = [base_tokens[i % len(base_tokens)] for i in range(max(1, target))]
+        return "".join(tokens).strip()
+
+    # --- Latencia y fallos simulados ---
+
+    def sample_latency_seconds(self, kind: str) -> float:
+        spec = (self.config_data.get("latency_by_kind") or {}).get(kind) or self.config_data.get("latency") or {}
+        distribution = spec.get("distribution", "fixed")
+        mean = float(spec.get("mean_ms", 0))
+        stddev = float(spec.get("stddev_ms", 0))
+        with self._rng_lock:
+            if distribution == "uniform":
+                value = self._rng.uniform(float(spec.get("min_ms", 0)), float(spec.get("max_ms", mean)))
+            elif distribution == "normal":
+                value = self._rng.gauss(mean, stddev)
+            elif distribution == "lognormal" and mean > 0:
+                sigma = math.sqrt(math.log(1 + (stddev / mean) ** 2))
+                value = self._rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+            else:
+                value = mean
+        value = max(float(spec.get("min_ms", 0)), value)
+        if spec.get("max_ms") is not None:
+            value = min(float(spec["max_ms"]), value)
+        return value / 1000
+
+    def should_fail(self) -> bool:
+        if self.failure_rate <= 0:
+            return False
+        with self._rng_lock:
+            return self._rng.random() < self.failure_rate
+
+    def seconds_per_token(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    @staticmethod
+    def split_tokens(text: str) -> List[str]:
+        return _TOKEN_PATTERN.findall(text) or [text]
+
+    def total_seconds(self, kind: str, text: str) -> float:
+        """Latencia total de una respuesta no-streaming: primer token + el resto al ritmo configurado."""
+        return self.sample_latency_seconds(kind) + len(self.split_tokens(text)) * self.seconds_per_token()
+
+
+class StubLLMError(Exception):
+    """Fallo simulado (`failure_rate`), para ejercitar reintentos, breakers y failover."""
+
+
+def get_stub_config_data(config: LLMModelConfig) -> Dict[str, Any]:
+    config_json = config.config_json
+    return json.loads(config_json) if isinstance(config_json, str) else (config_json or {})
+
+
+class StubClient(LLMClient):
+    """Cliente no-langchain del proveedor STUB."""
+
+    def __init__(self, config: LLMModelConfig):
+        super().__init__(config)
+        self.responder = StubResponder(get_stub_config_data(config), config.default_max_tokens)
+
+    async def invoke(self, full_prompt: str) -> str:
+        kind, text = self.responder.respond(full_prompt)
+        await asyncio.sleep(self.responder.total_seconds(kind, text))
+        if self.responder.should_fail():
+            raise StubLLMError(f"Fallo simulado del proveedor STUB '{self.config.display_name}'.")
+        return text
+
+    async def stream(self, full_prompt: str) -> AsyncIterator[str]:
+        kind, text = self.responder.respond(full_prompt)
+        await asyncio.sleep(self.responder.sample_latency_seconds(kind))
+        if self.responder.should_fail():
+            raise StubLLMError(f"Fallo simulado del proveedor STUB '{self.config.display_name}'.")
+        delay = self.responder.seconds_per_token()
+        for token in self.responder.split_tokens(text):
+            yield token
+            if delay:
+                await asyncio.sleep(delay)
@@ -5,7 +5,8 @@ import traceback
 from contextlib import asynccontextmanager
 
 # --- Third Party Imports ---
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 # --- Local Application Imports ---
@@ -27,6 +28,10 @@ from app.api.endpoints import user_endpoints
 from app.api.endpoints import virtual_agent_profile_endpoints
 from app.api.endpoints import admin_ingestion_endpoints # <-- AÑADIR ESTA LÍNEA
 
+from app.services import (
+    cache_service, metrics_service, prompt_registry, greeting_cache_service, single_flight_service,
+    admission_control_service, llm_adapter_cache, circuit_breaker_service, llm_memo_service
+)
 from app.config import settings # Asumo que tienes un config.py con un objeto `settings`
 
 # ==========================================================
@@ -153,4 +158,39 @@ def read_root():
 @app.get("/health", tags=["Default"])
 def health_check():
     """Endpoint de monitoreo para verificar que la aplicación está viva."""
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+@app.get("/health/interaction-logs", tags=["Default"])
+def interaction_log_writer_stats(request: Request):
+    """Contadores del escritor de logs por lotes (encolados, escritos, descartados, retrasados...)."""
+    app_state = getattr(request.app.state, "app_state", None)
+    writer = getattr(app_state, "interaction_log_writer", None)
+    if not writer:
+        return {"enabled": False}
+    return {"enabled": True, **writer.get_stats()}
+
+@app.get("/health/response-cache", tags=["Default"])
+def response_cache_stats():
+    """Contadores de la caché de respuestas del chat (aciertos L1/L2, fallos, tamaño de L1)."""
+    return cache_service.get_response_cache_stats()
+
+@app.get("/metrics", tags=["Default"], response_class=PlainTextResponse)
+def prometheus_metrics(request: Request):
+    """Histogramas de latencia por etapa del chat y contadores de cachés/logs (formato Prometheus)."""
+    extra_counters = {
+        "chatbot_response_cache": cache_service.get_response_cache_stats(),
+        "chatbot_prompt_registry": prompt_registry.get_registry_stats(),
+        "chatbot_greeting_cache": greeting_cache_service.get_greeting_cache_stats(),
+        "chatbot_single_flight": single_flight_service.get_single_flight_stats(),
+        "chatbot_admission": admission_control_service.get_admission_stats(),
+        "chatbot_llm_adapter_cache": llm_adapter_cache.get_adapter_cache_stats(),
+        **circuit_breaker_service.get_breaker_metrics(),
+        "chatbot_llm_memo": llm_memo_service.get_memo_stats(),
+    }
+    writer = getattr(getattr(request.app.state, "app_state", None), "interaction_log_writer", None)
+    if writer:
+        extra_counters["chatbot_interaction_log_writer"] = writer.get_stats()
+    return PlainTextResponse(
+        metrics_service.render_prometheus_metrics(extra_counters),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -39,6 +39,8 @@ class InteractionLog(Base_CRUD):
     
     intent = Column(String(100), nullable=True, index=True) # <--- NUEVA COLUMNA para el tipo de query
     metadata_details_json = Column(JSON, nullable=True, name="metadata_details")
+    # Desglose de latencia por etapa en ms (ej. {"auth": 1.2, "retrieve": 85.0, "answer_llm": 1900.4})
+    stage_timings_ms = Column(JSON, nullable=True)
 
     # Feedback (para futuro)
     # feedback_score = Column(Integer, nullable=True) # Ej. 1 para like, -1 para dislike
@@ -15,6 +15,7 @@ class LLMProviderType(str, enum.Enum):
     OLLAMA = "OLLAMA"
     CUSTOM = "CUSTOM"
     BEDROCK = "BEDROCK"
+    STUB = "STUB"  # Proveedor local simulado para pruebas de carga (sin llamadas externas)
     
 class LLMModelType(str, enum.Enum):
     CHAT_COMPLETION = "CHAT_COMPLETION"
@@ -65,6 +66,9 @@ class LLMModelConfig(Base_CRUD):
     config_json = Column(JSON, nullable=True, 
                          comment="JSON para parámetros de configuración adicionales específicos del proveedor (ej. para Azure).")
 
+    fallback_config_ids = Column(JSON, nullable=True,
+                                 comment="IDs de LLMModelConfig a los que se pasa, en orden, si este proveedor falla o su circuit breaker está abierto.")
+
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
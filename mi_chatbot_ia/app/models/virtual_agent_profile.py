@@ -29,6 +29,12 @@ class VirtualAgentProfile(Base_CRUD):
     
     name_confirmation_prompt = Column(Text, nullable=True, comment="Prompt para la ETAPA 2: Confirmación de nombre.")
     character_sheet_json = Column(JSONB, nullable=True)
+    intent_router_examples_json = Column(JSONB, nullable=True,
+                                         comment="Frases de ejemplo por herramienta para el enrutador por embeddings (ej. {'DATABASE_TOOL': ['mis notas', ...]}).")
+    farewell_templates_json = Column(JSONB, nullable=True,
+                                     comment="Plantillas de despedida que se rotan sin llamar al LLM (ej. {'with_name': ['¡Hasta luego, {user_name}!'], 'without_name': [...]}).")
+    step_llm_config_ids_json = Column(JSONB, nullable=True,
+                                      comment="LLMModelConfig por paso del pipeline (ej. {'routing': 3, 'extraction': 3, 'condense': 3, 'answer': 1}). Los pasos sin entrada usan llm_model_config_id.")
 
 
     llm_model_config_id = Column(Integer, ForeignKey("llm_model_configs.id", name="fk_vap_llm_model_config_id"), nullable=False)
@@ -98,6 +98,7 @@ class LLMProviderType(str, enum.Enum):
     OLLAMA = _get_enum_value(_SQLA_LLMProviderType_IMPORTED.OLLAMA)
     CUSTOM = _get_enum_value(_SQLA_LLMProviderType_IMPORTED.CUSTOM)
     BEDROCK = _get_enum_value(_SQLA_LLMProviderType_IMPORTED.BEDROCK)   
+    STUB = _get_enum_value(_SQLA_LLMProviderType_IMPORTED.STUB)
 print("SCHEMA_PY_DEBUG: Pydantic LLMProviderType defined.")
 
 class LLMModelType(str, enum.Enum):
@@ -147,6 +148,8 @@ class LLMModelConfigBase(BaseModel):
     supports_system_prompt: bool = Field(True)
     # [CAMBIO CLAVE]: Permitimos explícitamente None y le damos un valor por defecto
     config_json: Optional[Dict[str, Any]] = Field(default_factory=dict)
+    # Configs de respaldo, en orden de preferencia (failover con circuit breaker).
+    fallback_config_ids: List[int] = Field(default_factory=list)
     
     # Validador explícito que SÍ funciona. Si el valor es None, lo convierte en {}.
     @field_validator("config_json", mode="before")
@@ -156,6 +159,13 @@ class LLMModelConfigBase(BaseModel):
             return {}
         return value
 
+    @field_validator("fallback_config_ids", mode="before")
+    @classmethod
+    def set_fallback_config_ids_default(cls, value):
+        if value is None:
+            return []
+        return value
+
 
 class LLMModelConfigCreate(LLMModelConfigBase):
     api_key_plain: Optional[str] = Field(None, description="API Key en texto plano. Se encriptará antes de guardar.")
@@ -171,6 +181,7 @@ class LLMModelConfigUpdate(BaseModel):
     default_max_tokens: Optional[int] = None
     supports_system_prompt: Optional[bool] = None
     config_json: Optional[Dict[str, Any]] = None
+    fallback_config_ids: Optional[List[int]] = None
     api_key_plain: Optional[str] = Field(None, description="Proporcionar una nueva API Key para actualizarla.")
 
 class LLMModelConfigResponse(LLMModelConfigBase, OrmBaseModel):
@@ -219,6 +230,9 @@ class VirtualAgentProfileCreate(VirtualAgentProfileBase):
     greeting_prompt: Optional[str] = None
     name_confirmation_prompt: Optional[str] = None
     character_sheet_json: Optional[Dict[str, Any]] = None
+    intent_router_examples_json: Optional[Dict[str, List[str]]] = None
+    farewell_templates_json: Optional[Dict[str, List[str]]] = None
+    step_llm_config_ids_json: Optional[Dict[str, int]] = None
     
 class VirtualAgentProfileUpdate(BaseModel):
     name: Optional[constr(min_length=3, max_length=150)] = None
@@ -230,6 +244,9 @@ class VirtualAgentProfileUpdate(BaseModel):
     greeting_prompt: Optional[str] = None
     name_confirmation_prompt: Optional[str] = None
     character_sheet_json: Optional[Dict[str, Any]] = None
+    intent_router_examples_json: Optional[Dict[str, List[str]]] = None
+    farewell_templates_json: Optional[Dict[str, List[str]]] = None
+    step_llm_config_ids_json: Optional[Dict[str, int]] = None
     # --- FIN DE CAMPOS NUEVOS ---
 
     llm_model_config_id: Optional[int] = None
@@ -245,6 +262,9 @@ class VirtualAgentProfileResponse(VirtualAgentProfileBase, OrmBaseModel):
     id: int
     llm_model_config: Optional[LLMModelConfigResponse] = None
     character_sheet_json: Optional[Dict[str, Any]] = None
+    intent_router_examples_json: Optional[Dict[str, List[str]]] = None
+    farewell_templates_json: Optional[Dict[str, List[str]]] = None
+    step_llm_config_ids_json: Optional[Dict[str, int]] = None
     created_at: datetime.datetime
     updated_at: datetime.datetime
     # Hereda automáticamente los nuevos campos de VirtualAgentProfileBase
@@ -586,6 +606,10 @@ class ApiClientSettingsSchema(BaseModel):
     default_virtual_agent_profile_id_override: Optional[int] = None
     history_k_messages: int = Field(5, ge=0, le=50)
     max_tokens_per_response_override: Optional[int] = Field(None, ge=1, le=8000)
+    # Control de admisión (None = valores por defecto de la configuración global)
+    max_concurrent_requests: Optional[int] = Field(None, ge=1, le=500)
+    max_queued_requests: Optional[int] = Field(None, ge=0, le=5000)
+    queue_timeout_seconds: Optional[float] = Field(None, gt=0, le=120)
 
 class ContextDefinitionBriefForApiClient(OrmBaseModel):
     id: int; name: str; main_type: ContextMainType
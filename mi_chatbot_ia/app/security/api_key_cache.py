@@ -0,0 +1,58 @@
+# app/security/api_key_cache.py
+"""
+Caché en memoria de la autenticación por API Key (clave: hash de la API Key).
+
+- Entradas positivas: el ApiClient ya validado y desacoplado de la sesión, con sus
+  `parsed_settings_object` adjuntos. Se comparten entre peticiones (SOLO LECTURA).
+- Entradas negativas: el rechazo (status + detalle) de claves inexistentes, clientes
+  inactivos o mal configurados, con un TTL más corto.
+
+Se invalida explícitamente desde `crud_api_client` (update/regenerate/delete) y, entre
+workers, mediante el canal de invalidación de `tenant_config_service`.
+"""
+from dataclasses import dataclass
+from typing import Optional, Union
+
+from app.config import settings
+from app.models.api_client import ApiClient as ApiClientModel
+from app.services.cache_service import TTLLRUCache
+
+
+@dataclass(frozen=True, slots=True)
+class ApiKeyRejection:
+    """Resultado negativo cacheado: se traduce en la misma HTTPException en cada intento."""
+    status_code: int
+    detail: str
+    api_client_id: Optional[int] = None
+
+
+_api_key_cache = TTLLRUCache(
+    max_entries=settings.API_KEY_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.API_KEY_CACHE_TTL_SECONDS
+)
+
+
+def get(hashed_api_key: str) -> Optional[Union[ApiClientModel, ApiKeyRejection]]:
+    return _api_key_cache.get(hashed_api_key)
+
+def set_client(hashed_api_key: str, api_client: ApiClientModel) -> None:
+    _api_key_cache.set(hashed_api_key, api_client)
+
+def set_rejection(hashed_api_key: str, rejection: ApiKeyRejection) -> None:
+    _api_key_cache.set(hashed_api_key, rejection, ttl_seconds=settings.API_KEY_NEGATIVE_CACHE_TTL_SECONDS)
+
+def invalidate_hash(hashed_api_key: Optional[str]) -> None:
+    if hashed_api_key:
+        _api_key_cache.delete(hashed_api_key)
+
+def _entry_client_id(entry) -> Optional[int]:
+    return entry.api_client_id if isinstance(entry, ApiKeyRejection) else entry.id
+
+def invalidate_client(api_client_id: Optional[int] = None) -> None:
+    """Invalida las entradas de un cliente API; `None` vacía toda la caché."""
+    if api_client_id is None:
+        _api_key_cache.clear()
+        return
+    removed = _api_key_cache.delete_where(lambda entry: _entry_client_id(entry) == api_client_id)
+    if removed:
+        print(f"API_KEY_CACHE: {removed} entrada(s) invalidada(s) para el ApiClient ID {api_client_id}.")
@@ -0,0 +1,159 @@
+# app/services/admission_control_service.py
+"""
+Control de admisión delante de `route_request` (el trabajo que llama al LLM).
+
+En un pico, cada petición disparaba sus llamadas al LLM de inmediato: el proveedor
+empezaba a limitar, los errores caían en cascada a `_handle_human_handoff` y todas las
+peticiones salían perdiendo. Aquí cada turno debe obtener, en este orden:
+  1. un hueco del cliente API (`max_concurrent_requests` en sus settings), y
+  2. un hueco global del worker (`ADMISSION_GLOBAL_MAX_CONCURRENCY`).
+Si no hay hueco se espera en una cola FIFO acotada y con plazo; si la cola está llena o
+vence el plazo se rechaza enseguida (429), sin tocar el LLM.
+
+Los aciertos de caché y los seguidores de single-flight no pasan por aquí. Los límites
+son por proceso (gunicorn -w 1). Métricas: profundidad de cola y contadores en /metrics,
+tiempo de espera como la etapa `admission_wait` del desglose por turno.
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Deque
+
+from app.config import settings
+from app.services.metrics_service import record_stage
+
+
+class AdmissionRejected(Exception):
+    """No hay capacidad para atender el turno ahora (cola llena o plazo de espera vencido)."""
+    def __init__(self, reason: str, retry_after_seconds: int):
+        self.reason = reason
+        self.retry_after_seconds = retry_after_seconds
+        super().__init__(f"Admisión rechazada ({reason}).")
+
+
+class _Limiter:
+    """Semáforo con cola FIFO acotada. Un hueco liberado pasa directamente al primer waiter."""
+
+    def __init__(self, limit: int, max_queue: int):
+        self.limit = max(1, limit)
+        self.max_queue = max(0, max_queue)
+        self.active = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+
+    def configure(self, limit: int, max_queue: int) -> None:
+        """Aplica límites nuevos (p. ej. tras editar el cliente) y despierta a quien ya quepa."""
+        self.limit, self.max_queue = max(1, limit), max(0, max_queue)
+        self._grant_waiters()
+
+    def _grant_waiters(self) -> None:
+        while self.waiters and self.active < self.limit:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                self.active += 1
+                waiter.set_result(True)
+
+    async def acquire(self, deadline: float, timeout_seconds: float) -> None:
+        """`timeout_seconds` es el plazo con el que se calculó `deadline` (va en Retry-After)."""
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            return
+        if len(self.waiters) >= self.max_queue:
+            raise AdmissionRejected("queue_full", retry_after_seconds=1)
+
+        waiter: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=max(0.0, deadline - time.monotonic()))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if waiter.done() and not waiter.cancelled():
+                # El hueco llegó justo al vencer el plazo: se devuelve para no perderlo.
+                self.release()
+            else:
+                waiter.cancel()
+                try:
+                    self.waiters.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(exc, asyncio.CancelledError):
+                raise
+            raise AdmissionRejected("timeout", retry_after_seconds=max(1, int(timeout_seconds)))
+
+    def release(self) -> None:
+        self.active -= 1
+        self._grant_waiters()
+
+
+class AdmissionController:
+    def __init__(self, global_limit: int, global_max_queue: int):
+        self._global = _Limiter(global_limit, global_max_queue)
+        self._clients: Dict[int, _Limiter] = {}
+        self._stats: Dict[str, int] = {"admitted": 0, "rejected_queue_full": 0, "rejected_timeout": 0, "queued": 0}
+
+    def _client_limiter(self, client_id: int, client_settings: Any) -> _Limiter:
+        limit = getattr(client_settings, "max_concurrent_requests", None) or settings.ADMISSION_DEFAULT_CLIENT_MAX_CONCURRENCY
+        max_queue = getattr(client_settings, "max_queued_requests", None)
+        if max_queue is None:
+            max_queue = settings.ADMISSION_DEFAULT_CLIENT_MAX_QUEUE
+        limiter = self._clients.get(client_id)
+        if limiter is None:
+            limiter = self._clients[client_id] = _Limiter(limit, max_queue)
+        elif (limiter.limit, limiter.max_queue) != (limit, max_queue):
+            limiter.configure(limit, max_queue)
+        return limiter
+
+    @asynccontextmanager
+    async def admit(self, client_id: int, client_settings: Any = None):
+        """
+        `async with admission_controller.admit(client.id, client.parsed_settings_object): ...`
+        Eleva `AdmissionRejected` si no se consigue hueco a tiempo.
+        """
+        if not settings.ADMISSION_CONTROL_ENABLED:
+            yield
+            return
+
+        timeout = getattr(client_settings, "queue_timeout_seconds", None) or settings.ADMISSION_QUEUE_TIMEOUT_SECONDS
+        deadline = time.monotonic() + timeout
+        client_limiter = self._client_limiter(client_id, client_settings)
+        wait_start = time.perf_counter()
+        if client_limiter.waiters or client_limiter.active >= client_limiter.limit or self._global.active >= self._global.limit:
+            self._stats["queued"] += 1
+        try:
+            await client_limiter.acquire(deadline, timeout)
+            try:
+                await self._global.acquire(deadline, timeout)
+            except BaseException:
+                client_limiter.release()
+                raise
+        except AdmissionRejected as e:
+            self._stats[f"rejected_{e.reason}"] += 1
+            print(f"ADMISSION: Turno rechazado para el cliente {client_id} ({e.reason}).")
+            raise
+        finally:
+            record_stage("admission_wait", (time.perf_counter() - wait_start) * 1000)
+
+        self._stats["admitted"] += 1
+        try:
+            yield
+        finally:
+            self._global.release()
+            client_limiter.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "global_active": self._global.active,
+            "global_queue_depth": len(self._global.waiters),
+            "clients_queue_depth": sum(len(limiter.waiters) for limiter in self._clients.values()),
+            "clients_active": sum(limiter.active for limiter in self._clients.values()),
+        }
+
+
+admission_controller = AdmissionController(
+    global_limit=settings.ADMISSION_GLOBAL_MAX_CONCURRENCY,
+    global_max_queue=settings.ADMISSION_GLOBAL_MAX_QUEUE
+)
+
+
+def get_admission_stats() -> Dict[str, Any]:
+    return admission_controller.get_stats()
@@ -2,6 +2,9 @@
 
 import json
 import hashlib
+import re
+import time
+from collections import OrderedDict
 from typing import Optional, Dict, Any, List
 
 # CAMBIO CLAVE: Usamos la librería oficial de Redis en modo asíncrono
@@ -9,41 +12,142 @@ from redis.asyncio import Redis as AsyncRedis
 
 # CAMBIO CLAVE: Importamos el objeto 'settings' para el TTL. Ya no importamos nada de app_state.
 from app.config import settings
+from app.services import semantic_cache_service
+
+# ==========================================================
+# ===        CACHÉ L1 EN MEMORIA (LRU CON TTL)           ===
+# ==========================================================
+
+class TTLLRUCache:
+    """
+    Caché en memoria del proceso, acotada (LRU) y con expiración por entrada.
+    Pensada para ir DELANTE de Redis: no hace I/O y no necesita locks porque
+    todo el acceso ocurre en el mismo event loop.
+    """
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[int] = None) -> None:
+        effective_ttl = ttl_seconds if ttl_seconds is not None else self.ttl_seconds
+        self._data[key] = (time.monotonic() + effective_ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def delete_where(self, predicate) -> int:
+        """Elimina las entradas cuyo valor cumple `predicate(value)`. Devuelve cuántas borró."""
+        keys_to_delete = [k for k, (_, value) in self._data.items() if predicate(value)]
+        for key in keys_to_delete:
+            del self._data[key]
+        return len(keys_to_delete)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
 
 # ==========================================================
 # ===    NUEVO CACHÉ ASÍNCRONO DE RESPUESTAS DE CHAT     ===
 # ==========================================================
+# Dos niveles: L1 en memoria del proceso (LRU + TTL) delante de Redis (L2).
+
+_response_cache_l1 = TTLLRUCache(
+    max_entries=settings.RESPONSE_CACHE_L1_MAX_ENTRIES,
+    ttl_seconds=settings.RESPONSE_CACHE_L1_TTL_SECONDS
+)
 
-def _create_secure_cache_key(api_client_id: int, context_ids: List[int], question: str) -> str:
-    """Crea una clave de caché segura (esta función no cambia)."""
+_response_cache_stats: Dict[str, int] = {"l1_hits": 0, "l2_hits": 0, "misses": 0, "sets": 0, "skips": 0}
+
+_QUESTION_EDGE_PUNCTUATION = "¿?¡!.,;: "
+
+def _normalize_question(question: str) -> str:
+    """Normaliza la pregunta para que variaciones triviales compartan la misma clave."""
+    collapsed = re.sub(r"\s+", " ", question.lower()).strip()
+    return collapsed.strip(_QUESTION_EDGE_PUNCTUATION)
+
+def _create_secure_cache_key(api_client_id: int, context_ids: List[int], question: str, scope: str) -> str:
+    """Crea una clave de caché segura a partir del cliente, los contextos, su versión (`scope`) y la pregunta normalizada."""
     sorted_contexts = sorted(list(set(context_ids)))
-    key_material = f"{api_client_id}:{','.join(map(str, sorted_contexts))}:{question.lower().strip()}"
-    return f"chatbot_response:v3:{hashlib.sha256(key_material.encode()).hexdigest()}"
+    key_material = f"{api_client_id}:{','.join(map(str, sorted_contexts))}:{scope}:{_normalize_question(question)}"
+    return f"chatbot_response:v5:{hashlib.sha256(key_material.encode()).hexdigest()}"
+
+def get_response_cache_key(api_client_id: int, context_ids: List[int], question: str, scope: str) -> str:
+    """Clave de la caché de respuestas; la reutiliza la coalescencia de peticiones (single-flight)."""
+    return _create_secure_cache_key(api_client_id, context_ids, question, scope)
+
+async def get_response_cache_scope_async(redis_client: Optional[AsyncRedis], vap, context_ids: List[int]) -> str:
+    """
+    (ASÍNCRONO) Versión de lo que, además de la pregunta, determina la respuesta: el agente
+    (id y `updated_at`) y la versión de ingesta de cada contexto. Va en la clave, así que
+    editar el agente o re-ingestar documentos deja de servir las respuestas anteriores.
+    """
+    sorted_contexts = sorted(set(context_ids))
+    ingest_versions = await semantic_cache_service.get_ingest_versions_async(redis_client, sorted_contexts)
+    vap_updated_at = vap.updated_at.isoformat() if getattr(vap, "updated_at", None) else ""
+    versions = ",".join(f"{context_id}={ingest_versions[context_id]}" for context_id in sorted_contexts)
+    return f"vap:{vap.id}@{vap_updated_at}|ingest:{versions}"
+
+def get_response_cache_stats() -> Dict[str, Any]:
+    """Devuelve los contadores de la caché de respuestas (para dimensionarla)."""
+    stats: Dict[str, Any] = dict(_response_cache_stats)
+    lookups = stats["l1_hits"] + stats["l2_hits"] + stats["misses"]
+    stats["l1_size"] = len(_response_cache_l1)
+    stats["l1_max_entries"] = _response_cache_l1.max_entries
+    stats["hit_ratio"] = round((stats["l1_hits"] + stats["l2_hits"]) / lookups, 4) if lookups else 0.0
+    return stats
 
 async def get_cached_response_async(
     redis_client: Optional[AsyncRedis], 
     api_client_id: int, 
     context_ids: List[int], 
-    question: str
+    question: str,
+    scope: str
 ) -> Optional[Dict[str, Any]]:
     """
     (ASÍNCRONO) Recupera una respuesta de chat cacheada.
-    Recibe el cliente redis como parámetro.
+    Consulta primero la L1 en memoria y luego Redis; un acierto en Redis se promueve a L1.
+    `scope` viene de `get_response_cache_scope_async`.
     """
-    if not redis_client:
-        return None
-
-    cache_key = _create_secure_cache_key(api_client_id, context_ids, question)
-    
-    try:
-        # CAMBIO CLAVE: Usamos `await` para la operación de red.
-        cached_json = await redis_client.get(cache_key)
-        if cached_json:
-            print(f"CACHE_HIT: Respuesta de chat encontrada para la clave '{cache_key}'")
-            return json.loads(cached_json)
-    except Exception as e:
-        print(f"CACHE_ERROR: Error al leer de Redis (get_cached_response_async): {e}")
-
+    cache_key = _create_secure_cache_key(api_client_id, context_ids, question, scope)
+
+    cached_value = _response_cache_l1.get(cache_key)
+    if cached_value is not None:
+        _response_cache_stats["l1_hits"] += 1
+        print(f"CACHE_HIT (L1): Respuesta de chat encontrada para la clave '{cache_key}'")
+        return cached_value
+
+    if redis_client:
+        try:
+            # CAMBIO CLAVE: Usamos `await` para la operación de red.
+            cached_json = await redis_client.get(cache_key)
+            if cached_json:
+                cached_value = json.loads(cached_json)
+                _response_cache_l1.set(cache_key, cached_value)
+                _response_cache_stats["l2_hits"] += 1
+                print(f"CACHE_HIT (L2): Respuesta de chat encontrada para la clave '{cache_key}'")
+                return cached_value
+        except Exception as e:
+            print(f"CACHE_ERROR: Error al leer de Redis (get_cached_response_async): {e}")
+
+    _response_cache_stats["misses"] += 1
     return None
 
 async def set_cached_response_async(
@@ -51,21 +155,25 @@ async def set_cached_response_async(
     api_client_id: int, 
     context_ids: List[int], 
     question: str, 
+    scope: str,
     response_dict: Dict[str, Any]
 ):
-    """(ASÍNCRONO) Guarda una respuesta de chat en la caché."""
-    if not redis_client:
-        return
-
+    """(ASÍNCRONO) Guarda una respuesta de chat en ambos niveles de la caché."""
     bot_response_text = response_dict.get("bot_response", "")
     if not bot_response_text or "[Error" in bot_response_text:
+        _response_cache_stats["skips"] += 1
         print("CACHE_SKIP: Respuesta inválida, no se guardará en caché.")
         return
 
-    cache_key = _create_secure_cache_key(api_client_id, context_ids, question)
-    
+    cache_key = _create_secure_cache_key(api_client_id, context_ids, question, scope)
+    _response_cache_l1.set(cache_key, response_dict)
+    _response_cache_stats["sets"] += 1
+
+    if not redis_client:
+        return
+
     try:
-        json_value = json.dumps(response_dict)
+        json_value = json.dumps(response_dict, default=str)
         # CAMBIO CLAVE: Usamos `await`
         await redis_client.set(cache_key, json_value, ex=settings.CACHE_EXPIRATION_SECONDS)
         print(f"CACHE_SET: Respuesta de chat guardada para la clave '{cache_key}'")
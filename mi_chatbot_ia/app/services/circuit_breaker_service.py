@@ -0,0 +1,291 @@
+# app/services/circuit_breaker_service.py
+"""
+Circuit breakers por LLMModelConfig para las llamadas del chat al LLM.
+
+Con un proveedor degradado (brownout de Gemini o Bedrock) cada petición esperaba los
+timeouts del SDK y terminaba en `_handle_human_handoff`. Ahora cada config tiene un
+breaker que observa una ventana deslizante de llamadas:
+
+- CLOSED: deja pasar. Abre si, con al menos `LLM_BREAKER_MIN_CALLS` llamadas en la
+  ventana, la tasa de error o la de llamadas lentas supera su umbral.
+- OPEN: falla al instante (`CircuitOpenError`) durante `LLM_BREAKER_OPEN_SECONDS`;
+  `RunnableWithFallbacks` pasa entonces al siguiente config de `fallback_config_ids`.
+- HALF_OPEN: al vencer, deja pasar UNA llamada de prueba; si va bien cierra, si no reabre.
+
+La apertura se comparte entre workers con una clave en Redis (`llm_breaker:{id}` con el
+instante de cierre y TTL): cada worker la consulta como mucho cada
+`LLM_BREAKER_REDIS_SYNC_SECONDS`. Las ventanas de error son locales al proceso.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Optional, Dict, Any, Deque, Tuple, AsyncIterator, Iterator
+
+from langchain_core.runnables import Runnable, RunnableConfig
+from redis.asyncio import Redis as AsyncRedis
+
+from app.config import settings
+
+
+STATE_CLOSED, STATE_OPEN, STATE_HALF_OPEN = "closed", "open", "half_open"
+_STATE_GAUGE = {STATE_CLOSED: 0, STATE_HALF_OPEN: 1, STATE_OPEN: 2}
+
+_redis_client: Optional[AsyncRedis] = None
+_breakers: Dict[int, "CircuitBreaker"] = {}
+# Referencias fuertes a las escrituras en Redis lanzadas en segundo plano.
+_background_tasks: set = set()
+
+
+class CircuitOpenError(Exception):
+    """El breaker del proveedor está abierto: no se intenta la llamada."""
+
+
+def set_redis_client(redis_client: Optional[AsyncRedis]) -> None:
+    """Lo llama AppState al arrancar; sin Redis los breakers funcionan solo en el proceso."""
+    global _redis_client
+    _redis_client = redis_client
+
+
+def _get_redis_key(config_id: int) -> str:
+    return f"llm_breaker:{config_id}"
+
+
+def _fire_and_forget(coro) -> None:
+    try:
+        task = asyncio.get_running_loop().create_task(coro)
+    except RuntimeError:
+        coro.close()  # Llamada síncrona fuera del loop: el estado queda solo en este proceso.
+        return
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+class CircuitBreaker:
+    def __init__(self, config_id: int, name: str):
+        self.config_id = config_id
+        self.name = name
+        self.state = STATE_CLOSED
+        self.open_until = 0.0  # epoch (compartible entre máquinas)
+        self.probe_in_flight = False
+        self.last_redis_sync = 0.0
+        self.times_opened = 0
+        self.rejected_calls = 0
+        # (instante, ok, latencia_ms) de las llamadas dentro de la ventana.
+        self._outcomes: Deque[Tuple[float, bool, float]] = deque()
+
+    # --- Decisión ---
+
+    def _prune(self, now: float) -> None:
+        while self._outcomes and self._outcomes[0][0] < now - settings.LLM_BREAKER_WINDOW_SECONDS:
+            self._outcomes.popleft()
+
+    def allow_request(self) -> bool:
+        now = time.time()
+        if self.state == STATE_OPEN:
+            if now < self.open_until:
+                return False
+            self.state = STATE_HALF_OPEN
+            self.probe_in_flight = False
+        if self.state == STATE_HALF_OPEN:
+            if self.probe_in_flight:
+                return False
+            self.probe_in_flight = True
+        return True
+
+    async def before_call_async(self) -> None:
+        await self._sync_from_redis()
+        self.before_call()
+
+    def before_call(self) -> None:
+        if not self.allow_request():
+            self.rejected_calls += 1
+            raise CircuitOpenError(f"Circuit breaker abierto para '{self.name}'.")
+
+    async def _sync_from_redis(self) -> None:
+        """Adopta una apertura decidida por otro worker (como mucho una consulta por intervalo)."""
+        now = time.time()
+        if not _redis_client or self.state != STATE_CLOSED or now - self.last_redis_sync < settings.LLM_BREAKER_REDIS_SYNC_SECONDS:
+            return
+        self.last_redis_sync = now
+        try:
+            remote_open_until = await _redis_client.get(_get_redis_key(self.config_id))
+        except Exception as e:
+            print(f"LLM_BREAKER_ERROR: No se pudo leer el estado compartido de '{self.name}': {e}")
+            return
+        if remote_open_until and float(remote_open_until) > now:
+            self.state, self.open_until = STATE_OPEN, float(remote_open_until)
+            print(f"LLM_BREAKER: '{self.name}' abierto por otro worker hasta {self.open_until:.0f}.")
+
+    # --- Resultados ---
+
+    def record_success(self, latency_ms: float) -> None:
+        now = time.time()
+        if self.state == STATE_HALF_OPEN:
+            self._close()
+            return
+        self._outcomes.append((now, True, latency_ms))
+        self._evaluate(now)
+
+    def record_failure(self, latency_ms: float) -> None:
+        now = time.time()
+        if self.state == STATE_HALF_OPEN:
+            self._open(now)
+            return
+        self._outcomes.append((now, False, latency_ms))
+        self._evaluate(now)
+
+    def abandon_call(self) -> None:
+        """Llamada cancelada (cliente desconectado, stream cortado): no cuenta, pero libera la prueba."""
+        if self.state == STATE_HALF_OPEN:
+            self.probe_in_flight = False
+
+    def _evaluate(self, now: float) -> None:
+        self._prune(now)
+        total = len(self._outcomes)
+        if self.state != STATE_CLOSED or total < settings.LLM_BREAKER_MIN_CALLS:
+            return
+        errors = sum(1 for _, ok, _ in self._outcomes if not ok)
+        slow = sum(1 for _, _, latency in self._outcomes if latency >= settings.LLM_BREAKER_SLOW_CALL_MS)
+        if errors / total >= settings.LLM_BREAKER_ERROR_RATE_THRESHOLD or slow / total >= settings.LLM_BREAKER_SLOW_CALL_RATE_THRESHOLD:
+            self._open(now)
+
+    def _open(self, now: float) -> None:
+        self.state, self.open_until, self.probe_in_flight = STATE_OPEN, now + settings.LLM_BREAKER_OPEN_SECONDS, False
+        self.times_opened += 1
+        self._outcomes.clear()
+        print(f"LLM_BREAKER: '{self.name}' ABIERTO durante {settings.LLM_BREAKER_OPEN_SECONDS}s.")
+        if _redis_client:
+            _fire_and_forget(self._publish_open(self.open_until))
+
+    def _close(self) -> None:
+        self.state, self.probe_in_flight = STATE_CLOSED, False
+        self._outcomes.clear()
+        print(f"LLM_BREAKER: '{self.name}' CERRADO tras una prueba correcta.")
+        if _redis_client:
+            _fire_and_forget(self._publish_close())
+
+    async def _publish_open(self, open_until: float) -> None:
+        try:
+            await _redis_client.set(
+                _get_redis_key(self.config_id), str(open_until), px=max(1, int((open_until - time.time()) * 1000))
+            )
+        except Exception as e:
+            print(f"LLM_BREAKER_ERROR: No se pudo publicar la apertura de '{self.name}': {e}")
+
+    async def _publish_close(self) -> None:
+        try:
+            await _redis_client.delete(_get_redis_key(self.config_id))
+        except Exception as e:
+            print(f"LLM_BREAKER_ERROR: No se pudo publicar el cierre de '{self.name}': {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        self._prune(time.time())
+        total = len(self._outcomes)
+        return {
+            "state": self.state,
+            "calls_in_window": total,
+            "error_rate": round(sum(1 for _, ok, _ in self._outcomes if not ok) / total, 4) if total else 0.0,
+            "avg_latency_ms": round(sum(latency for _, _, latency in self._outcomes) / total, 1) if total else 0.0,
+            "times_opened": self.times_opened,
+            "rejected_calls": self.rejected_calls,
+        }
+
+
+def get_breaker(model_config) -> CircuitBreaker:
+    breaker = _breakers.get(model_config.id)
+    if breaker is None:
+        breaker = _breakers[model_config.id] = CircuitBreaker(model_config.id, model_config.display_name)
+    return breaker
+
+
+# ==========================================================
+# ===        ENVOLTORIO RUNNABLE DEL ADAPTADOR           ===
+# ==========================================================
+
+class CircuitBreakerRunnable(Runnable):
+    """
+    Envuelve un adaptador LLM: consulta el breaker antes de cada llamada y le informa
+    del resultado y la latencia. Se compone con `.with_fallbacks([...])`.
+    """
+
+    def __init__(self, bound: Runnable, breaker: CircuitBreaker):
+        self.bound = bound
+        self.breaker = breaker
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        self.breaker.before_call()
+        start = time.perf_counter()
+        try:
+            result = self.bound.invoke(input, config, **kwargs)
+        except Exception:
+            self.breaker.record_failure((time.perf_counter() - start) * 1000)
+            raise
+        except BaseException:
+            self.breaker.abandon_call()
+            raise
+        self.breaker.record_success((time.perf_counter() - start) * 1000)
+        return result
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        await self.breaker.before_call_async()
+        start = time.perf_counter()
+        try:
+            result = await self.bound.ainvoke(input, config, **kwargs)
+        except Exception:
+            self.breaker.record_failure((time.perf_counter() - start) * 1000)
+            raise
+        except BaseException:
+            self.breaker.abandon_call()
+            raise
+        self.breaker.record_success((time.perf_counter() - start) * 1000)
+        return result
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[Any]:
+        self.breaker.before_call()
+        start = time.perf_counter()
+        try:
+            yield from self.bound.stream(input, config, **kwargs)
+        except Exception:
+            self.breaker.record_failure((time.perf_counter() - start) * 1000)
+            raise
+        except BaseException:
+            self.breaker.abandon_call()
+            raise
+        self.breaker.record_success((time.perf_counter() - start) * 1000)
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AsyncIterator[Any]:
+        await self.breaker.before_call_async()
+        start = time.perf_counter()
+        try:
+            async for chunk in self.bound.astream(input, config, **kwargs):
+                yield chunk
+        except Exception:
+            self.breaker.record_failure((time.perf_counter() - start) * 1000)
+            raise
+        except BaseException:
+            self.breaker.abandon_call()
+            raise
+        self.breaker.record_success((time.perf_counter() - start) * 1000)
+
+
+# ==========================================================
+# ===                    MÉTRICAS                        ===
+# ==========================================================
+
+def get_breaker_metrics() -> Dict[str, Dict[str, Any]]:
+    """Gauges para /metrics, con el nombre del config como etiqueta."""
+    metrics: Dict[str, Dict[str, Any]] = {
+        "chatbot_llm_breaker_state": {},
+        "chatbot_llm_breaker_error_rate": {},
+        "chatbot_llm_breaker_avg_latency_ms": {},
+        "chatbot_llm_breaker_times_opened": {},
+        "chatbot_llm_breaker_rejected_calls": {},
+    }
+    for breaker in _breakers.values():
+        stats = breaker.get_stats()
+        metrics["chatbot_llm_breaker_state"][breaker.name] = _STATE_GAUGE[stats["state"]]
+        metrics["chatbot_llm_breaker_error_rate"][breaker.name] = stats["error_rate"]
+        metrics["chatbot_llm_breaker_avg_latency_ms"][breaker.name] = stats["avg_latency_ms"]
+        metrics["chatbot_llm_breaker_times_opened"][breaker.name] = stats["times_opened"]
+        metrics["chatbot_llm_breaker_rejected_calls"][breaker.name] = stats["rejected_calls"]
+    return metrics
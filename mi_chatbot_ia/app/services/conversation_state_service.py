@@ -0,0 +1,209 @@
+# app/services/conversation_state_service.py
+"""
+Estado de conversación de una sesión en UN solo hash de Redis.
+
+Antes había tres claves (`conv:state`, `conv:params`, `conv:username`), tres GET con su
+JSON y hasta cuatro SET/DELETE sueltos (ni atómicos, ni en un solo viaje). Ahora:
+  - `chat:{<session_id>}:state`   hash con los campos `state`, `params`, `user_name`
+    y sus vencimientos `state_exp` / `user_name_exp` (epoch en ms).
+  - `chat:{<session_id>}:history` lista del historial (ver `_chat_history_logic`).
+  - `chat:{<session_id>}:summary` resumen de los turnos recortados del historial (opcional).
+El hash-tag `{<session_id>}` deja todas las claves en el mismo slot de Redis Cluster.
+
+- Lectura: un HGETALL (los campos vencidos se ignoran).
+- Escritura: un script Lua atómico. Redis no tiene TTL por campo (antes de 7.4), así que
+  se emula con los campos `*_exp`; la clave expira con el vencimiento más lejano.
+- Migración: con `SESSION_LEGACY_KEYS_MIGRATION_ENABLED`, si el hash no existe se leen
+  las claves antiguas en el MISMO pipeline y se mueven al hash. Las claves antiguas duran
+  como mucho 5 minutos, así que el ajuste puede desactivarse poco después del despliegue.
+"""
+import json
+import time
+from typing import Optional, Dict, Any
+
+from redis.asyncio import Redis as AsyncRedis
+
+from app.config import settings
+
+
+_SAVE_STATE_LUA = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local state = ARGV[2]
+local params = ARGV[3]
+local state_ttl = tonumber(ARGV[4])
+local user_name = ARGV[5]
+local user_name_ttl = tonumber(ARGV[6])
+
+if state == '' then
+    redis.call('HDEL', key, 'state', 'params', 'state_exp')
+else
+    redis.call('HSET', key, 'state', state, 'state_exp', now + state_ttl)
+    if params == '' then
+        redis.call('HDEL', key, 'params')
+    else
+        redis.call('HSET', key, 'params', params)
+    end
+end
+
+if user_name ~= '' then
+    redis.call('HSET', key, 'user_name', user_name, 'user_name_exp', now + user_name_ttl)
+end
+
+-- La clave vive hasta el vencimiento más lejano de sus campos vigentes.
+local max_exp = 0
+for _, field in ipairs({'state_exp', 'user_name_exp'}) do
+    local exp = tonumber(redis.call('HGET', key, field))
+    if exp and exp > now and exp > max_exp then
+        max_exp = exp
+    end
+end
+if max_exp == 0 then
+    redis.call('DEL', key)
+else
+    redis.call('PEXPIREAT', key, max_exp)
+end
+return max_exp
+"""
+
+# Un objeto Script por cliente Redis (normalmente solo hay uno: el de AppState).
+_save_scripts: Dict[int, Any] = {}
+
+
+def get_session_state_key(session_id: str) -> str:
+    return f"chat:{{{session_id}}}:state"
+
+def get_session_history_key(session_id: str) -> str:
+    return f"chat:{{{session_id}}}:history"
+
+def get_session_summary_key(session_id: str) -> str:
+    return f"chat:{{{session_id}}}:summary"
+
+def get_legacy_history_key(session_id: str) -> str:
+    return f"message_store:{session_id}"
+
+def _get_legacy_state_keys(session_id: str):
+    return f"conv:state:{session_id}", f"conv:params:{session_id}", f"conv:username:{session_id}"
+
+
+def _empty_state() -> Dict[str, Any]:
+    return {"state_name": None, "partial_parameters": {}, "user_name": None}
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+def _decode_json(raw: Optional[str]) -> Any:
+    if raw is None:
+        return None
+    try:
+        return json.loads(raw)
+    except (TypeError, ValueError):
+        return raw
+
+
+def _parse_state_hash(fields: Dict[str, str]) -> Dict[str, Any]:
+    state = _empty_state()
+    if not fields:
+        return state
+    now = _now_ms()
+    if fields.get("state") and int(fields.get("state_exp") or 0) > now:
+        state["state_name"] = fields["state"]
+        params = _decode_json(fields.get("params"))
+        state["partial_parameters"] = params if isinstance(params, dict) else {}
+    if fields.get("user_name") and int(fields.get("user_name_exp") or 0) > now:
+        state["user_name"] = fields["user_name"]
+    return state
+
+
+async def _run_save_script(
+    redis_client: AsyncRedis, session_id: str, state_name: Optional[str],
+    tool_params: Dict[str, Any], state_ttl_seconds: int, user_name: Optional[str]
+) -> None:
+    script = _save_scripts.get(id(redis_client))
+    if script is None:
+        script = redis_client.register_script(_SAVE_STATE_LUA)
+        _save_scripts[id(redis_client)] = script
+    await script(
+        keys=[get_session_state_key(session_id)],
+        args=[
+            _now_ms(),
+            state_name or "",
+            json.dumps(tool_params) if tool_params else "",
+            state_ttl_seconds * 1000,
+            user_name or "",
+            settings.CONVERSATION_USER_NAME_TTL_SECONDS * 1000,
+        ]
+    )
+
+
+async def get_conversation_state_async(redis_client: Optional[AsyncRedis], session_id: str) -> Dict[str, Any]:
+    """(ASÍNCRONO) Recupera el estado de la conversación en un solo viaje a Redis."""
+    if not redis_client:
+        return _empty_state()
+    try:
+        if not settings.SESSION_LEGACY_KEYS_MIGRATION_ENABLED:
+            return _parse_state_hash(await redis_client.hgetall(get_session_state_key(session_id)))
+
+        legacy_keys = _get_legacy_state_keys(session_id)
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.hgetall(get_session_state_key(session_id))
+            for legacy_key in legacy_keys:
+                pipe.get(legacy_key)
+            fields, legacy_state, legacy_params, legacy_username = await pipe.execute()
+
+        if fields or not (legacy_state or legacy_params or legacy_username):
+            return _parse_state_hash(fields)
+        return await _migrate_legacy_state(redis_client, session_id, legacy_state, legacy_params, legacy_username)
+    except Exception as e:
+        print(f"CONV_STATE_ERROR: No se pudo leer el estado de la sesión {session_id}: {e}")
+        return _empty_state()
+
+
+async def _migrate_legacy_state(
+    redis_client: AsyncRedis, session_id: str,
+    legacy_state: Optional[str], legacy_params: Optional[str], legacy_username: Optional[str]
+) -> Dict[str, Any]:
+    """Mueve las tres claves antiguas al hash (con los TTL por defecto) y las borra."""
+    state = _empty_state()
+    state_name = _decode_json(legacy_state)
+    params = _decode_json(legacy_params)
+    user_name = _decode_json(legacy_username)
+    if isinstance(state_name, str):
+        state["state_name"] = state_name
+        state["partial_parameters"] = params if isinstance(params, dict) else {}
+    if isinstance(user_name, str):
+        state["user_name"] = user_name
+
+    await _run_save_script(
+        redis_client, session_id, state["state_name"], state["partial_parameters"],
+        settings.CONVERSATION_STATE_TTL_SECONDS, state["user_name"]
+    )
+    # Las claves antiguas no comparten slot con el hash (ni entre sí): se borran una a una, fuera del script.
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for legacy_key in _get_legacy_state_keys(session_id):
+            pipe.delete(legacy_key)
+        await pipe.execute()
+    print(f"CONV_STATE: Estado antiguo de la sesión {session_id} migrado al hash.")
+    return state
+
+
+async def save_conversation_state_async(
+    redis_client: Optional[AsyncRedis],
+    session_id: str,
+    state_name: Optional[str],
+    partial_params: Optional[Dict[str, Any]],
+    ttl_seconds: int = settings.CONVERSATION_STATE_TTL_SECONDS
+) -> None:
+    """
+    (ASÍNCRONO) Guarda el estado de forma atómica (script Lua, un solo viaje).
+    `state_name=None` borra estado y parámetros; el 'user_name' que venga en
+    `partial_params` se guarda aparte con su propio TTL y nunca se borra aquí.
+    """
+    if not redis_client:
+        return
+    tool_params_to_save = partial_params.copy() if partial_params else {}
+    user_name_to_save = tool_params_to_save.pop("user_name", None)
+    try:
+        await _run_save_script(redis_client, session_id, state_name, tool_params_to_save, ttl_seconds, user_name_to_save)
+    except Exception as e:
+        print(f"CONV_STATE_ERROR: No se pudo guardar el estado de la sesión {session_id}: {e}")
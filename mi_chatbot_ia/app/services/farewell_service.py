@@ -0,0 +1,104 @@
+# app/services/farewell_service.py
+"""
+Despedidas por plantilla, sin llamar al LLM en el turno.
+
+Cada VirtualAgentProfile puede definir `farewell_templates_json`:
+    {"with_name": ["¡Hasta luego, {user_name}! ...", ...],
+     "without_name": ["¡Hasta luego! ...", ...]}
+Las claves que falten usan las plantillas por defecto. Las variantes se rotan
+(round-robin por agente) y `{user_name}` se sustituye por el nombre cacheado en la sesión.
+
+Las variantes generadas por LLM se precalculan fuera del turno (endpoint de
+administración) con `generate_farewell_variants_async` y se guardan en el perfil.
+"""
+import itertools
+import json
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from app.models.virtual_agent_profile import VirtualAgentProfile
+
+
+USER_NAME_PLACEHOLDER = "{user_name}"
+
+DEFAULT_FAREWELL_TEMPLATES: Dict[str, List[str]] = {
+    "with_name": [
+        "¡Hasta luego, {user_name}! Gracias por la conversación. Si tienes más dudas, aquí estaré. 😊",
+        "¡Fue un gusto ayudarte, {user_name}! Vuelve cuando quieras si necesitas algo más. 👋",
+        "¡Gracias a ti, {user_name}! Que tengas un excelente día. Si surge otra duda, escríbeme. 🌟",
+    ],
+    "without_name": [
+        "¡Hasta luego! Gracias por la conversación. Si tienes más dudas, aquí estaré. 😊",
+        "¡Fue un gusto ayudarte! Vuelve cuando quieras si necesitas algo más. 👋",
+        "¡Gracias a ti! Que tengas un excelente día. Si surge otra duda, escríbeme. 🌟",
+    ],
+}
+
+# Contadores de rotación por (vap_id, tipo de plantilla).
+_rotation_counters: Dict[Tuple[Optional[int], str], "itertools.count"] = {}
+
+
+def get_farewell_templates(vap: Optional[VirtualAgentProfile]) -> Dict[str, List[str]]:
+    """Plantillas efectivas: las del perfil reemplazan a las por defecto, clave por clave."""
+    templates = {key: list(values) for key, values in DEFAULT_FAREWELL_TEMPLATES.items()}
+    custom_templates = getattr(vap, "farewell_templates_json", None) if vap else None
+    if isinstance(custom_templates, dict):
+        for key, values in custom_templates.items():
+            if key in templates and isinstance(values, list):
+                valid = [str(v) for v in values if str(v).strip()]
+                if valid:
+                    templates[key] = valid
+    return templates
+
+
+def render_farewell(vap: Optional[VirtualAgentProfile], user_name: str) -> str:
+    """Siguiente despedida de la rotación del agente, personalizada si hay nombre."""
+    template_key = "with_name" if user_name else "without_name"
+    candidates = get_farewell_templates(vap)[template_key]
+    counter = _rotation_counters.setdefault((getattr(vap, "id", None), template_key), itertools.count())
+    template = candidates[next(counter) % len(candidates)]
+    # `replace` y no `format`: las plantillas pueden traer otras llaves (p. ej. generadas por LLM).
+    return template.replace(USER_NAME_PLACEHOLDER, user_name)
+
+
+# ==========================================================
+# ===     PRECÁLCULO DE VARIANTES (FUERA DEL TURNO)      ===
+# ==========================================================
+
+_FAREWELL_VARIANTS_PROMPT = (
+    "Eres {agent_name}. {agent_description}\n"
+    "Genera {count} despedidas cortas, amables y variadas para cuando el usuario termina la conversación. "
+    "Cada una debe agradecer la conversación, animar a volver si tiene más dudas y terminar con un emoji amigable.\n"
+    "Responde ÚNICAMENTE con un objeto JSON con dos listas:\n"
+    "- \"with_name\": despedidas que incluyan literalmente el marcador {{user_name}} donde va el nombre del usuario.\n"
+    "- \"without_name\": despedidas generales que no usen ningún nombre ni marcador.\n"
+    "JSON:"
+)
+
+
+async def generate_farewell_variants_async(llm: BaseChatModel, vap: VirtualAgentProfile, count: int = 5) -> Dict[str, List[str]]:
+    """
+    (ASÍNCRONO) Pide al LLM variantes de despedida para el agente y descarta las que no
+    respeten el marcador. Pensado para el endpoint de administración, no para el chat.
+    """
+    chain = ChatPromptTemplate.from_template(_FAREWELL_VARIANTS_PROMPT) | llm | JsonOutputParser()
+    result = await chain.ainvoke({
+        "agent_name": vap.name,
+        "agent_description": vap.user_provided_goal_description or vap.description or "",
+        "count": count,
+    })
+    if not isinstance(result, dict):
+        raise ValueError(f"Respuesta inesperada del LLM: {json.dumps(result, default=str)[:200]}")
+
+    with_name = [
+        str(v).strip() for v in result.get("with_name") or []
+        if USER_NAME_PLACEHOLDER in str(v)
+    ]
+    without_name = [
+        str(v).strip() for v in result.get("without_name") or []
+        if str(v).strip() and "{" not in str(v)
+    ]
+    return {"with_name": with_name[:count], "without_name": without_name[:count]}
@@ -0,0 +1,132 @@
+# app/services/greeting_cache_service.py
+"""
+Caché del saludo inicial (`__INICIAR_CHAT__`).
+
+El saludo solo depende del VirtualAgentProfile (`greeting_prompt`) y, casi nunca, del
+nombre del usuario. En páginas donde el widget se abre solo era una de las llamadas
+al LLM más frecuentes. Aquí se guarda, por agente, un pequeño POOL de variantes ya
+generadas (para conservar algo de variedad) y se sirve una al azar sin llamar al LLM.
+
+- Clave: `greeting_pool:{vap_id}:{hash del greeting_prompt}`. Si cambia el prompt,
+  cambia la clave: las variantes viejas dejan de usarse y caducan por TTL.
+- L1 en memoria delante de Redis (compartido entre workers).
+- Si el pool está incompleto o es más antiguo que `GREETING_POOL_REFRESH_SECONDS`,
+  se regenera en segundo plano; la petición actual no espera.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import time
+from typing import Optional, Dict, Any, List, Callable, Awaitable
+
+from redis.asyncio import Redis as AsyncRedis
+
+from app.config import settings
+from app.services.cache_service import TTLLRUCache
+
+
+GreetingGenerator = Callable[[], Awaitable[str]]
+
+_greeting_pools_l1 = TTLLRUCache(max_entries=256, ttl_seconds=settings.GREETING_POOL_L1_TTL_SECONDS)
+_greeting_stats: Dict[str, int] = {"hits": 0, "misses": 0, "background_generations": 0, "generation_errors": 0}
+# Claves con una regeneración en curso y referencias fuertes a sus tareas.
+_refreshing_keys: set = set()
+_background_tasks: set = set()
+
+
+def _get_pool_key(vap) -> str:
+    prompt_hash = hashlib.sha256((vap.greeting_prompt or "").encode()).hexdigest()[:16]
+    return f"greeting_pool:{vap.id}:{prompt_hash}"
+
+
+async def _load_pool(redis_client: Optional[AsyncRedis], pool_key: str) -> Optional[Dict[str, Any]]:
+    pool = _greeting_pools_l1.get(pool_key)
+    if pool is not None or not redis_client:
+        return pool
+    try:
+        raw = await redis_client.get(pool_key)
+    except Exception as e:
+        print(f"GREETING_CACHE_ERROR: No se pudo leer el pool '{pool_key}': {e}")
+        return None
+    if not raw:
+        return None
+    try:
+        pool = json.loads(raw)
+    except ValueError:
+        return None
+    _greeting_pools_l1.set(pool_key, pool)
+    return pool
+
+
+async def _store_pool(redis_client: Optional[AsyncRedis], pool_key: str, variants: List[str]) -> None:
+    pool = {"variants": variants[-settings.GREETING_POOL_SIZE:], "generated_at": time.time()}
+    _greeting_pools_l1.set(pool_key, pool)
+    if not redis_client:
+        return
+    try:
+        await redis_client.set(pool_key, json.dumps(pool, ensure_ascii=False), ex=settings.GREETING_POOL_TTL_SECONDS)
+    except Exception as e:
+        print(f"GREETING_CACHE_ERROR: No se pudo guardar el pool '{pool_key}': {e}")
+
+
+def _needs_refresh(pool: Dict[str, Any]) -> bool:
+    if len(pool.get("variants") or []) < settings.GREETING_POOL_SIZE:
+        return True
+    return time.time() - pool.get("generated_at", 0) > settings.GREETING_POOL_REFRESH_SECONDS
+
+
+async def _refresh_pool(redis_client: Optional[AsyncRedis], pool_key: str, generate: GreetingGenerator, seed: List[str]) -> None:
+    """Completa (o renueva) el pool hasta GREETING_POOL_SIZE variantes y lo reemplaza de una vez."""
+    try:
+        missing = settings.GREETING_POOL_SIZE - len(seed)
+        # Pool completo pero viejo: se regenera entero.
+        base = seed if missing > 0 else []
+        to_generate = missing if missing > 0 else settings.GREETING_POOL_SIZE
+        results = await asyncio.gather(*(generate() for _ in range(to_generate)), return_exceptions=True)
+        new_variants = [r.strip() for r in results if isinstance(r, str) and r.strip()]
+        _greeting_stats["background_generations"] += len(new_variants)
+        _greeting_stats["generation_errors"] += len(results) - len(new_variants)
+        if new_variants:
+            await _store_pool(redis_client, pool_key, base + new_variants)
+            print(f"GREETING_CACHE: Pool '{pool_key}' actualizado ({len(base) + len(new_variants)} variantes).")
+    except Exception as e:
+        print(f"GREETING_CACHE_ERROR: Falló la regeneración del pool '{pool_key}': {e}")
+    finally:
+        _refreshing_keys.discard(pool_key)
+
+
+def _schedule_refresh(redis_client: Optional[AsyncRedis], pool_key: str, generate: GreetingGenerator, seed: List[str]) -> None:
+    if pool_key in _refreshing_keys:
+        return
+    _refreshing_keys.add(pool_key)
+    task = asyncio.create_task(_refresh_pool(redis_client, pool_key, generate, seed))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def get_greeting_async(redis_client: Optional[AsyncRedis], vap, generate: GreetingGenerator) -> str:
+    """
+    (ASÍNCRONO) Devuelve un saludo del pool del agente. Solo si el pool está vacío se
+    espera al LLM (`generate`); completar o renovar el pool ocurre en segundo plano.
+    """
+    pool_key = _get_pool_key(vap)
+    pool = await _load_pool(redis_client, pool_key)
+    variants = list((pool or {}).get("variants") or [])
+
+    if variants:
+        _greeting_stats["hits"] += 1
+        if _needs_refresh(pool):
+            _schedule_refresh(redis_client, pool_key, generate, variants)
+        return random.choice(variants)
+
+    _greeting_stats["misses"] += 1
+    greeting = await generate()
+    if greeting and greeting.strip():
+        await _store_pool(redis_client, pool_key, [greeting.strip()])
+        _schedule_refresh(redis_client, pool_key, generate, [greeting.strip()])
+    return greeting
+
+
+def get_greeting_cache_stats() -> Dict[str, int]:
+    return {**_greeting_stats, "pools_in_memory": len(_greeting_pools_l1)}
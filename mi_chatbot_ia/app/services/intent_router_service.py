@@ -0,0 +1,156 @@
+# app/services/intent_router_service.py
+"""
+Enrutador de intención LOCAL basado en embeddings (MiniLM ya cargado en AppState).
+
+Clasifica la pregunta entre las herramientas del `master_router_agent` comparándola
+con frases de ejemplo etiquetadas. Los ejemplos tienen valores por defecto y se pueden
+personalizar por VirtualAgentProfile (`intent_router_examples_json`). Sus embeddings
+se calculan una sola vez por versión del perfil (id + updated_at).
+
+Si la diferencia entre las dos mejores clases (margen) es menor que
+`INTENT_ROUTER_MIN_MARGIN`, el llamador debe recurrir al LLM.
+"""
+import asyncio
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List, Tuple
+
+import numpy as np
+
+from app.models.virtual_agent_profile import VirtualAgentProfile
+
+
+ROUTER_LABELS = ("DOCUMENT_RETRIEVER", "DATABASE_TOOL", "FAREWELL_HANDLER")
+
+DEFAULT_ROUTER_EXAMPLES: Dict[str, List[str]] = {
+    "DOCUMENT_RETRIEVER": [
+        "¿cómo accedo a mi intranet?",
+        "explícame sobre blackboard",
+        "quiero saber sobre los horarios de atención",
+        "me puedes dar un resumen de lo que sabes",
+        "¿cuál es el reglamento de evaluación?",
+        "¿cómo solicito un certificado de estudios?",
+        "¿qué requisitos necesito para matricularme?",
+        "¿dónde encuentro el calendario académico?",
+    ],
+    "DATABASE_TOOL": [
+        "quiero saber mis notas",
+        "¿cuál es mi promedio?",
+        "dame mi horario",
+        "¿cuántos créditos llevo aprobados?",
+        "¿qué cursos tengo matriculados este ciclo?",
+        "muéstrame mi nota final del curso",
+        "¿cuánto debo de pensión?",
+        "¿cuál es mi asistencia en el curso?",
+    ],
+    "FAREWELL_HANDLER": [
+        "gracias",
+        "eso es todo por ahora",
+        "adiós",
+        "muchas gracias por tu ayuda",
+        "hasta luego",
+        "ya no necesito nada más",
+        "chao, nos vemos",
+    ],
+}
+
+
+@dataclass(frozen=True, slots=True)
+class RouterDecision:
+    label: str
+    confidence: float
+    margin: float
+    scores: Dict[str, float]
+
+    def as_log(self) -> Dict[str, Any]:
+        return {
+            "embedding_label": self.label,
+            "embedding_confidence": round(self.confidence, 4),
+            "embedding_margin": round(self.margin, 4),
+            "embedding_scores": {k: round(v, 4) for k, v in self.scores.items()},
+        }
+
+
+# (vap_id, updated_at) -> {label: matriz de embeddings normalizados}
+_label_matrices_cache: Dict[Tuple[Any, Any], Dict[str, np.ndarray]] = {}
+_MAX_CACHED_PROFILES = 256
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def get_router_examples(vap: Optional[VirtualAgentProfile]) -> Dict[str, List[str]]:
+    """Ejemplos efectivos: los del perfil reemplazan a los por defecto, etiqueta por etiqueta."""
+    examples = {label: list(phrases) for label, phrases in DEFAULT_ROUTER_EXAMPLES.items()}
+    custom_examples = getattr(vap, "intent_router_examples_json", None) if vap else None
+    if isinstance(custom_examples, dict):
+        for label, phrases in custom_examples.items():
+            if label in ROUTER_LABELS and isinstance(phrases, list) and phrases:
+                examples[label] = [str(p) for p in phrases if str(p).strip()]
+    return examples
+
+
+async def _get_label_matrices(embedding_model, vap: Optional[VirtualAgentProfile]) -> Dict[str, np.ndarray]:
+    cache_key = (getattr(vap, "id", None), getattr(vap, "updated_at", None))
+    cached = _label_matrices_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    examples = get_router_examples(vap)
+    flat_phrases = [phrase for label in ROUTER_LABELS for phrase in examples.get(label, [])]
+    vectors = await asyncio.to_thread(embedding_model.embed_documents, flat_phrases)
+    matrix = _normalize_rows(np.asarray(vectors, dtype=np.float32))
+
+    label_matrices: Dict[str, np.ndarray] = {}
+    offset = 0
+    for label in ROUTER_LABELS:
+        count = len(examples.get(label, []))
+        if count:
+            label_matrices[label] = matrix[offset:offset + count]
+        offset += count
+
+    if len(_label_matrices_cache) >= _MAX_CACHED_PROFILES:
+        _label_matrices_cache.clear()
+    _label_matrices_cache[cache_key] = label_matrices
+    print(f"INTENT_ROUTER: Embeddings de {len(flat_phrases)} ejemplos calculados para el perfil {cache_key[0]}.")
+    return label_matrices
+
+
+async def classify_async(
+    embedding_model,
+    question: str,
+    vap: Optional[VirtualAgentProfile],
+    candidate_labels: Tuple[str, ...] = ROUTER_LABELS
+) -> Optional[RouterDecision]:
+    """
+    (ASÍNCRONO) Clasifica la pregunta. La puntuación de cada clase es la similitud coseno
+    con su ejemplo más cercano. Devuelve None si no se pudo clasificar.
+    """
+    if embedding_model is None:
+        return None
+    try:
+        label_matrices = await _get_label_matrices(embedding_model, vap)
+        raw_vector = await asyncio.to_thread(embedding_model.embed_query, question)
+    except Exception as e:
+        print(f"INTENT_ROUTER_ERROR: Fallo al calcular embeddings: {e}")
+        return None
+
+    vector = np.asarray(raw_vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    if not norm:
+        return None
+    vector = vector / norm
+
+    scores = {
+        label: float(np.max(label_matrices[label] @ vector))
+        for label in candidate_labels if label in label_matrices
+    }
+    if not scores:
+        return None
+
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    best_label, best_score = ranked[0]
+    margin = best_score - ranked[1][1] if len(ranked) > 1 else best_score
+    return RouterDecision(label=best_label, confidence=best_score, margin=margin, scores=scores)
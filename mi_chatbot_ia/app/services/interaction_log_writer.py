@@ -0,0 +1,199 @@
+# app/services/interaction_log_writer.py
+"""
+Escritor de logs de interacción en segundo plano.
+
+Antes cada respuesta del chat esperaba, dentro de su `finally`, un INSERT + COMMIT +
+SELECT (refresh) del log. Ahora el chat solo encola el diccionario del log en una cola
+acotada en memoria y una tarea de fondo lo escribe por lotes (INSERT multi-fila) cuando:
+  - el lote llega a `INTERACTION_LOG_BATCH_SIZE`, o
+  - pasan `INTERACTION_LOG_FLUSH_INTERVAL_SECONDS` desde el primer log del lote.
+
+Al apagar la aplicación (lifespan) la cola se vacía antes de cerrar el pool de BD.
+Si la cola se llena se aplica `INTERACTION_LOG_OVERFLOW_POLICY` y se cuenta en las
+estadísticas (descartados / retrasados).
+"""
+import asyncio
+import time
+from typing import Optional, Dict, Any, List
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import settings
+from app.crud.crud_interaction_log import create_interaction_logs_bulk_async
+
+
+OVERFLOW_POLICIES = ("drop_newest", "drop_oldest", "block")
+
+_STOP = object()  # Centinela que indica al bucle de escritura que debe terminar.
+
+
+class InteractionLogWriter:
+    """Cola acotada + tarea de fondo que escribe los logs por lotes."""
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        max_queue_size: int = settings.INTERACTION_LOG_QUEUE_MAX_SIZE,
+        batch_size: int = settings.INTERACTION_LOG_BATCH_SIZE,
+        flush_interval_seconds: float = settings.INTERACTION_LOG_FLUSH_INTERVAL_SECONDS,
+        overflow_policy: str = settings.INTERACTION_LOG_OVERFLOW_POLICY
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            print(f"INTERACTION_LOG_WRITER: Política '{overflow_policy}' desconocida. Usando 'drop_oldest'.")
+            overflow_policy = "drop_oldest"
+        self._session_factory = session_factory
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, max_queue_size))
+        self._batch_size = max(1, batch_size)
+        self._flush_interval = max(0.01, flush_interval_seconds)
+        self._overflow_policy = overflow_policy
+        self._task: Optional[asyncio.Task] = None
+        self._stats: Dict[str, int] = {
+            "enqueued": 0, "written": 0, "dropped": 0, "delayed": 0,
+            "batches": 0, "failed_batches": 0, "failed_logs": 0
+        }
+
+    # --- Ciclo de vida ---
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            print(f"INTERACTION_LOG_WRITER: Iniciado (lote={self._batch_size}, intervalo={self._flush_interval}s, "
+                  f"cola={self._queue.maxsize}, política='{self._overflow_policy}').")
+
+    async def stop(self, timeout_seconds: float = settings.INTERACTION_LOG_SHUTDOWN_TIMEOUT_SECONDS) -> None:
+        """Termina el bucle de fondo y escribe todo lo que quede en la cola."""
+        if self._task is None:
+            return
+        # El bucle sigue consumiendo, así que el centinela siempre acaba entrando en la cola.
+        await self._queue.put(_STOP)
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout_seconds)
+        except asyncio.TimeoutError:
+            print("INTERACTION_LOG_WRITER_WARN: Tiempo de drenado agotado; cancelando la tarea de fondo.")
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+        # Logs encolados después del centinela (peticiones que terminaron durante el apagado).
+        remaining = self._drain_nowait()
+        for i in range(0, len(remaining), self._batch_size):
+            await self._flush(remaining[i:i + self._batch_size])
+        print(f"INTERACTION_LOG_WRITER: Detenido. Estadísticas: {self.get_stats()}")
+
+    # --- API para el chat ---
+
+    async def submit(self, log_data: Dict[str, Any]) -> None:
+        """Encola un log. No espera a la BD; solo puede esperar con la política 'block'."""
+        self._stats["enqueued"] += 1
+        try:
+            self._queue.put_nowait(log_data)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        if self._overflow_policy == "drop_newest":
+            self._record_drop()
+            return
+
+        if self._overflow_policy == "drop_oldest":
+            try:
+                dropped = self._queue.get_nowait()
+                self._queue.task_done()
+                if dropped is _STOP:
+                    # Nunca descartamos el centinela: lo reponemos y descartamos el nuevo log.
+                    self._queue.put_nowait(_STOP)
+                    self._record_drop()
+                    return
+                self._record_drop()
+            except asyncio.QueueEmpty:
+                pass
+            try:
+                self._queue.put_nowait(log_data)
+            except asyncio.QueueFull:
+                self._record_drop()
+            return
+
+        # "block": la respuesta espera un poco a que el escritor libere hueco.
+        self._stats["delayed"] += 1
+        try:
+            await asyncio.wait_for(self._queue.put(log_data), timeout=settings.INTERACTION_LOG_BLOCK_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            self._record_drop()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "queue_size": self._queue.qsize(),
+            "queue_max_size": self._queue.maxsize,
+            "overflow_policy": self._overflow_policy,
+            "running": self._task is not None and not self._task.done(),
+        }
+
+    # --- Internos ---
+
+    def _record_drop(self) -> None:
+        self._stats["dropped"] += 1
+        # Avisamos en la primera pérdida y luego cada 100 para no inundar los logs.
+        if self._stats["dropped"] == 1 or self._stats["dropped"] % 100 == 0:
+            print(f"INTERACTION_LOG_WRITER_WARN: Cola llena. Logs descartados hasta ahora: {self._stats['dropped']}.")
+
+    def _drain_nowait(self) -> List[Dict[str, Any]]:
+        items: List[Dict[str, Any]] = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return items
+            self._queue.task_done()
+            if item is not _STOP:
+                items.append(item)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await self._queue.get()
+            self._queue.task_done()
+            if first is _STOP:
+                return
+
+            batch = [first]
+            stop_requested = False
+            deadline = loop.time() + self._flush_interval
+            while len(batch) < self._batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    break
+                self._queue.task_done()
+                if item is _STOP:
+                    stop_requested = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+            if stop_requested:
+                return
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        if not batch:
+            return
+        start = time.perf_counter()
+        try:
+            async with self._session_factory() as db:
+                written = await create_interaction_logs_bulk_async(db, batch)
+            self._stats["written"] += written
+            self._stats["batches"] += 1
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if elapsed_ms > 500:
+                print(f"INTERACTION_LOG_WRITER_WARN: Lote de {written} logs tardó {elapsed_ms:.0f} ms.")
+        except Exception as e:
+            # No reintentamos: un lote con un log inválido bloquearía la cola indefinidamente.
+            self._stats["failed_batches"] += 1
+            self._stats["failed_logs"] += len(batch)
+            print(f"INTERACTION_LOG_WRITER_ERROR: No se pudo escribir un lote de {len(batch)} logs: {e}")
@@ -0,0 +1,236 @@
+# app/services/llm_adapter_cache.py
+"""
+Caché acotada de adaptadores LangChain (`get_langchain_llm_adapter`).
+
+Antes era un dict sin límite en AppState con clave `llm_{id}_temp_{t}`: nunca expulsaba
+nada y no se enteraba de que un admin había editado el LLMModelConfig (API key, modelo,
+base_url), así que el cliente viejo seguía en uso hasta reiniciar. Ahora:
+
+- Clave: (config id, config updated_at, temperatura, max_tokens override). Editar el
+  config cambia su `updated_at`, así que ninguna petición vuelve a usar el adaptador viejo.
+- LRU con TTL (`LLM_ADAPTER_CACHE_MAX_ENTRIES` / `LLM_ADAPTER_CACHE_TTL_SECONDS`).
+- `invalidate_config(id)` (la llama `crud_llm_model_config` al actualizar o borrar)
+  libera enseguida los adaptadores del config en este proceso.
+- `prewarm_async` construye al arrancar los LLM (con respaldos) de todos los clientes API activos.
+- `get_resilient_llm` compone, sobre esos adaptadores, el circuit breaker de cada config
+  y la cadena de failover (`fallback_config_ids`). La composición también se cachea para
+  que el `prompt_registry` (que identifica al LLM por su id) siga acertando.
+- Con `step` (paso del pipeline: routing, extraction, condense, answer) el adaptador se
+  envuelve en `StepTimedRunnable`, que registra la latencia de cada llamada por paso y modelo.
+- `describe_llm` dice qué modelo(s) y temperatura hay detrás de un adaptador ya entregado
+  (lo usa la memoización de sub-llamadas, que solo recibe el objeto).
+"""
+import time
+from typing import Optional, Dict, Any, Sequence, Iterator, AsyncIterator
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.runnables import Runnable, RunnableConfig
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.config import settings
+from app.services.cache_service import TTLLRUCache
+from app.services.metrics_service import record_stage, observe_llm_step
+
+
+_adapters = TTLLRUCache(
+    max_entries=settings.LLM_ADAPTER_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.LLM_ADAPTER_CACHE_TTL_SECONDS
+)
+_resilient_llms = TTLLRUCache(
+    max_entries=settings.LLM_ADAPTER_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.LLM_ADAPTER_CACHE_TTL_SECONDS
+)
+# id(llm) -> (llm, descripción, ids de config). Guardar el objeto impide que su id se reutilice mientras viva la entrada.
+_llm_identities = TTLLRUCache(
+    max_entries=settings.LLM_ADAPTER_CACHE_MAX_ENTRIES * 2,
+    ttl_seconds=settings.LLM_ADAPTER_CACHE_TTL_SECONDS
+)
+_adapter_stats: Dict[str, int] = {"hits": 0, "builds": 0, "invalidations": 0}
+
+
+def _get_cache_key(model_config, temperature: float, max_tokens_override: Optional[int]):
+    return (model_config.id, getattr(model_config, "updated_at", None), round(temperature, 2), max_tokens_override)
+
+
+def _remember_identity(llm, chain_configs: Sequence, temperature: float, max_tokens_override: Optional[int]) -> None:
+    _llm_identities.set(id(llm), (llm, {
+        # Incluye los respaldos: una respuesta pudo venir de cualquiera de la cadena.
+        "model": "|".join(f"{config.id}:{config.model_identifier}" for config in chain_configs),
+        "temperature": round(temperature, 2),
+        "max_tokens": max_tokens_override,
+    }, {config.id for config in chain_configs}))
+
+
+def describe_llm(llm) -> Optional[Dict[str, Any]]:
+    """Modelo(s), temperatura y max_tokens de un adaptador entregado por esta caché (o None)."""
+    entry = _llm_identities.get(id(llm))
+    return entry[1] if entry is not None and entry[0] is llm else None
+
+
+def get_adapter(model_config, temperature: float, max_tokens_override: Optional[int] = None) -> BaseChatModel:
+    """Devuelve el adaptador para (config, temperatura, max_tokens); lo construye si no existe."""
+    # Import local: el adaptador arrastra todos los SDK de proveedores.
+    from app.llm_integrations import langchain_llm_adapter
+
+    key = _get_cache_key(model_config, temperature, max_tokens_override)
+    entry = _adapters.get(key)
+    if entry is not None:
+        _adapter_stats["hits"] += 1
+        _remember_identity(entry[1], [model_config], temperature, max_tokens_override)
+        return entry[1]
+
+    print(f"LLM_CACHE_MISS: Creando nueva instancia de '{model_config.display_name}' con Temp {temperature:.2f}.")
+    adapter_instance: BaseChatModel = langchain_llm_adapter.get_langchain_llm_adapter(
+        config=model_config,
+        temperature_to_use=temperature,
+        max_tokens_override=max_tokens_override
+    )
+    # Se guarda el id del config junto al adaptador para poder invalidar por config.
+    _adapters.set(key, (model_config.id, adapter_instance))
+    _adapter_stats["builds"] += 1
+    _remember_identity(adapter_instance, [model_config], temperature, max_tokens_override)
+    return adapter_instance
+
+
+class StepTimedRunnable(Runnable):
+    """Mide cada llamada de un paso del pipeline: etapa `llm_step_{paso}` del turno e histograma por modelo."""
+
+    def __init__(self, bound: Runnable, step: str, model: str):
+        self.bound = bound
+        self.step = step
+        self.model = model
+
+    def _record(self, start: float) -> None:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        record_stage(f"llm_step_{self.step}", elapsed_ms)
+        observe_llm_step(self.step, self.model, elapsed_ms)
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return self.bound.invoke(input, config, **kwargs)
+        finally:
+            self._record(start)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return await self.bound.ainvoke(input, config, **kwargs)
+        finally:
+            self._record(start)
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[Any]:
+        start = time.perf_counter()
+        try:
+            yield from self.bound.stream(input, config, **kwargs)
+        finally:
+            self._record(start)
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AsyncIterator[Any]:
+        start = time.perf_counter()
+        try:
+            async for chunk in self.bound.astream(input, config, **kwargs):
+                yield chunk
+        finally:
+            self._record(start)
+
+
+def get_resilient_llm(
+    model_config, temperature: float, max_tokens_override: Optional[int] = None,
+    fallback_configs: Sequence = (), step: Optional[str] = None
+) -> Runnable:
+    """
+    Adaptador principal con su circuit breaker y, si hay, `.with_fallbacks` hacia los
+    adaptadores (también protegidos) de `fallback_configs`, en orden. Con `step`, además,
+    medido por paso del pipeline.
+    """
+    from app.services.circuit_breaker_service import CircuitBreakerRunnable, get_breaker
+
+    if step is None and not settings.LLM_CIRCUIT_BREAKER_ENABLED and not fallback_configs:
+        return get_adapter(model_config, temperature, max_tokens_override)
+
+    chain_configs = [model_config, *fallback_configs]
+    key = (step, *(_get_cache_key(config, temperature, max_tokens_override) for config in chain_configs))
+    entry = _resilient_llms.get(key)
+    if entry is not None:
+        _remember_identity(entry[1], chain_configs, temperature, max_tokens_override)
+        return entry[1]
+
+    guarded: list = []
+    for index, config in enumerate(chain_configs):
+        try:
+            adapter = get_adapter(config, temperature, max_tokens_override)
+        except Exception as e:
+            if index == 0:
+                raise
+            # Un respaldo mal configurado no debe tumbar al principal: se omite.
+            print(f"LLM_CACHE_WARNING: Se omite el respaldo '{config.display_name}': {e}")
+            continue
+        guarded.append(CircuitBreakerRunnable(adapter, get_breaker(config)) if settings.LLM_CIRCUIT_BREAKER_ENABLED else adapter)
+
+    resilient_llm = guarded[0].with_fallbacks(guarded[1:]) if len(guarded) > 1 else guarded[0]
+    if step is not None:
+        resilient_llm = StepTimedRunnable(resilient_llm, step, model_config.display_name)
+    _resilient_llms.set(key, ({config.id for config in chain_configs}, resilient_llm))
+    _remember_identity(resilient_llm, chain_configs, temperature, max_tokens_override)
+    return resilient_llm
+
+
+def invalidate_config(model_config_id: Optional[int] = None) -> int:
+    """Descarta los adaptadores de un config (o todos con `None`). Devuelve cuántos borró."""
+    if model_config_id is None:
+        removed = len(_adapters)
+        _adapters.clear()
+        _resilient_llms.clear()
+        _llm_identities.clear()
+    else:
+        removed = _adapters.delete_where(lambda entry: entry[0] == model_config_id)
+        _resilient_llms.delete_where(lambda entry: model_config_id in entry[0])
+        _llm_identities.delete_where(lambda entry: model_config_id in entry[2])
+    _adapter_stats["invalidations"] += removed
+    if removed:
+        print(f"LLM_CACHE: {removed} adaptador(es) invalidados ({'todos' if model_config_id is None else f'config {model_config_id}'}).")
+    return removed
+
+
+async def prewarm_async(session_factory: async_sessionmaker) -> int:
+    """
+    (ASÍNCRONO) Compila la configuración de cada cliente API activo (misma resolución que el
+    chat: override del cliente, LLM del agente o el LLM por defecto del contexto) y construye
+    el LLM resiliente de cada paso de cada vista (`step_llms`, con sus respaldos), con las
+    mismas claves que pedirá `get_resilient_llm(step=...)`, para que la primera petición
+    no pague la construcción.
+    Devuelve cuántos LLM distintos quedaron listos. Los errores se registran y no impiden el arranque.
+    """
+    from sqlalchemy import select
+    from app.models.api_client import ApiClient
+    from app.services import tenant_config_service
+
+    async with session_factory() as db:
+        clients = (await db.execute(select(ApiClient).where(ApiClient.is_active == True))).scalars().all()
+
+    warmed = set()
+    for client in clients:
+        try:
+            compiled = await tenant_config_service.get_compiled_tenant_config(session_factory, client)
+        except Exception as e:
+            print(f"LLM_CACHE_WARNING: No se pudo compilar la configuración del cliente API '{client.name}': {e}")
+            continue
+        for view in (compiled.public_view, compiled.authenticated_view):
+            if view is None:
+                continue
+            # Cada paso con su LLM (propio o el principal), temperatura y max_tokens ya resueltos.
+            for step, step_llm in view.step_llms.items():
+                try:
+                    warmed.add(id(get_resilient_llm(
+                        step_llm.llm_config, step_llm.temperature, step_llm.max_tokens_override,
+                        step_llm.fallback_llm_configs, step=step
+                    )))
+                except Exception as e:
+                    print(f"LLM_CACHE_WARNING: No se pudo precalentar el LLM '{step_llm.llm_config.display_name}' "
+                          f"(paso '{step}') del agente '{view.vap.name}': {e}")
+    return len(warmed)
+
+
+def get_adapter_cache_stats() -> Dict[str, Any]:
+    return {**_adapter_stats, "entries": len(_adapters), "max_entries": _adapters.max_entries}
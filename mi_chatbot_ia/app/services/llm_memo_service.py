@@ -0,0 +1,143 @@
+# app/services/llm_memo_service.py
+"""
+Memoización (opcional) de sub-llamadas deterministas al LLM.
+
+El enrutador (`_llm_router`), el clasificador nombre/consulta, la extracción de nombre y
+consulta y la extracción de parámetros de `sql_tools` son, a temperatura baja, funciones
+puras de su prompt: la misma entrada da la misma salida. Aun así cada turno iba al
+proveedor. Aquí el tramo `llm | parser` de esas cadenas se envuelve así:
+
+    prompt | llm_memo_service.memoize("router", llm, llm | JsonOutputParser())
+
+- Clave: (call site, modelo(s) del adaptador, temperatura, sha256 del prompt renderizado).
+- L1 en memoria (`TTLLRUCache`) delante de Redis (L2), como la caché de respuestas.
+- TTL por call site (`LLM_MEMO_TTL_SECONDS`, con `LLM_MEMO_DEFAULT_TTL_SECONDS` de respaldo).
+- Solo se activa con `LLM_MEMO_ENABLED` y si la temperatura efectiva del adaptador es
+  <= `LLM_MEMO_MAX_TEMPERATURE`; si no, `memoize` devuelve la cadena sin envolver.
+- Se guarda la salida YA parseada: si el parser falla no se memoiza nada.
+"""
+import hashlib
+import json
+from typing import Optional, Dict, Any
+
+from langchain_core.runnables import Runnable, RunnableConfig
+from redis.asyncio import Redis as AsyncRedis
+
+from app.config import settings
+from app.services.cache_service import TTLLRUCache
+from app.services import llm_adapter_cache
+
+
+_redis_client: Optional[AsyncRedis] = None
+_memo_l1 = TTLLRUCache(
+    max_entries=settings.LLM_MEMO_L1_MAX_ENTRIES,
+    ttl_seconds=settings.LLM_MEMO_DEFAULT_TTL_SECONDS
+)
+_memo_stats: Dict[str, int] = {"l1_hits": 0, "l2_hits": 0, "misses": 0, "sets": 0, "ineligible_chains": 0}
+
+
+def set_redis_client(redis_client: Optional[AsyncRedis]) -> None:
+    """Lo llama AppState al arrancar; sin Redis la memoización queda solo en L1."""
+    global _redis_client
+    _redis_client = redis_client
+
+
+def _get_ttl_seconds(call_site: str) -> int:
+    return settings.LLM_MEMO_TTL_SECONDS.get(call_site, settings.LLM_MEMO_DEFAULT_TTL_SECONDS)
+
+
+def _render_prompt(prompt_value: Any) -> str:
+    """Texto exacto que recibe el modelo (roles incluidos en los prompts de chat)."""
+    if hasattr(prompt_value, "to_messages"):
+        return "\n".join(f"{message.type}: {message.content}" for message in prompt_value.to_messages())
+    if hasattr(prompt_value, "to_string"):
+        return prompt_value.to_string()
+    return json.dumps(prompt_value, sort_keys=True, default=str) if not isinstance(prompt_value, str) else prompt_value
+
+
+class MemoizedRunnable(Runnable):
+    """Envuelve `llm | parser`: consulta L1/L2 por el prompt renderizado antes de invocar."""
+
+    def __init__(self, call_site: str, bound: Runnable, model: str, temperature: float):
+        self.call_site = call_site
+        self.bound = bound
+        self.model = model
+        self.temperature = temperature
+
+    def _get_cache_key(self, prompt_value: Any) -> str:
+        prompt_hash = hashlib.sha256(_render_prompt(prompt_value).encode()).hexdigest()
+        key_material = f"{self.model}:{self.temperature}:{prompt_hash}"
+        return f"llm_memo:v1:{self.call_site}:{hashlib.sha256(key_material.encode()).hexdigest()}"
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        # Ruta síncrona (no la usa el chat): solo L1, Redis es asíncrono.
+        cache_key = self._get_cache_key(input)
+        cached_value = _memo_l1.get(cache_key)
+        if cached_value is not None:
+            _memo_stats["l1_hits"] += 1
+            return cached_value
+        _memo_stats["misses"] += 1
+        result = self.bound.invoke(input, config, **kwargs)
+        self._store_l1(cache_key, result)
+        return result
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        cache_key = self._get_cache_key(input)
+        cached_value = _memo_l1.get(cache_key)
+        if cached_value is not None:
+            _memo_stats["l1_hits"] += 1
+            return cached_value
+
+        if _redis_client:
+            try:
+                cached_json = await _redis_client.get(cache_key)
+                if cached_json:
+                    cached_value = json.loads(cached_json)
+                    _memo_l1.set(cache_key, cached_value, ttl_seconds=_get_ttl_seconds(self.call_site))
+                    _memo_stats["l2_hits"] += 1
+                    return cached_value
+            except Exception as e:
+                print(f"LLM_MEMO_ERROR: Error al leer de Redis ('{self.call_site}'): {e}")
+
+        _memo_stats["misses"] += 1
+        result = await self.bound.ainvoke(input, config, **kwargs)
+        if self._store_l1(cache_key, result) and _redis_client:
+            try:
+                await _redis_client.set(cache_key, json.dumps(result), ex=_get_ttl_seconds(self.call_site))
+            except Exception as e:
+                print(f"LLM_MEMO_ERROR: Error al escribir en Redis ('{self.call_site}'): {e}")
+        return result
+
+    def _store_l1(self, cache_key: str, result: Any) -> bool:
+        """Solo se memoizan salidas JSON-serializables y no vacías."""
+        if result is None or result == {} or result == "":
+            return False
+        try:
+            json.dumps(result)
+        except (TypeError, ValueError):
+            return False
+        _memo_l1.set(cache_key, result, ttl_seconds=_get_ttl_seconds(self.call_site))
+        _memo_stats["sets"] += 1
+        return True
+
+
+def memoize(call_site: str, llm, runnable: Runnable) -> Runnable:
+    """
+    Devuelve `runnable` (normalmente `llm | parser`) memoizado si `llm` es elegible;
+    si no, lo devuelve tal cual. Pensado para usarse dentro de los `build` del prompt_registry.
+    """
+    if not settings.LLM_MEMO_ENABLED:
+        return runnable
+    identity = llm_adapter_cache.describe_llm(llm)
+    if identity is None or identity["temperature"] > settings.LLM_MEMO_MAX_TEMPERATURE:
+        _memo_stats["ineligible_chains"] += 1
+        return runnable
+    return MemoizedRunnable(call_site, runnable, identity["model"], identity["temperature"])
+
+
+def get_memo_stats() -> Dict[str, Any]:
+    stats: Dict[str, Any] = dict(_memo_stats)
+    lookups = stats["l1_hits"] + stats["l2_hits"] + stats["misses"]
+    stats["l1_size"] = len(_memo_l1)
+    stats["hit_ratio"] = round((stats["l1_hits"] + stats["l2_hits"]) / lookups, 4) if lookups else 0.0
+    return stats
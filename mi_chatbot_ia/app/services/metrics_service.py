@@ -0,0 +1,147 @@
+# app/services/metrics_service.py
+"""
+Desglose de latencia por etapa de cada turno de chat y exportación en formato Prometheus.
+
+- `stage_timer("retrieve")` mide una etapa (auth, carga de configuración, historial,
+  enrutado, recuperación, llamadas al LLM, herramienta SQL, persistencia...). Las
+  mediciones se acumulan en un dict por petición guardado en un ContextVar, así que
+  funcionan a través de `await`, `asyncio.gather` y tareas hijas sin pasar nada a mano.
+- Al terminar el turno el desglose se guarda en `interaction_logs.stage_timings_ms` y
+  se agrega en histogramas en memoria que se publican en `GET /metrics`.
+
+Los histogramas son por proceso (gunicorn -w 1): no se necesita `prometheus_client`.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, List, Tuple
+
+
+# Límites de los buckets en milisegundos.
+LATENCY_BUCKETS_MS: Tuple[float, ...] = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+_stage_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("stage_timings", default=None)
+
+
+# ==========================================================
+# ===              MEDICIÓN POR PETICIÓN                 ===
+# ==========================================================
+
+def start_turn_timings() -> Dict[str, float]:
+    """
+    Devuelve el dict de tiempos de la petición actual, creándolo si no existe.
+    Se reutiliza el creado por la autenticación (dependencia), que corre en el mismo contexto.
+    """
+    timings = _stage_timings.get()
+    if timings is None:
+        timings = {}
+        _stage_timings.set(timings)
+    return timings
+
+def get_turn_timings() -> Dict[str, float]:
+    return _stage_timings.get() or {}
+
+def record_stage(stage: str, elapsed_ms: float) -> None:
+    """Suma `elapsed_ms` a la etapa (una etapa puede ejecutarse varias veces por turno)."""
+    timings = start_turn_timings()
+    timings[stage] = round(timings.get(stage, 0.0) + elapsed_ms, 2)
+
+@contextmanager
+def stage_timer(stage: str):
+    """`with stage_timer("retrieve"): ...` — válido también alrededor de `await`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, (time.perf_counter() - start) * 1000)
+
+
+# ==========================================================
+# ===                 HISTOGRAMAS                        ===
+# ==========================================================
+
+class _Histogram:
+    __slots__ = ("bucket_counts", "count", "total")
+
+    def __init__(self):
+        self.bucket_counts: List[int] = [0] * len(LATENCY_BUCKETS_MS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value_ms: float) -> None:
+        self.count += 1
+        self.total += value_ms
+        for i, upper_bound in enumerate(LATENCY_BUCKETS_MS):
+            if value_ms <= upper_bound:
+                self.bucket_counts[i] += 1
+                break
+
+    def render(self, metric_name: str, labels: str) -> List[str]:
+        lines: List[str] = []
+        cumulative = 0
+        for upper_bound, bucket_count in zip(LATENCY_BUCKETS_MS, self.bucket_counts):
+            cumulative += bucket_count
+            lines.append(f'{metric_name}_bucket{{{labels},le="{upper_bound:g}"}} {cumulative}')
+        lines.append(f'{metric_name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{metric_name}_sum{{{labels}}} {self.total:.2f}")
+        lines.append(f"{metric_name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+_stage_histograms: Dict[str, _Histogram] = {}
+_turn_histograms: Dict[str, _Histogram] = {}
+_llm_step_histograms: Dict[Tuple[str, str], _Histogram] = {}
+
+
+def observe_chat_turn(timings: Dict[str, float], total_ms: float, intent: Optional[str]) -> None:
+    """Agrega el desglose de un turno terminado a los histogramas de /metrics."""
+    for stage, elapsed_ms in timings.items():
+        _stage_histograms.setdefault(stage, _Histogram()).observe(elapsed_ms)
+    _turn_histograms.setdefault(intent or "UNKNOWN", _Histogram()).observe(total_ms)
+
+
+def observe_llm_step(step: str, model: str, elapsed_ms: float) -> None:
+    """Latencia de una llamada al LLM de un paso del pipeline, por modelo (para comparar modelos por paso)."""
+    _llm_step_histograms.setdefault((step, model), _Histogram()).observe(elapsed_ms)
+
+
+def _escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus_metrics(extra_counters: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+    """
+    Texto en formato de exposición de Prometheus (0.0.4).
+    `extra_counters`: {nombre_métrica: {etiqueta_evento: valor}} para contadores de otros servicios.
+    """
+    lines: List[str] = [
+        "# HELP chatbot_stage_duration_ms Duración de cada etapa de un turno de chat (ms).",
+        "# TYPE chatbot_stage_duration_ms histogram",
+    ]
+    for stage in sorted(_stage_histograms):
+        lines.extend(_stage_histograms[stage].render("chatbot_stage_duration_ms", f'stage="{_escape_label(stage)}"'))
+
+    lines += [
+        "# HELP chatbot_turn_duration_ms Duración total de un turno de chat por intención (ms).",
+        "# TYPE chatbot_turn_duration_ms histogram",
+    ]
+    for intent in sorted(_turn_histograms):
+        lines.extend(_turn_histograms[intent].render("chatbot_turn_duration_ms", f'intent="{_escape_label(intent)}"'))
+
+    lines += [
+        "# HELP chatbot_llm_step_duration_ms Duración de cada llamada al LLM por paso del pipeline y modelo (ms).",
+        "# TYPE chatbot_llm_step_duration_ms histogram",
+    ]
+    for step, model in sorted(_llm_step_histograms):
+        lines.extend(_llm_step_histograms[(step, model)].render(
+            "chatbot_llm_step_duration_ms", f'step="{_escape_label(step)}",model="{_escape_label(model)}"'
+        ))
+
+    for metric_name, values in (extra_counters or {}).items():
+        lines.append(f"# TYPE {metric_name} gauge")
+        for event, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            lines.append(f'{metric_name}{{event="{_escape_label(event)}"}} {value}')
+
+    return "\n".join(lines) + "\n"
@@ -14,6 +14,7 @@ from app.models.llm_model_config import LLMProviderType
 from app.schemas.schemas import GeneratePromptRequest
 from app.crud import crud_llm_model_config
 from app.utils.security_utils import decrypt_data
+from app.llm_integrations.bedrock_executor import run_in_bedrock_executor
 
 # <<< CAMBIO 1: EL NUEVO Y MEJORADO META-PROMPT >>>
 # <<< CAMBIO 1: Renombramos y mantenemos el prompt largo como una "GUÍA" >>>
@@ -101,7 +102,8 @@ async def _invoke_bedrock_tool_for_json(llm_config, prompt: str) -> str:
         client_kwargs['aws_access_key_id'] = access_key
         client_kwargs['aws_secret_access_key'] = secret_key
     
-    bedrock_client = boto3.client(**client_kwargs)
+    # Crear el cliente (carga de modelos de servicio) y `converse` son bloqueantes: van al pool de Bedrock.
+    bedrock_client = await run_in_bedrock_executor(boto3.client, **client_kwargs)
 
     tool_definition = {
         "toolSpec": {
@@ -112,7 +114,8 @@ async def _invoke_bedrock_tool_for_json(llm_config, prompt: str) -> str:
     }
     
     try:
-        response = bedrock_client.converse(
+        response = await run_in_bedrock_executor(
+            bedrock_client.converse,
             modelId=llm_config.model_identifier,
             messages=[{"role": "user", "content": [{"text": prompt}]}],
             toolConfig={"tools": [tool_definition]}
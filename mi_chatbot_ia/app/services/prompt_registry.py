@@ -0,0 +1,53 @@
+# app/services/prompt_registry.py
+"""
+Registro de cadenas (prompt | llm | parser) ya compiladas.
+
+Antes cada turno volvía a parsear con `ChatPromptTemplate.from_template/from_messages`
+los prompts de saludo, extracción, despedida, enrutado, condensación y respuesta (y los
+de `sql_tools`). Aquí cada cadena se construye una sola vez por:
+  (nombre de la cadena, VAP id, VAP updated_at, adaptador LLM)
+y se reutiliza entre peticiones, con expulsión LRU.
+
+- Las cadenas que no dependen del agente se registran con `vap=None`.
+- El adaptador LLM se identifica por su identidad: el registro guarda la cadena (que
+  referencia al adaptador), así que el id no se reutiliza mientras la entrada exista.
+  Si la caché de adaptadores crea uno nuevo, la entrada vieja sale por LRU.
+- Al editar un VAP cambia su `updated_at` y las cadenas viejas dejan de usarse.
+"""
+from typing import Callable, Dict
+
+from langchain_core.runnables import Runnable
+
+from app.config import settings
+from app.services.cache_service import TTLLRUCache
+
+
+_chain_registry = TTLLRUCache(
+    max_entries=settings.PROMPT_REGISTRY_MAX_ENTRIES,
+    ttl_seconds=settings.PROMPT_REGISTRY_TTL_SECONDS
+)
+_registry_stats: Dict[str, int] = {"hits": 0, "builds": 0}
+
+
+def get_chain(name: str, llm, build: Callable[[], Runnable], vap=None) -> Runnable:
+    """
+    Devuelve la cadena `name` para (vap, llm); si no existe la construye con `build()`.
+    `build` debe depender solo de `vap` y `llm` (nada propio de la petición).
+    """
+    key = (name, getattr(vap, "id", None), getattr(vap, "updated_at", None), id(llm))
+    chain = _chain_registry.get(key)
+    if chain is not None:
+        _registry_stats["hits"] += 1
+        return chain
+    chain = build()
+    _chain_registry.set(key, chain)
+    _registry_stats["builds"] += 1
+    return chain
+
+
+def get_registry_stats() -> Dict[str, int]:
+    return {**_registry_stats, "entries": len(_chain_registry)}
+
+
+def clear() -> None:
+    _chain_registry.clear()
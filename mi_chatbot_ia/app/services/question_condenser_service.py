@@ -0,0 +1,84 @@
+# app/services/question_condenser_service.py
+"""
+Decide si la pregunta del usuario necesita pasar por el LLM de "condensación"
+(`DEFAULT_RAG_CONDENSE_QUESTION_TEMPLATE`) antes de ir al retriever.
+
+- Sin historial útil (o solo el saludo inicial) la pregunta ya es independiente.
+- Con historial, una heurística barata detecta seguimientos: referencias anafóricas
+  ("eso", "lo anterior", "y el otro"...) o preguntas demasiado cortas para valerse solas.
+- El resultado de la condensación se cachea por (sesión, historial, pregunta) para reintentos.
+"""
+import hashlib
+import re
+from typing import List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, get_buffer_string
+
+from app.config import settings
+from app.services.cache_service import TTLLRUCache
+
+
+GREETING_TRIGGER_MESSAGE = "__INICIAR_CHAT__"
+
+# Marcadores de seguimiento (español). Se buscan como palabras/expresiones completas.
+_FOLLOW_UP_MARKERS = (
+    "eso", "esto", "esa", "ese", "esas", "esos", "esta", "este", "estas", "estos",
+    "aquello", "aquel", "aquella", "lo anterior", "lo mismo", "el mismo", "la misma",
+    "dicho", "dicha", "mencionaste", "mencionado", "mencionada", "dijiste", "me dijiste",
+    "el otro", "la otra", "los otros", "las otras", "el primero", "el segundo", "el último",
+    "también", "además", "otra vez", "de nuevo", "entonces", "y si", "y el", "y la", "y los",
+    "y las", "y en", "y para", "y cómo", "y cuándo", "y dónde", "y qué", "y cuál", "más detalles",
+    "explícame más", "amplía", "profundiza", "continúa", "sigue", "al respecto", "sobre eso",
+)
+_FOLLOW_UP_PATTERN = re.compile(
+    r"(?<!\w)(" + "|".join(re.escape(m) for m in sorted(_FOLLOW_UP_MARKERS, key=len, reverse=True)) + r")(?!\w)"
+)
+
+_condense_cache = TTLLRUCache(
+    max_entries=settings.CONDENSE_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.CONDENSE_CACHE_TTL_SECONDS
+)
+
+
+def get_usable_history(history_list: List[BaseMessage]) -> List[BaseMessage]:
+    """Quita el disparador del saludo inicial y la respuesta de saludo que le sigue."""
+    usable: List[BaseMessage] = []
+    skip_next_ai = False
+    for message in history_list:
+        if isinstance(message, HumanMessage) and message.content == GREETING_TRIGGER_MESSAGE:
+            skip_next_ai = True
+            continue
+        if skip_next_ai and not isinstance(message, HumanMessage):
+            skip_next_ai = False
+            continue
+        skip_next_ai = False
+        usable.append(message)
+    return usable
+
+
+def needs_condensation(question: str, usable_history: List[BaseMessage]) -> Tuple[bool, str]:
+    """Devuelve (¿hay que condensar?, motivo) sin llamar a ningún modelo."""
+    if not usable_history:
+        return False, "sin_historial"
+    normalized = question.lower().strip()
+    if _FOLLOW_UP_PATTERN.search(normalized):
+        return True, "referencia_anaforica"
+    if len(normalized.split()) < settings.CONDENSE_MIN_STANDALONE_WORDS:
+        return True, "pregunta_corta"
+    return False, "pregunta_autocontenida"
+
+
+def get_history_marker(history_list: List[BaseMessage]) -> str:
+    """Huella del historial (ya recortado a su ventana) que identifica el turno en la caché."""
+    return hashlib.sha256(get_buffer_string(history_list).encode()).hexdigest()[:16]
+
+def _get_cache_key(session_id: str, history_marker: str, question: str) -> str:
+    question_hash = hashlib.sha256(question.strip().lower().encode()).hexdigest()[:16]
+    return f"{session_id}:{history_marker}:{question_hash}"
+
+def get_cached_condensed(session_id: str, history_marker: str, question: str) -> Optional[str]:
+    return _condense_cache.get(_get_cache_key(session_id, history_marker, question))
+
+def set_cached_condensed(session_id: str, history_marker: str, question: str, standalone_question: str) -> None:
+    if standalone_question and standalone_question.strip():
+        _condense_cache.set(_get_cache_key(session_id, history_marker, question), standalone_question)
@@ -0,0 +1,200 @@
+# app/services/semantic_cache_service.py
+"""
+Caché SEMÁNTICA de respuestas RAG.
+
+Los usuarios formulan la misma pregunta de muchas maneras, así que una clave exacta
+acierta poco. Aquí se guarda el embedding de la pregunta independiente (ya condensada)
+y se sirve la respuesta de la pregunta más parecida si la similitud coseno supera
+el umbral configurado.
+
+- El índice vive en memoria del proceso, uno por ámbito (agente virtual + contexto documental).
+  El ámbito incluye el `updated_at` del agente: al editarlo (prompt, estilo) se empieza un
+  índice nuevo y el anterior se descarta.
+- Cada entrada lleva la "versión de ingesta" del contexto; al re-ingestar o borrar
+  documentos la versión sube (en Redis) y las entradas antiguas dejan de servirse.
+"""
+import asyncio
+import time
+from typing import Optional, Dict, Any, List
+
+import numpy as np
+from redis.asyncio import Redis as AsyncRedis
+
+from app.config import settings
+
+
+def _get_ingest_version_key(context_id: int) -> str:
+    return f"ctx:ingest_version:{context_id}"
+
+# Respaldo local cuando no hay Redis (un único proceso).
+_local_ingest_versions: Dict[int, int] = {}
+
+
+async def get_ingest_version_async(redis_client: Optional[AsyncRedis], context_id: int) -> int:
+    """(ASÍNCRONO) Devuelve la versión de ingesta actual de un contexto."""
+    if redis_client:
+        try:
+            value = await redis_client.get(_get_ingest_version_key(context_id))
+            return int(value) if value else 0
+        except Exception as e:
+            print(f"SEMANTIC_CACHE_ERROR: No se pudo leer la versión de ingesta del contexto {context_id}: {e}")
+    return _local_ingest_versions.get(context_id, 0)
+
+
+async def get_ingest_versions_async(redis_client: Optional[AsyncRedis], context_ids: List[int]) -> Dict[int, int]:
+    """(ASÍNCRONO) Versiones de ingesta de varios contextos en un solo viaje a Redis."""
+    if redis_client and context_ids:
+        try:
+            values = await redis_client.mget([_get_ingest_version_key(context_id) for context_id in context_ids])
+            return {context_id: int(value) if value else 0 for context_id, value in zip(context_ids, values)}
+        except Exception as e:
+            print(f"SEMANTIC_CACHE_ERROR: No se pudieron leer las versiones de ingesta {context_ids}: {e}")
+    return {context_id: _local_ingest_versions.get(context_id, 0) for context_id in context_ids}
+
+
+async def bump_ingest_version_async(redis_client: Optional[AsyncRedis], context_id: int) -> None:
+    """
+    (ASÍNCRONO) Incrementa la versión de ingesta de un contexto. Se llama tras subir
+    o eliminar documentos, o al modificar/eliminar el contexto.
+    """
+    _local_ingest_versions[context_id] = _local_ingest_versions.get(context_id, 0) + 1
+    _drop_context_indexes(context_id)
+    if redis_client:
+        try:
+            await redis_client.incr(_get_ingest_version_key(context_id))
+        except Exception as e:
+            print(f"SEMANTIC_CACHE_ERROR: No se pudo incrementar la versión de ingesta del contexto {context_id}: {e}")
+    print(f"SEMANTIC_CACHE: Versión de ingesta del contexto {context_id} incrementada. Entradas invalidadas.")
+
+
+class _SemanticIndex:
+    """Índice en memoria de un ámbito: embeddings normalizados + respuestas asociadas."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max(1, max_entries)
+        self.questions: List[str] = []
+        self.entries: List[Dict[str, Any]] = []
+        self._vectors: List[np.ndarray] = []
+        self._matrix: Optional[np.ndarray] = None
+
+    def _evict(self, index: int) -> None:
+        del self.questions[index]
+        del self.entries[index]
+        del self._vectors[index]
+        self._matrix = None
+
+    def purge(self, ingest_version: int) -> None:
+        """Elimina entradas expiradas o de una versión de ingesta distinta."""
+        now = time.monotonic()
+        for i in range(len(self.entries) - 1, -1, -1):
+            entry = self.entries[i]
+            if entry["ingest_version"] != ingest_version or entry["expires_at"] < now:
+                self._evict(i)
+
+    def add(self, question: str, vector: np.ndarray, entry: Dict[str, Any]) -> None:
+        if len(self.entries) >= self.max_entries:
+            self._evict(0)  # FIFO: la entrada más antigua sale primero
+        self.questions.append(question)
+        self.entries.append(entry)
+        self._vectors.append(vector)
+        self._matrix = None
+
+    def nearest(self, vector: np.ndarray) -> Optional[tuple]:
+        if not self._vectors:
+            return None
+        if self._matrix is None:
+            self._matrix = np.vstack(self._vectors)
+        similarities = self._matrix @ vector
+        best = int(np.argmax(similarities))
+        return best, float(similarities[best])
+
+
+_indexes: Dict[str, _SemanticIndex] = {}
+
+
+def _get_scope_key(vap, context_id: int) -> str:
+    vap_updated_at = vap.updated_at.isoformat() if getattr(vap, "updated_at", None) else ""
+    return f"{vap.id}@{vap_updated_at}:{context_id}"
+
+def _drop_stale_vap_indexes(vap, context_id: int, scope_key: str) -> None:
+    """Descarta los índices de versiones anteriores del mismo agente y contexto."""
+    for stale_key in [k for k in _indexes if k.startswith(f"{vap.id}@") and k.endswith(f":{context_id}") and k != scope_key]:
+        del _indexes[stale_key]
+
+def _drop_context_indexes(context_id: int) -> None:
+    for scope_key in [k for k in _indexes if k.endswith(f":{context_id}")]:
+        del _indexes[scope_key]
+
+
+async def embed_question_async(embedding_model, question: str) -> Optional[np.ndarray]:
+    """(ASÍNCRONO) Calcula el embedding normalizado en un hilo para no bloquear el event loop."""
+    if embedding_model is None:
+        return None
+    try:
+        raw_vector = await asyncio.to_thread(embedding_model.embed_query, question)
+    except Exception as e:
+        print(f"SEMANTIC_CACHE_ERROR: Fallo al calcular el embedding: {e}")
+        return None
+    vector = np.asarray(raw_vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else None
+
+
+async def lookup_async(
+    redis_client: Optional[AsyncRedis],
+    vap,
+    context_id: int,
+    question_vector: Optional[np.ndarray]
+) -> Optional[Dict[str, Any]]:
+    """
+    (ASÍNCRONO) Busca la pregunta más cercana ya respondida en el mismo ámbito.
+    Devuelve la entrada cacheada (con 'similarity' y 'matched_question') o None.
+    """
+    if not settings.SEMANTIC_CACHE_ENABLED or question_vector is None:
+        return None
+    index = _indexes.get(_get_scope_key(vap, context_id))
+    if index is None:
+        return None
+
+    index.purge(await get_ingest_version_async(redis_client, context_id))
+    match = index.nearest(question_vector)
+    if match is None:
+        return None
+
+    position, similarity = match
+    if similarity < settings.SEMANTIC_CACHE_SIMILARITY_THRESHOLD:
+        print(f"SEMANTIC_CACHE_MISS: Mejor similitud {similarity:.3f} por debajo del umbral.")
+        return None
+
+    print(f"SEMANTIC_CACHE_HIT: Similitud {similarity:.3f} con '{index.questions[position]}'.")
+    return {**index.entries[position]["response"], "similarity": similarity, "matched_question": index.questions[position]}
+
+
+async def store_async(
+    redis_client: Optional[AsyncRedis],
+    vap,
+    context_id: int,
+    question: str,
+    question_vector: Optional[np.ndarray],
+    response_dict: Dict[str, Any]
+) -> None:
+    """(ASÍNCRONO) Guarda la respuesta de una pregunta independiente en el índice de su ámbito."""
+    if not settings.SEMANTIC_CACHE_ENABLED or question_vector is None:
+        return
+    bot_response_text = response_dict.get("bot_response", "")
+    if not bot_response_text or "[Error" in bot_response_text:
+        return
+
+    scope_key = _get_scope_key(vap, context_id)
+    index = _indexes.get(scope_key)
+    if index is None:
+        _drop_stale_vap_indexes(vap, context_id, scope_key)
+        index = _indexes[scope_key] = _SemanticIndex(settings.SEMANTIC_CACHE_MAX_ENTRIES_PER_CONTEXT)
+
+    ingest_version = await get_ingest_version_async(redis_client, context_id)
+    index.purge(ingest_version)
+    index.add(question, question_vector, {
+        "response": response_dict,
+        "ingest_version": ingest_version,
+        "expires_at": time.monotonic() + settings.SEMANTIC_CACHE_TTL_SECONDS
+    })
@@ -0,0 +1,187 @@
+# app/services/single_flight_service.py
+"""
+Coalescencia ("single-flight") de preguntas idénticas en vuelo.
+
+Cuando sale un anuncio, decenas de alumnos hacen la misma pregunta en segundos y cada
+petición recorría entera la tubería (enrutado, condensación, recuperación, respuesta)
+contra el proveedor LLM. Aquí, para turnos SIN estado con la misma clave que la caché
+de respuestas (`cache_service.get_response_cache_key`), solo una petición calcula.
+Como esa clave no lleva el historial, el endpoint solo se une a un vuelo si la pregunta
+no depende de la conversación (mismo filtro que la caché de respuestas).
+
+- Dentro del worker: las demás esperan el mismo `asyncio.Future`.
+- Entre workers: un lock en Redis (`SET NX PX`) elige al líder; los demás sondean la
+  clave de resultado hasta que aparece, el lock desaparece o vence la espera.
+
+Solo se comparte la RESPUESTA (`to_shared(result)`), nunca el estado de sesión: cada
+seguidor guarda su propio historial, estado y log. Si el resultado del líder no es
+compartible (p. ej. abrió una clarificación) o el líder falla, cada seguidor calcula
+el suyo como antes.
+"""
+import asyncio
+import json
+import time
+import uuid
+from typing import Optional, Dict, Any, Tuple, Callable, Awaitable
+
+from redis.asyncio import Redis as AsyncRedis
+
+from app.config import settings
+from app.services.metrics_service import stage_timer
+
+
+SharedResult = Dict[str, Any]
+
+# Libera el lock solo si sigue siendo nuestro (el TTL pudo vencer y otro worker tomarlo).
+_RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_inflight: Dict[str, asyncio.Future] = {}
+_release_scripts: Dict[int, Any] = {}
+_single_flight_stats: Dict[str, int] = {
+    "leaders": 0, "local_followers": 0, "remote_followers": 0, "fallbacks": 0, "redis_errors": 0
+}
+
+
+def _get_lock_key(flight_key: str) -> str:
+    return f"single_flight:{{{flight_key}}}:lock"
+
+def _get_result_key(flight_key: str) -> str:
+    return f"single_flight:{{{flight_key}}}:result"
+
+
+async def _try_acquire_lock(redis_client: Optional[AsyncRedis], flight_key: str) -> Optional[str]:
+    """
+    Devuelve el token del lock si somos el líder entre workers, `None` si otro worker ya
+    lo tiene y `""` si no hay Redis (o falla): entonces se calcula sin coordinación.
+    """
+    if not redis_client:
+        return ""
+    token = uuid.uuid4().hex
+    try:
+        acquired = await redis_client.set(
+            _get_lock_key(flight_key), token, nx=True, px=settings.SINGLE_FLIGHT_LOCK_TTL_SECONDS * 1000
+        )
+    except Exception as e:
+        _single_flight_stats["redis_errors"] += 1
+        print(f"SINGLE_FLIGHT_ERROR: No se pudo tomar el lock '{flight_key}': {e}")
+        return ""
+    return token if acquired else None
+
+
+async def _release_lock(redis_client: AsyncRedis, flight_key: str, token: str) -> None:
+    script = _release_scripts.get(id(redis_client))
+    if script is None:
+        script = redis_client.register_script(_RELEASE_LOCK_LUA)
+        _release_scripts[id(redis_client)] = script
+    try:
+        await script(keys=[_get_lock_key(flight_key)], args=[token])
+    except Exception as e:
+        _single_flight_stats["redis_errors"] += 1
+        print(f"SINGLE_FLIGHT_ERROR: No se pudo liberar el lock '{flight_key}': {e}")
+
+
+async def _publish_result(redis_client: Optional[AsyncRedis], flight_key: str, shared: SharedResult) -> None:
+    if not redis_client:
+        return
+    try:
+        await redis_client.set(
+            _get_result_key(flight_key), json.dumps(shared, default=str), ex=settings.SINGLE_FLIGHT_RESULT_TTL_SECONDS
+        )
+    except Exception as e:
+        _single_flight_stats["redis_errors"] += 1
+        print(f"SINGLE_FLIGHT_ERROR: No se pudo publicar el resultado '{flight_key}': {e}")
+
+
+async def _wait_for_remote_result(redis_client: AsyncRedis, flight_key: str) -> Optional[SharedResult]:
+    """Sondea el resultado del líder de otro worker. `None` si no habrá resultado compartible."""
+    deadline = time.monotonic() + settings.SINGLE_FLIGHT_WAIT_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        try:
+            # MULTI/EXEC (mismo slot por el hash-tag): resultado y lock se leen en el mismo instante,
+            # así "sin lock y sin resultado" significa de verdad que el líder terminó sin compartir.
+            async with redis_client.pipeline(transaction=True) as pipe:
+                pipe.get(_get_result_key(flight_key))
+                pipe.exists(_get_lock_key(flight_key))
+                raw_result, lock_exists = await pipe.execute()
+        except Exception as e:
+            _single_flight_stats["redis_errors"] += 1
+            print(f"SINGLE_FLIGHT_ERROR: No se pudo consultar el resultado '{flight_key}': {e}")
+            return None
+        if raw_result:
+            try:
+                return json.loads(raw_result)
+            except ValueError:
+                return None
+        if not lock_exists:
+            return None
+        await asyncio.sleep(settings.SINGLE_FLIGHT_POLL_INTERVAL_SECONDS)
+    print(f"SINGLE_FLIGHT: Tiempo de espera agotado para '{flight_key}'; se calcula localmente.")
+    return None
+
+
+async def run_single_flight(
+    redis_client: Optional[AsyncRedis],
+    flight_key: str,
+    compute: Callable[[], Awaitable[Any]],
+    to_shared: Callable[[Any], Optional[SharedResult]]
+) -> Tuple[Optional[Any], Optional[SharedResult]]:
+    """
+    (ASÍNCRONO) Ejecuta `compute()` una sola vez por `flight_key` entre peticiones concurrentes.
+
+    Devuelve `(resultado_propio, None)` si esta petición calculó, o `(None, compartido)` si
+    reutiliza lo que `to_shared` extrajo del resultado de otra petición.
+    """
+    if not settings.SINGLE_FLIGHT_ENABLED:
+        return await compute(), None
+
+    local_leader = _inflight.get(flight_key)
+    if local_leader is not None:
+        _single_flight_stats["local_followers"] += 1
+        try:
+            with stage_timer("single_flight_wait"):
+                shared = await asyncio.wait_for(asyncio.shield(local_leader), timeout=settings.SINGLE_FLIGHT_WAIT_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            shared = None
+        if shared is not None:
+            return None, shared
+        _single_flight_stats["fallbacks"] += 1
+        return await compute(), None
+
+    future: asyncio.Future = asyncio.get_running_loop().create_future()
+    _inflight[flight_key] = future
+    lock_token: Optional[str] = None
+    shared_result: Optional[SharedResult] = None
+    try:
+        lock_token = await _try_acquire_lock(redis_client, flight_key)
+        if lock_token is None:
+            with stage_timer("single_flight_wait"):
+                shared_result = await _wait_for_remote_result(redis_client, flight_key)
+            if shared_result is not None:
+                _single_flight_stats["remote_followers"] += 1
+                return None, shared_result
+            _single_flight_stats["fallbacks"] += 1
+        else:
+            _single_flight_stats["leaders"] += 1
+
+        result = await compute()
+        shared_result = to_shared(result)
+        if shared_result is not None and lock_token:
+            await _publish_result(redis_client, flight_key, shared_result)
+        return result, None
+    finally:
+        if _inflight.get(flight_key) is future:
+            del _inflight[flight_key]
+        # Los seguidores locales reciben el resultado compartible o `None` (calcular por su cuenta).
+        if not future.done():
+            future.set_result(shared_result)
+        if lock_token:
+            await _release_lock(redis_client, flight_key, lock_token)
+
+
+def get_single_flight_stats() -> Dict[str, int]:
+    return {**_single_flight_stats, "in_flight": len(_inflight)}
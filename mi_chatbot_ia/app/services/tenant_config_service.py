@@ -0,0 +1,330 @@
+# app/services/tenant_config_service.py
+"""
+Configuración "compilada" por cliente API para el camino caliente del chat.
+
+Contextos, perfil de agente y configuración LLM cambian pocas veces por semana, pero
+antes se consultaban en CADA petición. Aquí se compilan una vez por cliente API en una
+instantánea inmutable (dataclasses congeladas con __slots__) que contiene:
+  - los contextos permitidos,
+  - una vista pública y otra autenticada (contextos activos, VAP, LLM y temperatura),
+    con el LLM ya resuelto para cada paso del pipeline (`LLM_PIPELINE_STEPS`).
+
+La instantánea se reconstruye de forma perezosa y se invalida:
+  - por el canal pub/sub de Redis `CONFIG_INVALIDATION_CHANNEL`, al que publican los
+    endpoints de administración al actualizar/eliminar configuración, y
+  - por TTL (`TENANT_CONFIG_TTL_SECONDS`) como red de seguridad.
+
+Los objetos ORM se desacoplan de la sesión (expunge) y se comparten entre peticiones:
+son de SOLO LECTURA en el chat.
+"""
+import asyncio
+import json
+import time
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List, Tuple, Callable
+
+from redis.asyncio import Redis as AsyncRedis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import selectinload, noload
+
+from app.config import settings
+from app.crud import crud_virtual_agent_profile, crud_llm_model_config
+from app.models.context_definition import ContextDefinition
+from app.models.virtual_agent_profile import VirtualAgentProfile
+from app.models.llm_model_config import LLMModelConfig
+
+
+CONFIG_INVALIDATION_CHANNEL = "config:invalidate"
+# Pasos del pipeline que pueden usar un LLMModelConfig propio (`vap.step_llm_config_ids_json`).
+LLM_PIPELINE_STEPS = ("routing", "extraction", "condense", "answer")
+
+
+class TenantConfigError(Exception):
+    """La configuración del cliente no permite atender la petición (sin contextos, sin VAP, etc.)."""
+    def __init__(self, status_code: int, detail: str):
+        self.status_code = status_code
+        self.detail = detail
+        super().__init__(detail)
+
+
+@dataclass(frozen=True, slots=True)
+class StepLLMConfig:
+    """Con qué LLM (temperatura, max_tokens y respaldos) se ejecuta un paso del pipeline."""
+    llm_config: LLMModelConfig
+    temperature: float
+    max_tokens_override: Optional[int]
+    fallback_llm_configs: Tuple[LLMModelConfig, ...]
+
+
+@dataclass(frozen=True, slots=True)
+class TenantView:
+    """Lo que el chat necesita para una clase de usuario (público o autenticado)."""
+    active_contexts: Tuple[ContextDefinition, ...]
+    vap: VirtualAgentProfile
+    llm_config: LLMModelConfig
+    temperature: float
+    max_tokens_override: Optional[int]
+    # Cadena de failover (`llm_config.fallback_config_ids`), solo configs activos y en orden.
+    fallback_llm_configs: Tuple[LLMModelConfig, ...]
+    # Un StepLLMConfig por cada paso de LLM_PIPELINE_STEPS (los no configurados, con el LLM principal).
+    step_llms: Dict[str, StepLLMConfig]
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledTenantConfig:
+    api_client_id: int
+    all_allowed_contexts: Tuple[ContextDefinition, ...]
+    public_view: Optional[TenantView]
+    authenticated_view: Optional[TenantView]
+    # (status_code, detalle) cuando la vista correspondiente no se pudo compilar.
+    public_error: Optional[Tuple[int, str]]
+    authenticated_error: Optional[Tuple[int, str]]
+    compiled_at: float
+
+    def view_for(self, is_authenticated: bool) -> TenantView:
+        view = self.authenticated_view if is_authenticated else self.public_view
+        if view is None:
+            status_code, detail = self.authenticated_error if is_authenticated else self.public_error
+            raise TenantConfigError(status_code, detail)
+        return view
+
+
+# --- Caché en proceso ---
+_compiled_configs: Dict[int, CompiledTenantConfig] = {}
+_build_locks: Dict[int, asyncio.Lock] = {}
+# Se incrementa con cada invalidación; una compilación iniciada antes no se guarda.
+_generation = 0
+
+
+def resolve_temperature(llm_config: LLMModelConfig, vap: VirtualAgentProfile) -> float:
+    """Temperatura del modelo, salvo que el agente tenga un override (que siempre gana)."""
+    final_temperature = 0.3  # Valor de fallback por si todo falla
+    if llm_config.default_temperature is not None:
+        final_temperature = llm_config.default_temperature
+    if getattr(vap, "temperature_override", None) is not None:
+        final_temperature = vap.temperature_override
+    return final_temperature
+
+
+async def _compile_step_llms(
+    db: AsyncSession, vap: VirtualAgentProfile, main_step: StepLLMConfig
+) -> Dict[str, StepLLMConfig]:
+    """
+    Resuelve el LLM de cada paso. Los pasos auxiliares (enrutado, extracción, condensación)
+    usan la temperatura de SU config y su max_tokens por defecto; el override de temperatura
+    del agente solo aplica a la respuesta, como hasta ahora.
+    """
+    step_ids = {
+        step: config_id for step, config_id in (vap.step_llm_config_ids_json or {}).items()
+        if step in LLM_PIPELINE_STEPS and config_id and config_id != main_step.llm_config.id
+    }
+    step_configs = {c.id: c for c in await crud_llm_model_config.get_active_llm_model_configs_by_ids(db, list(set(step_ids.values())))}
+    fallback_ids = {fid for c in step_configs.values() for fid in (c.fallback_config_ids or []) if fid != c.id}
+    fallback_configs = {c.id: c for c in await crud_llm_model_config.get_active_llm_model_configs_by_ids(db, list(fallback_ids))}
+
+    step_llms: Dict[str, StepLLMConfig] = {}
+    for step in LLM_PIPELINE_STEPS:
+        step_config = step_configs.get(step_ids.get(step))
+        if step_config is None:
+            if step in step_ids:
+                print(f"TENANT_CONFIG_WARNING: LLM {step_ids[step]} del paso '{step}' del agente '{vap.name}' no existe o está inactivo; se usa el principal.")
+            step_llms[step] = main_step
+            continue
+        step_llms[step] = StepLLMConfig(
+            llm_config=step_config,
+            temperature=resolve_temperature(step_config, vap) if step == "answer" else (
+                step_config.default_temperature if step_config.default_temperature is not None else main_step.temperature
+            ),
+            max_tokens_override=main_step.max_tokens_override if step == "answer" else None,
+            fallback_llm_configs=tuple(
+                fallback_configs[fid] for fid in (step_config.fallback_config_ids or []) if fid in fallback_configs
+            )
+        )
+    return step_llms
+
+
+async def _compile_view(
+    db: AsyncSession, client_settings: Dict[str, Any], active_contexts: List[ContextDefinition]
+) -> TenantView:
+    if not active_contexts:
+        raise TenantConfigError(404, "No hay contextos válidos para esta solicitud.")
+
+    vap_id = client_settings.get("default_virtual_agent_profile_id_override") or active_contexts[0].virtual_agent_profile_id
+    vap, llm_config = await crud_virtual_agent_profile.get_profile_with_llm_config(
+        db, vap_id,
+        llm_model_config_id_override=client_settings.get("default_llm_model_config_id_override"),
+        fallback_llm_model_config_id=active_contexts[0].default_llm_model_config_id
+    )
+    if not vap: raise TenantConfigError(404, "Perfil de agente virtual no encontrado.")
+    if not llm_config: raise TenantConfigError(404, "Configuración LLM no encontrada.")
+
+    fallback_ids = [fid for fid in (llm_config.fallback_config_ids or []) if fid != llm_config.id]
+    fallback_llm_configs = await crud_llm_model_config.get_active_llm_model_configs_by_ids(db, fallback_ids)
+
+    main_step = StepLLMConfig(
+        llm_config=llm_config,
+        temperature=resolve_temperature(llm_config, vap),
+        # El override del cliente API (por canal) gana sobre el del agente.
+        max_tokens_override=client_settings.get("max_tokens_per_response_override") or getattr(vap, "max_tokens_override", None),
+        fallback_llm_configs=tuple(fallback_llm_configs)
+    )
+    return TenantView(
+        active_contexts=tuple(active_contexts),
+        vap=vap,
+        llm_config=llm_config,
+        temperature=main_step.temperature,
+        max_tokens_override=main_step.max_tokens_override,
+        fallback_llm_configs=main_step.fallback_llm_configs,
+        step_llms=await _compile_step_llms(db, vap, main_step)
+    )
+
+
+async def _compile_tenant_config(session_factory: async_sessionmaker, client) -> CompiledTenantConfig:
+    client_settings = client.settings or {}
+    allowed_ctx_ids = client_settings.get("allowed_context_ids", [])
+
+    views: Dict[bool, Optional[TenantView]] = {False: None, True: None}
+    errors: Dict[bool, Optional[Tuple[int, str]]] = {False: None, True: None}
+    all_allowed_contexts: List[ContextDefinition] = []
+
+    async with session_factory() as db:
+        if not allowed_ctx_ids:
+            errors[False] = errors[True] = (403, "API Key sin contextos.")
+        else:
+            # Solo se necesita la conexión de BD; el resto de relaciones 'selectin' serían consultas extra.
+            stmt = select(ContextDefinition).where(
+                ContextDefinition.id.in_(allowed_ctx_ids), ContextDefinition.is_active == True
+            ).options(
+                selectinload(ContextDefinition.db_connection_config),
+                noload(ContextDefinition.default_llm_model_config),
+                noload(ContextDefinition.virtual_agent_profile),
+                noload(ContextDefinition.document_sources)
+            )
+            all_allowed_contexts = list((await db.execute(stmt)).scalars().unique().all())
+
+            for is_authenticated in (False, True):
+                active_contexts = all_allowed_contexts if is_authenticated else [c for c in all_allowed_contexts if c.is_public]
+                try:
+                    views[is_authenticated] = await _compile_view(db, client_settings, active_contexts)
+                except TenantConfigError as e:
+                    errors[is_authenticated] = (e.status_code, e.detail)
+
+        # Desacoplamos todo de la sesión: los objetos quedan cargados y se comparten entre peticiones.
+        db.expunge_all()
+
+    return CompiledTenantConfig(
+        api_client_id=client.id,
+        all_allowed_contexts=tuple(all_allowed_contexts),
+        public_view=views[False],
+        authenticated_view=views[True],
+        public_error=errors[False],
+        authenticated_error=errors[True],
+        compiled_at=time.monotonic()
+    )
+
+
+def _get_fresh(api_client_id: int) -> Optional[CompiledTenantConfig]:
+    compiled = _compiled_configs.get(api_client_id)
+    if compiled and time.monotonic() - compiled.compiled_at < settings.TENANT_CONFIG_TTL_SECONDS:
+        return compiled
+    return None
+
+
+async def get_compiled_tenant_config(session_factory: async_sessionmaker, client) -> CompiledTenantConfig:
+    """
+    Devuelve la configuración compilada del cliente API. En caliente no toca la BD;
+    en frío la compila UNA vez aunque lleguen varias peticiones a la vez.
+    """
+    compiled = _get_fresh(client.id)
+    if compiled:
+        return compiled
+
+    lock = _build_locks.setdefault(client.id, asyncio.Lock())
+    async with lock:
+        compiled = _get_fresh(client.id)
+        if compiled:
+            return compiled
+
+        generation_at_start = _generation
+        start = time.perf_counter()
+        compiled = await _compile_tenant_config(session_factory, client)
+        print(f"TENANT_CONFIG: Configuración del cliente API {client.id} compilada en {(time.perf_counter() - start) * 1000:.1f} ms.")
+
+        if generation_at_start == _generation:
+            _compiled_configs[client.id] = compiled
+        return compiled
+
+
+# ==========================================================
+# ===            INVALIDACIÓN (LOCAL + PUB/SUB)          ===
+# ==========================================================
+
+# Otras cachés en proceso (p.ej. la de API keys) se registran aquí para invalidarse con el mismo mensaje.
+_invalidation_handlers: List[Callable[[Optional[int]], None]] = []
+
+def register_invalidation_handler(handler: Callable[[Optional[int]], None]) -> None:
+    """Registra un callback `handler(api_client_id | None)`; None significa 'todo'."""
+    _invalidation_handlers.append(handler)
+
+def invalidate_local(api_client_id: Optional[int] = None) -> None:
+    """Invalida la caché de ESTE proceso. `api_client_id=None` invalida todos los clientes."""
+    global _generation
+    _generation += 1
+    if api_client_id is None:
+        _compiled_configs.clear()
+    else:
+        _compiled_configs.pop(api_client_id, None)
+    for handler in _invalidation_handlers:
+        try:
+            handler(api_client_id)
+        except Exception as e:
+            print(f"TENANT_CONFIG_ERROR: Fallo en un handler de invalidación: {e}")
+
+
+async def publish_invalidation_async(redis_client: Optional[AsyncRedis], api_client_id: Optional[int] = None) -> None:
+    """
+    (ASÍNCRONO) Invalida la configuración compilada en este proceso y avisa al resto
+    de workers por Redis. Lo llaman los endpoints de administración tras update/delete.
+    """
+    invalidate_local(api_client_id)
+    if not redis_client:
+        return
+    try:
+        payload = json.dumps({"api_client_id": api_client_id})
+        await redis_client.publish(CONFIG_INVALIDATION_CHANNEL, payload)
+        print(f"TENANT_CONFIG: Invalidación publicada ({'todos' if api_client_id is None else f'cliente {api_client_id}'}).")
+    except Exception as e:
+        print(f"TENANT_CONFIG_ERROR: No se pudo publicar la invalidación: {e}")
+
+
+async def run_invalidation_listener(redis_client: AsyncRedis) -> None:
+    """
+    Tarea de fondo (lanzada desde AppState) que escucha el canal de invalidación.
+    Se reconecta sola si Redis se cae; mientras tanto el TTL limita la obsolescencia.
+    """
+    while True:
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.subscribe(CONFIG_INVALIDATION_CHANNEL)
+            print(f"TENANT_CONFIG: Escuchando invalidaciones en el canal '{CONFIG_INVALIDATION_CHANNEL}'.")
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                try:
+                    api_client_id = json.loads(message["data"]).get("api_client_id")
+                except (ValueError, AttributeError):
+                    api_client_id = None
+                invalidate_local(api_client_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"TENANT_CONFIG_ERROR: Listener de invalidación caído ({e}). Reintentando en 5 s.")
+            # Durante la caída pudimos perder mensajes: mejor recompilar todo.
+            invalidate_local(None)
+            await asyncio.sleep(5)
+        finally:
+            try:
+                await pubsub.reset()
+            except Exception:
+                pass
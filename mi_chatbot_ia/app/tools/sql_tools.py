@@ -14,11 +14,14 @@ from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
 from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.runnables import Runnable
 
 # === Módulos de la aplicación ===
 from app.models.db_connection_config import DatabaseConnectionConfig
 from app.utils.security_utils import decrypt_data
 from app.schemas.schemas import ParamTransformType
+from app.services.metrics_service import stage_timer
+from app.services import prompt_registry, llm_memo_service
 
 # ==========================================================
 # ======>             PLANTILLAS DE PROMPTS            <======
@@ -108,9 +111,10 @@ def _create_async_db_engine(config: DatabaseConnectionConfig) -> AsyncEngine:
 
 async def execute_async_query(engine: AsyncEngine, query: TextClause, params: Optional[Dict[str, Any]] = None) -> str:
     try:
-        async with engine.connect() as connection:
-            result = await connection.execute(query, params or {})
-            rows = [dict(row._mapping) for row in result.fetchall()]
+        with stage_timer("tool_db"):
+            async with engine.connect() as connection:
+                result = await connection.execute(query, params or {})
+                rows = [dict(row._mapping) for row in result.fetchall()]
         return json.dumps(rows, indent=2, default=str)
     except Exception as e:
         return json.dumps({"error": f"Error al ejecutar consulta: {e}"})
@@ -120,12 +124,17 @@ async def _step1_extract_from_question(
     question: str, user_dni: Optional[str], chat_history: str, tool_config: Dict[str, Any], llm: BaseChatModel
 ) -> Dict[str, Any]:
     tool_for_prompt = {k: tool_config.get(k) for k in ("tool_name", "description_for_llm", "parameters")}
-    chain = ChatPromptTemplate.from_template(TOOL_USAGE_PROMPT_TEMPLATE) | llm | JsonOutputParser()
+    chain = prompt_registry.get_chain(
+        "sql_tool_usage", llm,
+        lambda: ChatPromptTemplate.from_template(TOOL_USAGE_PROMPT_TEMPLATE)
+        | llm_memo_service.memoize("sql_tool_usage", llm, llm | JsonOutputParser())
+    )
     try:
-        response = await chain.ainvoke({
-            "question": question, "user_dni": user_dni or "No disponible",
-            "tools_json_str": json.dumps(tool_for_prompt, indent=2), "chat_history": chat_history
-        })
+        with stage_timer("tool_llm"):
+            response = await chain.ainvoke({
+                "question": question, "user_dni": user_dni or "No disponible",
+                "tools_json_str": json.dumps(tool_for_prompt, indent=2), "chat_history": chat_history
+            })
         # Forzamos los parámetros a minúscula para consistencia
         return {k.lower(): v for k, v in response.get("parameters", {}).items()} if isinstance(response, dict) else {}
     except Exception as e:
@@ -227,12 +236,15 @@ async def _step3_execute_and_synthesize(
     
     db_result_json = await execute_async_query(engine, text(query_str), query_params)
     
-    ans_chain = ChatPromptTemplate.from_template(ANSWER_GENERATION_PROMPT_TEMPLATE) | llm | StrOutputParser()
-    final_answer = await ans_chain.ainvoke({
-        "question": question, 
-        "db_result_str": db_result_json, 
-        "user_name": user_name or "Usuario"
-    })
+    ans_chain = prompt_registry.get_chain(
+        "sql_answer", llm, lambda: ChatPromptTemplate.from_template(ANSWER_GENERATION_PROMPT_TEMPLATE) | llm | StrOutputParser()
+    )
+    with stage_timer("tool_llm"):
+        final_answer = await ans_chain.ainvoke({
+            "question": question, 
+            "db_result_str": db_result_json, 
+            "user_name": user_name or "Usuario"
+        })
     
     # En el metadata, seguimos mostrando los nombres lógicos para que sea legible
     return {"intent": "TOOL_EXECUTED", "final_answer": final_answer, "metadata": {"tool_used": tool_config.get("tool_name"), "procedure_called": proc_name, "parameters_used": params}}
@@ -244,16 +256,18 @@ async def run_db_query_chain(
     processing_config: Dict[str, Any], llm: BaseChatModel, 
     user_dni: Optional[str] = None,
     user_name: Optional[str] = None,
-    partial_params_from_redis: Optional[Dict[str, Any]] = None
+    partial_params_from_redis: Optional[Dict[str, Any]] = None,
+    extraction_llm: Optional[Runnable] = None
 ) -> Dict[str, Any]:
-    
+    # `extraction_llm` (paso "extraction" del agente) extrae los parámetros; `llm` redacta la respuesta.
+
     engine = _create_async_db_engine(db_conn_config)
     tool_config = processing_config.get("tools", [{}])[0]
     if not tool_config: return {"intent": "TOOL_FAILED", "final_answer": "No hay herramientas de BD configuradas."}
     
     # 1. Extraemos SOLO los parámetros de la pregunta actual
     newly_extracted_params = await _step1_extract_from_question(
-        question, user_dni, chat_history_str, tool_config, llm
+        question, user_dni, chat_history_str, tool_config, extraction_llm or llm
     )
     
     # 2. Combinamos inteligentemente los parámetros: los nuevos tienen prioridad
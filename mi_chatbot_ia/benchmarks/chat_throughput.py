@@ -0,0 +1,474 @@
+# mi_chatbot_ia/benchmarks/chat_throughput.py
+"""
+Benchmark de throughput extremo a extremo de /api/v1/chat/.
+
+Arranca la app FastAPI en el mismo proceso (lifespan completo, vía ASGI, sin red) contra
+la BD CRUD/vectorial y el Redis del .env, y reproduce una mezcla configurable de
+conversaciones con niveles crecientes de concurrencia:
+  - greeting: `__INICIAR_CHAT__` (pool de saludos), el nombre (AWAITING_NAME) y una despedida,
+  - rag: una pregunta documental y un seguimiento que se condensa,
+  - db_tool: un turno autenticado con todos los parámetros de la herramienta de BD,
+  - clarification: un turno autenticado al que le falta un parámetro obligatorio
+    (AWAITING_TOOL_PARAMS) y la respuesta que lo completa.
+Para cada nivel reporta:
+  - throughput (turnos/s) y errores por código HTTP,
+  - latencia p50/p95/p99 (global y por escenario),
+  - consultas SQL por turno (listener de SQLAlchemy, atribuidas por contextvar),
+  - lag del event loop (un tick de 50 ms que mide cuánto llega tarde).
+El resultado se guarda en JSON (con el commit de git) para comparar entre versiones.
+
+Pensado para usarse con el proveedor STUB (`--setup-stub-llm` crea o actualiza un
+LLMModelConfig STUB y lo asigna como override del cliente API: úsese solo en una BD de
+pruebas). El STUB deja en null los parámetros de las herramientas de BD; los turnos con
+`tool_parameters` en el escenario se guionizan para que los rellene (con esos valores o, si
+faltan, con el texto del turno). `--fakeredis` sustituye Redis por `fakeredis` (requiere
+`fakeredis[lua]`).
+
+Ejemplos:
+    python -m benchmarks.chat_throughput --api-client-id 1 --api-key XXX --setup-stub-llm
+    python -m benchmarks.chat_throughput --api-client-id 1 --api-key XXX \\
+        --concurrency 1,4,16,32 --duration 30 --mix greeting=1,rag=4,db_tool=2,clarification=1 \\
+        --compare benchmarks/results/chat_throughput_abc1234.json
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List
+
+import httpx
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# --- Conversaciones por defecto (se pueden reemplazar con --scenarios-file) ---
+# Un turno es un texto o {"message": ..., "tool_parameters": {...}}: en estos últimos el LLM STUB
+# devuelve rellenos los parámetros de la herramienta de BD (ver `_tool_parameter_scripts`).
+DEFAULT_SCENARIOS: Dict[str, Dict[str, Any]] = {
+    "greeting": {"authenticated": False, "turns": ["__INICIAR_CHAT__", "Me llamo Ana", "gracias, eso es todo"]},
+    "rag": {"authenticated": False, "turns": ["¿Cómo accedo a la intranet?", "¿y cómo recupero mi contraseña?"]},
+    "db_tool": {"authenticated": True, "turns": [
+        {"message": "quiero saber mis notas del curso de matemática 1", "tool_parameters": {}},
+    ]},
+    "clarification": {"authenticated": True, "turns": [
+        "quiero saber mis notas",
+        {"message": "del curso de matemática 1", "tool_parameters": {}},
+    ]},
+}
+DEFAULT_MIX = "greeting=1,rag=4,db_tool=2,clarification=1"
+LOOP_LAG_INTERVAL_SECONDS = 0.05
+BENCHMARK_DNI = "00000000"
+
+# Contador de consultas SQL del turno en curso (la copia del contexto llega a las tareas hijas).
+_current_query_counter: contextvars.ContextVar[Optional[List[int]]] = contextvars.ContextVar("benchmark_query_counter", default=None)
+_total_queries = [0]
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    _total_queries[0] += 1
+    counter = _current_query_counter.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def _percentile(samples: List[float], pct: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return round(ordered[index], 2)
+
+
+def _summarize(samples: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "count": len(samples),
+        "mean": round(statistics.mean(samples), 2) if samples else None,
+        "p50": _percentile(samples, 50),
+        "p95": _percentile(samples, 95),
+        "p99": _percentile(samples, 99),
+        "max": round(max(samples), 2) if samples else None,
+    }
+
+
+def _parse_mix(mix: str, scenarios: Dict[str, Any]) -> Dict[str, float]:
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in scenarios:
+            raise SystemExit(f"Escenario desconocido en --mix: '{name}'. Disponibles: {', '.join(scenarios)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def _turn_message(turn: Any) -> str:
+    return turn["message"] if isinstance(turn, dict) else turn
+
+
+def _tool_parameter_scripts(scenarios: Dict[str, Any], tool_config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Respuestas guionizadas del STUB para los turnos con `tool_parameters`: el prompt de
+    extracción de parámetros de ese mensaje recibe todos los parámetros de la herramienta.
+    """
+    # El parámetro de DNI lo rellena el chat con el del usuario autenticado.
+    parameter_names = [
+        p["name"] for p in tool_config.get("parameters") or [] if p.get("name") and not p.get("is_dni_param")
+    ]
+    scripts = []
+    for scenario in scenarios.values():
+        for turn in scenario["turns"]:
+            if not isinstance(turn, dict) or "tool_parameters" not in turn:
+                continue
+            values = {name: (turn["tool_parameters"] or {}).get(name, turn["message"]) for name in parameter_names}
+            scripts.append({
+                # Cabecera de la pregunta en TOOL_USAGE_PROMPT_TEMPLATE (app/tools/sql_tools.py).
+                "match": r"PREGUNTA DEL USUARIO:\*\*\n" + re.escape(turn["message"]) + r"\n",
+                "response": {"tool_to_use": tool_config.get("tool_name"), "parameters": values},
+            })
+    return scripts
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+class LoopLagMonitor:
+    """Mide cuánto se retrasa un `asyncio.sleep` periódico: retraso = el loop estaba bloqueado."""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL_SECONDS):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, (time.perf_counter() - expected) * 1000))
+
+    def start(self) -> None:
+        self.samples = []
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> List[float]:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        return self.samples
+
+
+# ==========================================================
+# ===                   PREPARACIÓN                      ===
+# ==========================================================
+
+def _install_fakeredis() -> None:
+    """Hace que AppState cree un FakeAsyncRedis en lugar de conectarse a REDIS_URL."""
+    try:
+        import fakeredis
+    except ImportError:
+        raise SystemExit("--fakeredis requiere el paquete 'fakeredis[lua]' (pip install 'fakeredis[lua]').")
+    from app.config import settings
+    from app.core import app_state as app_state_module
+
+    fake_server = fakeredis.FakeServer()
+    settings.REDIS_URL = settings.REDIS_URL or "redis://fakeredis"
+    app_state_module.aioredis.from_url = lambda *args, **kwargs: fakeredis.FakeAsyncRedis(
+        server=fake_server, decode_responses=kwargs.get("decode_responses", True)
+    )
+
+
+async def _load_db_tool_config(db, client_settings: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Herramienta del primer contexto DATABASE_QUERY del cliente (la que usa el chat)."""
+    from sqlalchemy import select
+    from app.models.context_definition import ContextDefinition, ContextMainType
+
+    allowed_ctx_ids = client_settings.get("allowed_context_ids") or []
+    if not allowed_ctx_ids:
+        return None
+    stmt = select(ContextDefinition).where(
+        ContextDefinition.id.in_(allowed_ctx_ids), ContextDefinition.is_active == True,
+        ContextDefinition.main_type == ContextMainType.DATABASE_QUERY
+    )
+    for ctx in (await db.execute(stmt)).scalars().unique().all():
+        tools = (ctx.processing_config or {}).get("tools") or []
+        if tools and tools[0]:
+            return tools[0]
+    return None
+
+
+async def _setup_stub_llm(
+    session_factory, api_client_id: int, stub_config: Dict[str, Any], scenarios: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Crea/actualiza el LLMModelConfig STUB del benchmark y lo fija como override del cliente.
+    Devuelve el config_json efectivo (con los guiones de parámetros de la herramienta de BD).
+    """
+    from app.crud import crud_llm_model_config
+    from app.models.api_client import ApiClient
+    from app.models.llm_model_config import LLMProviderType
+    from app.schemas.schemas import LLMModelConfigCreate, LLMModelConfigUpdate
+
+    async with session_factory() as db:
+        client = await db.get(ApiClient, api_client_id)
+        if client is None:
+            raise SystemExit(f"ApiClient {api_client_id} no encontrado.")
+
+        needs_tool_scripts = any(
+            isinstance(turn, dict) and "tool_parameters" in turn
+            for scenario in scenarios.values() for turn in scenario["turns"]
+        )
+        if needs_tool_scripts:
+            tool_config = await _load_db_tool_config(db, client.settings or {})
+            if tool_config:
+                stub_config = {
+                    **stub_config,
+                    "scripted_responses": list(stub_config.get("scripted_responses") or [])
+                    + _tool_parameter_scripts(scenarios, tool_config),
+                }
+            else:
+                print(f"BENCHMARK: WARN - El cliente {api_client_id} no tiene una herramienta de BD; los turnos con 'tool_parameters' pedirán aclaración.")
+
+        stub = await crud_llm_model_config.get_llm_model_config_by_identifier(db, identifier="stub-benchmark")
+        if stub is None:
+            stub = await crud_llm_model_config.create_llm_model_config(db, model_in=LLMModelConfigCreate(
+                model_identifier="stub-benchmark", display_name="STUB (benchmark)",
+                provider=LLMProviderType.STUB, default_temperature=0.2, config_json=stub_config
+            ))
+        else:
+            stub = await crud_llm_model_config.update_llm_model_config(
+                db, db_model=stub, model_in=LLMModelConfigUpdate(config_json=stub_config, is_active=True)
+            )
+
+        # El CRUD hace commit: los objetos cargados quedan expirados y no se pueden releer sin await.
+        stub_id = stub.id
+        await db.refresh(client)
+        client_settings = dict(client.settings or {})
+        client_settings["default_llm_model_config_id_override"] = stub_id
+        client.settings = client_settings
+        await db.commit()
+        print(f"BENCHMARK: LLM STUB id={stub_id} asignado al cliente {api_client_id}.")
+        return stub_config
+
+
+# ==========================================================
+# ===                   EJECUCIÓN                        ===
+# ==========================================================
+
+async def _virtual_user(
+    http: httpx.AsyncClient, headers: Dict[str, str], scenarios: Dict[str, Any], weights: Dict[str, float],
+    rng: random.Random, stop_at: float, results: List[Dict[str, Any]]
+) -> None:
+    names, scenario_weights = list(weights), list(weights.values())
+    while time.perf_counter() < stop_at:
+        scenario_name = rng.choices(names, weights=scenario_weights)[0]
+        scenario = scenarios[scenario_name]
+        session_id = f"bench-{uuid.uuid4().hex[:24]}"
+        for turn in scenario["turns"]:
+            if time.perf_counter() >= stop_at:
+                return
+            payload = {"message": _turn_message(turn), "session_id": session_id, "is_authenticated_user": scenario.get("authenticated", False)}
+            if payload["is_authenticated_user"]:
+                payload["user_dni"] = scenario.get("user_dni", BENCHMARK_DNI)
+
+            counter = [0]
+            token = _current_query_counter.set(counter)
+            start = time.perf_counter()
+            try:
+                response = await http.post("/api/v1/chat/", json=payload, headers=headers)
+                status_code = response.status_code
+            except Exception as e:
+                status_code = f"exception:{e.__class__.__name__}"
+            finally:
+                _current_query_counter.reset(token)
+            results.append({
+                "scenario": scenario_name,
+                "status": status_code,
+                "latency_ms": (time.perf_counter() - start) * 1000,
+                "db_queries": counter[0],
+            })
+
+
+async def _run_level(
+    http: httpx.AsyncClient, headers: Dict[str, str], scenarios: Dict[str, Any], weights: Dict[str, float],
+    concurrency: int, duration: float, seed: int, in_process: bool
+) -> Dict[str, Any]:
+    results: List[Dict[str, Any]] = []
+    monitor = LoopLagMonitor()
+    queries_before = _total_queries[0]
+    monitor.start()
+    started = time.perf_counter()
+    stop_at = started + duration
+    await asyncio.gather(*(
+        _virtual_user(http, headers, scenarios, weights, random.Random(seed * 1000 + i), stop_at, results)
+        for i in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - started
+    lag_samples = await monitor.stop()
+
+    ok = [r for r in results if r["status"] == 200]
+    by_scenario = defaultdict(list)
+    for r in ok:
+        by_scenario[r["scenario"]].append(r["latency_ms"])
+    return {
+        "concurrency": concurrency,
+        "duration_seconds": round(elapsed, 2),
+        "requests": len(results),
+        "successful": len(ok),
+        "status_counts": dict(Counter(str(r["status"]) for r in results)),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": _summarize([r["latency_ms"] for r in ok]),
+        "latency_ms_by_scenario": {name: _summarize(samples) for name, samples in by_scenario.items()},
+        # Contra un servidor externo no se ven sus consultas ni su event loop.
+        "db_queries_per_request": _summarize([r["db_queries"] for r in results]) if in_process else None,
+        "db_queries_total": _total_queries[0] - queries_before if in_process else None,
+        "event_loop_lag_ms": _summarize(lag_samples) if in_process else None,
+    }
+
+
+def _print_level(level: Dict[str, Any]) -> None:
+    latency = level["latency_ms"]
+    line = (f"c={level['concurrency']:<4} {level['throughput_rps']:8.2f} req/s  "
+            f"p50={latency['p50']} p95={latency['p95']} p99={latency['p99']} ms  "
+            f"ok={level['successful']}/{level['requests']}")
+    if level["db_queries_per_request"]:
+        line += f"  sql/turno={level['db_queries_per_request']['mean']}"
+    if level["event_loop_lag_ms"]:
+        line += f"  lag_p99={level['event_loop_lag_ms']['p99']} ms"
+    print(line)
+
+
+def _compare(current: Dict[str, Any], baseline_path: str) -> None:
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    baseline_levels = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    print(f"\nComparación con {baseline_path} (commit {baseline.get('git_commit')}):")
+    for level in current["levels"]:
+        previous = baseline_levels.get(level["concurrency"])
+        if not previous:
+            continue
+        def _delta(new, old):
+            return f"{(new - old) / old * 100:+.1f}%" if new is not None and old else "n/a"
+        print(f"  c={level['concurrency']:<4} throughput {_delta(level['throughput_rps'], previous['throughput_rps'])}  "
+              f"p95 {_delta(level['latency_ms']['p95'], previous['latency_ms']['p95'])}  "
+              f"p99 {_delta(level['latency_ms']['p99'], previous['latency_ms']['p99'])}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark de throughput del endpoint de chat.")
+    parser.add_argument("--api-client-id", type=int, required=True)
+    parser.add_argument("--api-key", required=True, help="API key en claro del cliente (header X-API-Key).")
+    parser.add_argument("--application-id", help="Por defecto, el application_id de los settings del cliente.")
+    parser.add_argument("--base-url", help="Apuntar a un servidor ya levantado en lugar de arrancar la app en proceso.")
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32", help="Niveles de concurrencia, separados por comas.")
+    parser.add_argument("--duration", type=float, default=20.0, help="Segundos por nivel.")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Segundos de calentamiento (con concurrencia 1) antes de medir.")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Pesos por escenario: nombre=peso,...")
+    parser.add_argument("--scenarios-file", help="JSON {nombre: {authenticated, user_dni?, turns: [texto | {message, tool_parameters?}]}} que reemplaza los escenarios.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--setup-stub-llm", action="store_true", help="Crear/actualizar el LLM STUB y asignarlo al cliente (BD de pruebas).")
+    parser.add_argument("--stub-config", default='{"seed": 42, "latency": {"distribution": "lognormal", "mean_ms": 600, "stddev_ms": 250}, "tokens_per_second": 60}',
+                        help="config_json del LLM STUB.")
+    parser.add_argument("--fakeredis", action="store_true", help="Usar fakeredis en lugar del Redis del .env.")
+    parser.add_argument("--output", help="Ruta del JSON de resultados (por defecto benchmarks/results/chat_throughput_<commit>_<fecha>.json).")
+    parser.add_argument("--compare", help="JSON de una ejecución anterior para mostrar la variación.")
+    args = parser.parse_args()
+
+    scenarios = DEFAULT_SCENARIOS
+    if args.scenarios_file:
+        with open(args.scenarios_file, encoding="utf-8") as f:
+            scenarios = json.load(f)
+    weights = _parse_mix(args.mix, scenarios)
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    in_process = not args.base_url
+
+    if args.fakeredis:
+        _install_fakeredis()
+
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from app.config import settings
+    from app.models.api_client import ApiClient
+
+    setup_engine = create_async_engine(settings.DATABASE_CRUD_URL, pool_pre_ping=True)
+    setup_session_factory = async_sessionmaker(autocommit=False, autoflush=False, bind=setup_engine)
+    stub_config = None
+    try:
+        if args.setup_stub_llm:
+            stub_config = await _setup_stub_llm(setup_session_factory, args.api_client_id, json.loads(args.stub_config), scenarios)
+        application_id = args.application_id
+        if not application_id:
+            async with setup_session_factory() as db:
+                client = await db.get(ApiClient, args.api_client_id)
+                application_id = ((client.settings or {}).get("application_id") if client else None)
+            if not application_id:
+                raise SystemExit("No se pudo determinar el application_id del cliente; use --application-id.")
+    finally:
+        await setup_engine.dispose()
+
+    headers = {"X-API-Key": args.api_key, "X-Application-ID": application_id}
+    timeout = httpx.Timeout(120.0)
+    report: Dict[str, Any] = {
+        "benchmark": "chat_throughput",
+        "git_commit": _git_commit(),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "target": args.base_url or "in-process",
+        "mix": weights,
+        "scenarios": scenarios,
+        "duration_seconds_per_level": args.duration,
+        "seed": args.seed,
+        "stub_config": stub_config,
+        "redis": "fakeredis" if args.fakeredis else "REDIS_URL",
+        "levels": [],
+    }
+
+    async def _run_all(http: httpx.AsyncClient) -> None:
+        if args.warmup > 0:
+            await _run_level(http, headers, scenarios, weights, 1, args.warmup, args.seed, in_process)
+        for concurrency in levels:
+            level = await _run_level(http, headers, scenarios, weights, concurrency, args.duration, args.seed, in_process)
+            report["levels"].append(level)
+            _print_level(level)
+
+    if in_process:
+        from app.main import app
+        event.listen(Engine, "before_cursor_execute", _count_query)
+        try:
+            async with app.router.lifespan_context(app):
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=timeout) as http:
+                    await _run_all(http)
+        finally:
+            event.remove(Engine, "before_cursor_execute", _count_query)
+    else:
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=timeout) as http:
+            await _run_all(http)
+
+    output = args.output or os.path.join(
+        os.path.dirname(__file__), "results",
+        f"chat_throughput_{report['git_commit'] or 'nogit'}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados guardados en {output}")
+
+    if args.compare:
+        _compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,121 @@
+# mi_chatbot_ia/benchmarks/prologue_benchmark.py
+"""
+Benchmark del PRÓLOGO de /api/v1/chat/ (todo lo que ocurre antes de enrutar).
+
+Compara:
+  - secuencial:  contextos -> perfil (+selectin LLM) -> LLM -> historial -> estado  (versión anterior)
+  - frío:        [compilar config: contextos -> perfil+LLM en JOIN] en paralelo con [historial + estado]
+  - caliente:    [config compilada en memoria, 0 consultas] en paralelo con [historial + estado]  (versión actual)
+
+Usa la BD CRUD y Redis reales configurados en el .env. Ejemplo:
+    python -m benchmarks.prologue_benchmark --api-client-id 1 --iterations 200
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from types import SimpleNamespace
+
+from redis import asyncio as aioredis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import selectinload
+
+from app.config import settings
+from app.crud import crud_virtual_agent_profile, crud_llm_model_config
+from app.models.api_client import ApiClient
+from app.models.context_definition import ContextDefinition
+from app.schemas.schemas import ChatRequest
+from app.services import tenant_config_service
+from app.api.endpoints._chat_history_logic import FullyCustomChatMessageHistory
+from app.api.endpoints.chat_api_endpoints import (
+    get_conversation_state_async, _load_turn_configuration, _load_session_state
+)
+
+
+async def sequential_prologue(session_factory, client, req, history, redis_client):
+    """Réplica del prólogo anterior: cinco viajes de red uno tras otro."""
+    async with session_factory() as db:
+        await _sequential_prologue(db, client, req, history, redis_client)
+
+
+async def _sequential_prologue(db, client, req, history, redis_client):
+    api_client_settings = client.settings or {}
+    stmt = select(ContextDefinition).where(
+        ContextDefinition.id.in_(api_client_settings.get("allowed_context_ids", [])), ContextDefinition.is_active == True
+    ).options(selectinload(ContextDefinition.db_connection_config))
+    all_allowed_contexts = (await db.execute(stmt)).scalars().unique().all()
+    active_contexts = all_allowed_contexts if req.is_authenticated_user else [c for c in all_allowed_contexts if c.is_public]
+    vap_id = api_client_settings.get("default_virtual_agent_profile_id_override") or active_contexts[0].virtual_agent_profile_id
+    vap = await crud_virtual_agent_profile.get_fully_loaded_profile(db, vap_id)
+    llm_cfg_id = api_client_settings.get("default_llm_model_config_id_override") or vap.llm_model_config_id or active_contexts[0].default_llm_model_config_id
+    await crud_llm_model_config.get_llm_model_config_by_id(db, llm_cfg_id)
+    await history.get_messages_async()
+    await get_conversation_state_async(redis_client, req.session_id)
+
+
+async def concurrent_prologue(session_factory, client, req, history, redis_client):
+    """Prólogo actual, tal como lo ejecuta `_run_chat_turn`."""
+    app_state = SimpleNamespace(AsyncCrudSessionLocal=session_factory)
+    await asyncio.gather(
+        _load_turn_configuration(app_state, client, req),
+        _load_session_state(history, redis_client, req.session_id)
+    )
+
+
+async def cold_concurrent_prologue(session_factory, client, req, history, redis_client):
+    """Prólogo actual con la configuración compilada invalidada (primer request tras un cambio)."""
+    tenant_config_service.invalidate_local(client.id)
+    await concurrent_prologue(session_factory, client, req, history, redis_client)
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def _measure(name, prologue_fn, session_factory, client, req, redis_client, iterations, warmup):
+    samples = []
+    for i in range(warmup + iterations):
+        history = FullyCustomChatMessageHistory(req.session_id, redis_client=redis_client)
+        start = time.perf_counter()
+        await prologue_fn(session_factory, client, req, history, redis_client)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if i >= warmup:
+            samples.append(elapsed_ms)
+    print(f"{name:<12} p50={statistics.median(samples):7.2f} ms  p95={_percentile(samples, 95):7.2f} ms  "
+          f"media={statistics.mean(samples):7.2f} ms  (n={len(samples)})")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark del prólogo del endpoint de chat.")
+    parser.add_argument("--api-client-id", type=int, required=True)
+    parser.add_argument("--session-id", default="benchmark-prologue-session")
+    parser.add_argument("--authenticated", action="store_true")
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=10)
+    args = parser.parse_args()
+
+    engine = create_async_engine(settings.DATABASE_CRUD_URL, pool_pre_ping=True)
+    session_factory = async_sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    redis_client = aioredis.from_url(settings.REDIS_URL, encoding="utf8", decode_responses=True) if settings.REDIS_URL else None
+
+    try:
+        async with session_factory() as db:
+            client = await db.get(ApiClient, args.api_client_id)
+            if client is None:
+                raise SystemExit(f"ApiClient {args.api_client_id} no encontrado.")
+        req = ChatRequest(message="benchmark", session_id=args.session_id, is_authenticated_user=args.authenticated)
+
+        await _measure("secuencial", sequential_prologue, session_factory, client, req, redis_client, args.iterations, args.warmup)
+        await _measure("frío", cold_concurrent_prologue, session_factory, client, req, redis_client, args.iterations, args.warmup)
+        await _measure("caliente", concurrent_prologue, session_factory, client, req, redis_client, args.iterations, args.warmup)
+    finally:
+        await engine.dispose()
+        if redis_client:
+            await redis_client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
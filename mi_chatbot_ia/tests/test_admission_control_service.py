@@ -0,0 +1,168 @@
+# tests/test_admission_control_service.py
+"""Cola FIFO de `_Limiter`: hand-off directo, plazos, cancelaciones y cambios de límite en caliente."""
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.config import settings
+from app.services import admission_control_service
+from app.services.admission_control_service import AdmissionController, AdmissionRejected, _Limiter
+
+TIMEOUT_SECONDS = 5.0
+
+
+def _deadline(seconds: float = TIMEOUT_SECONDS) -> float:
+    return time.monotonic() + seconds
+
+
+async def _settle() -> None:
+    """Deja correr al loop: un hueco concedido tarda unas vueltas en llegar al waiter (shield + wait_for)."""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def _queue_waiters(limiter: _Limiter, names, acquired):
+    """Encola un waiter por nombre (en orden) y devuelve sus tareas."""
+    async def _wait(name):
+        await limiter.acquire(_deadline(), TIMEOUT_SECONDS)
+        acquired.append(name)
+
+    tasks = []
+    for name in names:
+        tasks.append(asyncio.create_task(_wait(name)))
+        await asyncio.sleep(0)
+    return tasks
+
+
+def test_released_slot_goes_to_the_first_waiter():
+    limiter = _Limiter(limit=1, max_queue=5)
+    acquired = []
+
+    async def _scenario():
+        await limiter.acquire(_deadline(), TIMEOUT_SECONDS)
+        tasks = await _queue_waiters(limiter, ["a", "b", "c"], acquired)
+        assert len(limiter.waiters) == 3
+
+        for expected in (["a"], ["a", "b"], ["a", "b", "c"]):
+            limiter.release()
+            # Hand-off directo: el hueco nunca queda libre para quien llegue después.
+            assert limiter.active == 1
+            await _settle()
+            assert acquired == expected
+        await asyncio.gather(*tasks)
+
+    asyncio.run(_scenario())
+    assert not limiter.waiters
+
+
+def test_full_queue_is_rejected_immediately():
+    limiter = _Limiter(limit=1, max_queue=1)
+
+    async def _scenario():
+        await limiter.acquire(_deadline(), TIMEOUT_SECONDS)
+        tasks = await _queue_waiters(limiter, ["a"], [])
+        with pytest.raises(AdmissionRejected) as rejected:
+            await limiter.acquire(_deadline(), TIMEOUT_SECONDS)
+        limiter.release()
+        await asyncio.gather(*tasks)
+        return rejected.value
+
+    rejected = asyncio.run(_scenario())
+    assert rejected.reason == "queue_full" and rejected.retry_after_seconds == 1
+
+
+def test_timeout_reports_the_effective_queue_timeout():
+    limiter = _Limiter(limit=1, max_queue=5)
+
+    async def _scenario():
+        await limiter.acquire(_deadline(), TIMEOUT_SECONDS)
+        with pytest.raises(AdmissionRejected) as rejected:
+            # Plazo ya vencido, pero calculado con el timeout del cliente (3 s).
+            await limiter.acquire(time.monotonic(), 3.0)
+        return rejected.value
+
+    rejected = asyncio.run(_scenario())
+    assert rejected.reason == "timeout" and rejected.retry_after_seconds == 3
+    assert limiter.active == 1 and not limiter.waiters
+
+
+def test_slot_granted_at_the_deadline_is_returned(monkeypatch):
+    limiter = _Limiter(limit=1, max_queue=5)
+
+    async def _wait_for_that_times_out_as_the_slot_arrives(awaitable, timeout):
+        limiter.release()  # El dueño libera justo cuando vence el plazo del waiter.
+        raise asyncio.TimeoutError
+
+    async def _scenario():
+        await limiter.acquire(_deadline(), TIMEOUT_SECONDS)
+        monkeypatch.setattr(admission_control_service, "asyncio", SimpleNamespace(
+            wait_for=_wait_for_that_times_out_as_the_slot_arrives, shield=asyncio.shield,
+            get_running_loop=asyncio.get_running_loop, TimeoutError=asyncio.TimeoutError,
+            CancelledError=asyncio.CancelledError, Future=asyncio.Future
+        ))
+        with pytest.raises(AdmissionRejected):
+            await limiter.acquire(_deadline(), TIMEOUT_SECONDS)
+
+    asyncio.run(_scenario())
+    # El hueco recibido al vencer el plazo no se pierde.
+    assert limiter.active == 0 and not limiter.waiters
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    limiter = _Limiter(limit=1, max_queue=5)
+    acquired = []
+
+    async def _scenario():
+        await limiter.acquire(_deadline(), TIMEOUT_SECONDS)
+        cancelled, waiting = await _queue_waiters(limiter, ["cancelado", "siguiente"], acquired)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        assert len(limiter.waiters) == 1 and limiter.active == 1
+
+        limiter.release()
+        await waiting
+
+    asyncio.run(_scenario())
+    assert acquired == ["siguiente"] and limiter.active == 1 and not limiter.waiters
+
+
+def test_configure_wakes_waiters_that_now_fit():
+    limiter = _Limiter(limit=1, max_queue=5)
+    acquired = []
+
+    async def _scenario():
+        await limiter.acquire(_deadline(), TIMEOUT_SECONDS)
+        tasks = await _queue_waiters(limiter, ["a", "b", "c"], acquired)
+
+        limiter.configure(limit=3, max_queue=5)
+        await _settle()
+        assert acquired == ["a", "b"] and limiter.active == 3 and len(limiter.waiters) == 1
+
+        limiter.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(_scenario())
+    assert acquired == ["a", "b", "c"]
+
+
+def test_admit_uses_the_client_queue_timeout_for_retry_after(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_CONTROL_ENABLED", True)
+    monkeypatch.setattr(settings, "ADMISSION_QUEUE_TIMEOUT_SECONDS", 10.0)
+    controller = AdmissionController(global_limit=10, global_max_queue=10)
+    client_settings = SimpleNamespace(max_concurrent_requests=1, max_queued_requests=1, queue_timeout_seconds=0.05)
+
+    async def _scenario():
+        async with controller.admit(1, client_settings):
+            with pytest.raises(AdmissionRejected) as rejected:
+                async with controller.admit(1, client_settings):
+                    pass
+        return rejected.value
+
+    rejected = asyncio.run(_scenario())
+    assert rejected.reason == "timeout" and rejected.retry_after_seconds == 1
+    stats = controller.get_stats()
+    assert stats["rejected_timeout"] == 1 and stats["admitted"] == 1
+    assert stats["clients_active"] == 0 and stats["global_active"] == 0
@@ -0,0 +1,90 @@
+# tests/test_bedrock_client.py
+"""
+Las llamadas bloqueantes de boto3 corren en el pool de Bedrock: mientras un `invoke_model`
+lento (`time.sleep`) está en curso, el event loop sigue atendiendo a otras corrutinas.
+"""
+import asyncio
+import io
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.llm_integrations.bedrock_client import BedrockClient
+from app.models.llm_model_config import LLMProviderType
+
+SLOW_CALL_SECONDS = 0.5
+TICK_SECONDS = 0.01
+
+
+@pytest.fixture
+def bedrock_client(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    config = SimpleNamespace(
+        config_json={"aws_region": "us-east-1"}, model_identifier="anthropic.claude-3-haiku-20240307-v1:0",
+        display_name="Bedrock de prueba", provider=LLMProviderType.BEDROCK,
+        default_max_tokens=64, default_temperature=0.0
+    )
+    return BedrockClient(config)
+
+
+async def _run_with_ticker(operation):
+    """Ejecuta `operation()` junto a un ticker; devuelve (resultado, ticks, máximo retraso del loop en s)."""
+    ticks, max_lag = 0, 0.0
+    done = asyncio.Event()
+
+    async def _ticker():
+        nonlocal ticks, max_lag
+        while not done.is_set():
+            expected = time.perf_counter() + TICK_SECONDS
+            await asyncio.sleep(TICK_SECONDS)
+            max_lag = max(max_lag, time.perf_counter() - expected)
+            ticks += 1
+
+    ticker_task = asyncio.create_task(_ticker())
+    try:
+        result = await operation()
+    finally:
+        done.set()
+        await ticker_task
+    return result, ticks, max_lag
+
+
+def test_invoke_keeps_event_loop_responsive(bedrock_client, monkeypatch):
+    def _slow_invoke_model(**kwargs):
+        time.sleep(SLOW_CALL_SECONDS)
+        body = {"content": [{"type": "text", "text": "Hola desde Bedrock"}]}
+        return {"body": io.BytesIO(json.dumps(body).encode())}
+
+    monkeypatch.setattr(bedrock_client.client, "invoke_model", _slow_invoke_model)
+
+    result, ticks, max_lag = asyncio.run(_run_with_ticker(lambda: bedrock_client.invoke("hola")))
+
+    assert result == "Hola desde Bedrock"
+    assert ticks >= (SLOW_CALL_SECONDS / TICK_SECONDS) / 2
+    assert max_lag < SLOW_CALL_SECONDS / 5
+
+
+def test_stream_keeps_event_loop_responsive(bedrock_client, monkeypatch):
+    def _events():
+        for text in ("Hola ", "desde ", "Bedrock"):
+            time.sleep(SLOW_CALL_SECONDS / 3)
+            chunk = {"type": "content_block_delta", "delta": {"text": text}}
+            yield {"chunk": {"bytes": json.dumps(chunk).encode()}}
+
+    def _slow_invoke_model_with_response_stream(**kwargs):
+        time.sleep(SLOW_CALL_SECONDS)
+        return {"body": _events()}
+
+    monkeypatch.setattr(bedrock_client.client, "invoke_model_with_response_stream", _slow_invoke_model_with_response_stream)
+
+    async def _collect():
+        return [chunk async for chunk in bedrock_client.stream("hola")]
+
+    chunks, ticks, max_lag = asyncio.run(_run_with_ticker(_collect))
+
+    assert chunks == ["Hola ", "desde ", "Bedrock"]
+    assert ticks >= (2 * SLOW_CALL_SECONDS / TICK_SECONDS) / 2
+    assert max_lag < SLOW_CALL_SECONDS / 5
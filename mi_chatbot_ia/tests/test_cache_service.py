@@ -0,0 +1,87 @@
+# tests/test_cache_service.py
+"""Caché de respuestas: L1 (`TTLLRUCache`), normalización y clave de la pregunta."""
+import asyncio
+import datetime
+from types import SimpleNamespace
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from app.api.endpoints.chat_api_endpoints import _is_history_independent_question
+from app.schemas.schemas import ChatRequest
+from app.services import cache_service
+from app.services.cache_service import TTLLRUCache, _normalize_question
+
+
+def test_ttl_lru_cache_evicts_least_recently_used():
+    cache = TTLLRUCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" pasa a ser la más reciente
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_ttl_lru_cache_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_service.time, "monotonic", lambda: now[0])
+    cache = TTLLRUCache(max_entries=10, ttl_seconds=5)
+    cache.set("default_ttl", "x")
+    cache.set("long_ttl", "y", ttl_seconds=60)
+
+    now[0] += 10
+    assert cache.get("default_ttl") is None
+    assert cache.get("long_ttl") == "y"
+    assert len(cache) == 1
+
+
+def test_ttl_lru_cache_delete_where_and_clear():
+    cache = TTLLRUCache(max_entries=10, ttl_seconds=60)
+    for key, value in (("a", {1, 2}), ("b", {2}), ("c", {3})):
+        cache.set(key, value)
+
+    assert cache.delete_where(lambda config_ids: 2 in config_ids) == 2
+    assert cache.get("c") == {3}
+    cache.delete("c")
+    cache.set("d", {4})
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_normalize_question_ignores_case_spacing_and_edge_punctuation():
+    assert _normalize_question("  ¿Cómo   PAGO la\tmatrícula?? ") == "cómo pago la matrícula"
+    assert _normalize_question("¡Hola!") == "hola"
+    # La puntuación interna sí cuenta.
+    assert _normalize_question("¿horario: lunes?") == "horario: lunes"
+
+
+def test_response_cache_key_depends_on_scope_but_not_on_trivial_variations():
+    key = cache_service.get_response_cache_key(1, [3, 2], "¿Cómo pago la matrícula?", "vap:1@|ingest:2=0,3=0")
+    assert key == cache_service.get_response_cache_key(1, [2, 3, 3], "cómo pago la matrícula", "vap:1@|ingest:2=0,3=0")
+    assert key != cache_service.get_response_cache_key(1, [2, 3], "cómo pago la matrícula", "vap:1@|ingest:2=1,3=0")
+    assert key != cache_service.get_response_cache_key(2, [2, 3], "cómo pago la matrícula", "vap:1@|ingest:2=0,3=0")
+
+
+def test_response_cache_scope_tracks_agent_edits_and_ingest_versions(monkeypatch):
+    monkeypatch.setattr(cache_service.semantic_cache_service, "_local_ingest_versions", {2: 4})
+    vap = SimpleNamespace(id=9, updated_at=datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc))
+    scope = asyncio.run(cache_service.get_response_cache_scope_async(None, vap, [3, 2]))
+    assert scope == "vap:9@2026-01-01T00:00:00+00:00|ingest:2=4,3=0"
+
+    vap.updated_at = datetime.datetime(2026, 1, 2, tzinfo=datetime.timezone.utc)
+    assert asyncio.run(cache_service.get_response_cache_scope_async(None, vap, [3, 2])) != scope
+
+
+def test_follow_up_questions_are_not_shared():
+    history = [HumanMessage(content="¿Cómo pago la matrícula?"), AIMessage(content="Desde la intranet.")]
+    follow_up = ChatRequest(message="¿y cuándo vence?", session_id="session-cache-1")
+    standalone = ChatRequest(message="¿Cuándo vence el pago de la matrícula?", session_id="session-cache-2")
+
+    assert _is_history_independent_question(follow_up, []) is True
+    assert _is_history_independent_question(follow_up, history) is False
+    assert _is_history_independent_question(standalone, history) is True
+    # El saludo inicial no cuenta como historial.
+    greeting_only = [HumanMessage(content="__INICIAR_CHAT__"), AIMessage(content="¡Hola! Soy tu asistente.")]
+    assert _is_history_independent_question(follow_up, greeting_only) is True
@@ -0,0 +1,85 @@
+# tests/test_chat_history_logic.py
+"""Ventanas de historial, resumen acumulado de los turnos descartados y limpieza de la sesión."""
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from app.api.endpoints import _chat_history_logic
+from app.api.endpoints._chat_history_logic import (
+    GREETING_TRIGGER_MESSAGE, SUMMARY_MESSAGE_PREFIX, FullyCustomChatMessageHistory,
+    get_history_summary, get_history_window
+)
+from app.config import settings
+
+
+def _turn(question: str, answer: str):
+    return [HumanMessage(content=question), AIMessage(content=answer)]
+
+
+def test_history_window_never_includes_the_summary():
+    summary = SystemMessage(content=f"{SUMMARY_MESSAGE_PREFIX}¿Qué carreras hay?")
+    conversation = _turn("¿Cómo pago?", "En la intranet.") + _turn("¿Y cuándo?", "En marzo.")
+    history = [summary, *conversation]
+
+    assert get_history_window(history, 2) == conversation[-2:]
+    assert get_history_window(history, 10) == conversation
+    assert get_history_window(history, 0) == []  # La ruta SQL no recibe historial ni resumen.
+    assert get_history_summary(history) == summary.content
+    assert get_history_summary(conversation) == "" and get_history_window(conversation, 0) == []
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")  # EVALSHA en fakeredis.
+    monkeypatch.setattr(settings, "CHAT_HISTORY_SUMMARY_ENABLED", True)
+    monkeypatch.setattr(settings, "CHAT_HISTORY_MAX_STORED_MESSAGES", 4)
+    monkeypatch.setattr(settings, "CHAT_HISTORY_SUMMARY_MAX_CHARS", 1500)
+    monkeypatch.setattr(settings, "SESSION_LEGACY_KEYS_MIGRATION_ENABLED", False)
+    monkeypatch.setattr(_chat_history_logic, "_append_scripts", {})
+    return fakeredis.aioredis.FakeRedis(decode_responses=True)
+
+
+def test_evicted_questions_are_folded_into_the_summary(redis_client):
+    history = FullyCustomChatMessageHistory("sesion-resumen", redis_client)
+
+    async def _scenario():
+        await history.add_messages_async(_turn(GREETING_TRIGGER_MESSAGE, "¡Hola!"))
+        for question, answer in (("¿Cómo pago?", "En la intranet."), ("¿Y cuándo?", "En marzo."), ("¿Hay mora?", "Sí.")):
+            await history.add_messages_async(_turn(question, answer))
+        return await history.get_messages_async()
+
+    messages = asyncio.run(_scenario())
+    # El saludo no cuenta como pregunta; el resumen va primero y la ventana conserva 4 mensajes.
+    assert get_history_summary(messages) == f"{SUMMARY_MESSAGE_PREFIX}¿Cómo pago?"
+    assert [m.content for m in get_history_window(messages, 10)] == ["¿Y cuándo?", "En marzo.", "¿Hay mora?", "Sí."]
+
+
+def test_summary_keeps_the_most_recent_text_without_splitting_characters(redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_HISTORY_MAX_STORED_MESSAGES", 2)
+    monkeypatch.setattr(settings, "CHAT_HISTORY_SUMMARY_MAX_CHARS", 13)
+    history = FullyCustomChatMessageHistory("sesion-recorte", redis_client)
+
+    async def _scenario():
+        for question in ("¿Cuál es la sede?", "¿Qué días atienden?", "¿Y el teléfono?"):
+            await history.add_messages_async(_turn(question, "Respuesta."))
+        return await redis_client.get(history.summary_key)
+
+    summary = asyncio.run(_scenario())
+    # Los últimos 13 bytes empiezan a mitad de la "í": se descarta el byte suelto.
+    assert summary == "...as atienden?"
+
+
+def test_clear_removes_history_and_summary(redis_client):
+    history = FullyCustomChatMessageHistory("sesion-limpia", redis_client)
+
+    async def _scenario():
+        for index in range(4):
+            await history.add_messages_async(_turn(f"pregunta {index}", "respuesta"))
+        assert await redis_client.exists(history.key, history.summary_key) == 2
+        await history.clear_async()
+        return await redis_client.exists(history.key, history.summary_key)
+
+    assert asyncio.run(_scenario()) == 0
+
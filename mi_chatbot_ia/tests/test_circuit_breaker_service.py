@@ -0,0 +1,132 @@
+# tests/test_circuit_breaker_service.py
+"""Transiciones del circuit breaker (CLOSED -> OPEN -> HALF_OPEN -> CLOSED/OPEN) y failover."""
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.config import settings
+from app.llm_integrations.stub_chat_model import StubChatModel
+from app.llm_integrations.stub_client import StubResponder
+from app.services import circuit_breaker_service
+from app.services.circuit_breaker_service import (
+    CircuitBreaker, CircuitBreakerRunnable, CircuitOpenError, STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Reloj de pared controlado por la prueba (el breaker usa `time.time()`)."""
+    fake_clock = SimpleNamespace(now=1_000_000.0)
+    monkeypatch.setattr(circuit_breaker_service, "time", SimpleNamespace(
+        time=lambda: fake_clock.now, perf_counter=time.perf_counter
+    ))
+    return fake_clock
+
+
+@pytest.fixture(autouse=True)
+def _breaker_settings(monkeypatch):
+    monkeypatch.setattr(circuit_breaker_service, "_redis_client", None)
+    monkeypatch.setattr(circuit_breaker_service, "_breakers", {})
+    for name, value in {
+        "LLM_BREAKER_WINDOW_SECONDS": 60, "LLM_BREAKER_MIN_CALLS": 4,
+        "LLM_BREAKER_ERROR_RATE_THRESHOLD": 0.5, "LLM_BREAKER_SLOW_CALL_MS": 1000,
+        "LLM_BREAKER_SLOW_CALL_RATE_THRESHOLD": 0.5, "LLM_BREAKER_OPEN_SECONDS": 30,
+    }.items():
+        monkeypatch.setattr(settings, name, value)
+
+
+def _open_breaker(breaker: CircuitBreaker) -> None:
+    for _ in range(settings.LLM_BREAKER_MIN_CALLS):
+        breaker.record_failure(10)
+
+
+def test_stays_closed_below_minimum_calls(clock):
+    breaker = CircuitBreaker(1, "primario")
+    for _ in range(settings.LLM_BREAKER_MIN_CALLS - 1):
+        breaker.record_failure(10)
+    assert breaker.state == STATE_CLOSED and breaker.allow_request()
+
+
+def test_opens_on_error_rate_and_rejects_calls(clock):
+    breaker = CircuitBreaker(1, "primario")
+    breaker.record_success(10)
+    breaker.record_success(10)
+    breaker.record_failure(10)
+    assert breaker.state == STATE_CLOSED
+    breaker.record_failure(10)  # 2 de 4 -> tasa de error 0.5
+
+    assert breaker.state == STATE_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.get_stats()["rejected_calls"] == 1
+
+
+def test_opens_on_slow_call_rate(clock):
+    breaker = CircuitBreaker(1, "primario")
+    for latency_ms in (100, 100, 1500, 2000):
+        breaker.record_success(latency_ms)
+    assert breaker.state == STATE_OPEN
+
+
+def test_old_outcomes_leave_the_window(clock):
+    breaker = CircuitBreaker(1, "primario")
+    for _ in range(3):
+        breaker.record_failure(10)
+    clock.now += settings.LLM_BREAKER_WINDOW_SECONDS + 1
+    breaker.record_success(10)
+    assert breaker.state == STATE_CLOSED
+    assert breaker.get_stats()["calls_in_window"] == 1
+
+
+def test_half_open_allows_a_single_probe_and_closes_on_success(clock):
+    breaker = CircuitBreaker(1, "primario")
+    _open_breaker(breaker)
+    clock.now += settings.LLM_BREAKER_OPEN_SECONDS + 1
+
+    assert breaker.allow_request() is True
+    assert breaker.state == STATE_HALF_OPEN
+    assert breaker.allow_request() is False  # Solo UNA llamada de prueba.
+
+    breaker.record_success(10)
+    assert breaker.state == STATE_CLOSED and breaker.allow_request()
+
+
+def test_half_open_reopens_on_failed_probe(clock):
+    breaker = CircuitBreaker(1, "primario")
+    _open_breaker(breaker)
+    clock.now += settings.LLM_BREAKER_OPEN_SECONDS + 1
+    assert breaker.allow_request()
+
+    breaker.record_failure(10)
+    assert breaker.state == STATE_OPEN
+    assert breaker.open_until == clock.now + settings.LLM_BREAKER_OPEN_SECONDS
+    assert breaker.get_stats()["times_opened"] == 2
+
+
+def test_abandoned_probe_frees_the_half_open_slot(clock):
+    breaker = CircuitBreaker(1, "primario")
+    _open_breaker(breaker)
+    clock.now += settings.LLM_BREAKER_OPEN_SECONDS + 1
+    assert breaker.allow_request()
+
+    breaker.abandon_call()
+    assert breaker.state == STATE_HALF_OPEN and breaker.allow_request()
+
+
+def test_open_breaker_fails_over_without_calling_the_primary(clock):
+    primary = StubChatModel(responder=StubResponder({"failure_rate": 1.0}), model_name="primario")
+    fallback = StubChatModel(responder=StubResponder({"default_text": "Respuesta de respaldo."}), model_name="respaldo")
+    primary_breaker = CircuitBreaker(1, "primario")
+    resilient_llm = CircuitBreakerRunnable(primary, primary_breaker).with_fallbacks(
+        [CircuitBreakerRunnable(fallback, CircuitBreaker(2, "respaldo"))]
+    )
+
+    for _ in range(settings.LLM_BREAKER_MIN_CALLS):
+        assert asyncio.run(resilient_llm.ainvoke("hola")).content == "Respuesta de respaldo."
+    assert primary_breaker.state == STATE_OPEN
+
+    rejected_before = primary_breaker.rejected_calls
+    assert asyncio.run(resilient_llm.ainvoke("hola")).content == "Respuesta de respaldo."
+    assert primary_breaker.rejected_calls == rejected_before + 1
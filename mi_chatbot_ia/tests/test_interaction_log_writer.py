@@ -0,0 +1,166 @@
+# tests/test_interaction_log_writer.py
+"""Escritor de logs en segundo plano: lotes, políticas de desborde de la cola y drenado al apagar."""
+import asyncio
+from typing import List, Optional
+
+from app.config import settings
+from app.services import interaction_log_writer
+from app.services.interaction_log_writer import InteractionLogWriter
+
+
+class FakeSession:
+    def __init__(self, factory: "FakeSessionFactory"):
+        self.factory = factory
+
+    async def __aenter__(self):
+        if self.factory.gate is not None:
+            await self.factory.gate.wait()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def execute(self, statement, rows):
+        self.factory.batches.append([row["user_message"] for row in rows])
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        pass
+
+
+class FakeSessionFactory:
+    """Sustituye a `AsyncSessionLocal`: guarda cada lote insertado; `gate` retiene las escrituras."""
+
+    def __init__(self, gate: Optional[asyncio.Event] = None):
+        self.gate = gate
+        self.batches: List[List[str]] = []
+
+    def __call__(self):
+        return FakeSession(self)
+
+    @property
+    def written(self) -> List[str]:
+        return [message for batch in self.batches for message in batch]
+
+
+def _log(message: str):
+    return {"user_message": message, "bot_response": "ok", "campo_desconocido": "se ignora"}
+
+
+async def _settle() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_logs_are_written_in_batches():
+    factory = FakeSessionFactory()
+
+    async def _scenario():
+        writer = InteractionLogWriter(factory, max_queue_size=10, batch_size=2, flush_interval_seconds=5)
+        writer.start()
+        for index in range(5):
+            await writer.submit(_log(f"m{index}"))
+        await writer.stop()
+        return writer.get_stats()
+
+    stats = asyncio.run(_scenario())
+    assert factory.batches == [["m0", "m1"], ["m2", "m3"], ["m4"]]
+    assert stats["written"] == 5 and stats["batches"] == 3 and stats["dropped"] == 0
+
+
+def test_drop_newest_discards_the_incoming_log():
+    factory = FakeSessionFactory()
+
+    async def _scenario():
+        # Sin arrancar el escritor: nadie consume y la cola se llena.
+        writer = InteractionLogWriter(factory, max_queue_size=2, batch_size=10, overflow_policy="drop_newest")
+        for index in range(4):
+            await writer.submit(_log(f"m{index}"))
+        writer.start()
+        await writer.stop()
+        return writer.get_stats()
+
+    stats = asyncio.run(_scenario())
+    assert factory.written == ["m0", "m1"]
+    assert stats["enqueued"] == 4 and stats["dropped"] == 2 and stats["written"] == 2
+
+
+def test_drop_oldest_keeps_the_most_recent_logs():
+    factory = FakeSessionFactory()
+
+    async def _scenario():
+        writer = InteractionLogWriter(factory, max_queue_size=2, batch_size=10, overflow_policy="drop_oldest")
+        for index in range(4):
+            await writer.submit(_log(f"m{index}"))
+        writer.start()
+        await writer.stop()
+        return writer.get_stats()
+
+    stats = asyncio.run(_scenario())
+    assert factory.written == ["m2", "m3"]
+    assert stats["dropped"] == 2 and stats["written"] == 2 and stats["delayed"] == 0
+
+
+def test_drop_oldest_never_discards_the_stop_sentinel():
+    factory = FakeSessionFactory()
+
+    async def _scenario():
+        writer = InteractionLogWriter(factory, max_queue_size=1, batch_size=10, overflow_policy="drop_oldest")
+        # Cola llena con el centinela en cabeza (apagado en curso).
+        writer._queue.put_nowait(interaction_log_writer._STOP)
+        await writer.submit(_log("tardío"))
+        assert writer._queue.qsize() == 1 and writer._queue.get_nowait() is interaction_log_writer._STOP
+        return writer.get_stats()
+
+    stats = asyncio.run(_scenario())
+    assert stats["dropped"] == 1 and factory.written == []
+
+
+def test_block_policy_waits_for_room_then_gives_up(monkeypatch):
+    monkeypatch.setattr(settings, "INTERACTION_LOG_BLOCK_TIMEOUT_SECONDS", 0.05)
+    factory = FakeSessionFactory()
+
+    async def _scenario():
+        writer = InteractionLogWriter(
+            factory, max_queue_size=1, batch_size=1, flush_interval_seconds=0.01, overflow_policy="block"
+        )
+        await writer.submit(_log("m0"))
+        # Nadie consume: vence el plazo y el log se descarta.
+        await writer.submit(_log("perdido"))
+        assert writer.get_stats()["dropped"] == 1
+
+        # El escritor libera hueco mientras la petición espera: el log entra con retraso.
+        waiting = asyncio.create_task(writer.submit(_log("m1")))
+        await _settle()
+        writer.start()
+        await waiting
+        await writer.stop()
+        return writer.get_stats()
+
+    stats = asyncio.run(_scenario())
+    assert factory.written == ["m0", "m1"]
+    assert stats["delayed"] == 2 and stats["dropped"] == 1 and stats["written"] == 2
+
+
+def test_stop_writes_logs_queued_after_the_sentinel():
+    gate = asyncio.Event()
+    factory = FakeSessionFactory(gate=gate)
+
+    async def _scenario():
+        writer = InteractionLogWriter(factory, max_queue_size=10, batch_size=1, flush_interval_seconds=0.01)
+        writer.start()
+        await writer.submit(_log("antes"))
+        await _settle()  # El escritor toma "antes" y queda retenido en la BD.
+
+        stopping = asyncio.create_task(writer.stop())
+        await _settle()  # El centinela ya está en la cola.
+        await writer.submit(_log("durante el apagado"))
+        gate.set()
+        await stopping
+        return writer.get_stats()
+
+    stats = asyncio.run(_scenario())
+    assert factory.batches == [["antes"], ["durante el apagado"]]
+    assert stats["written"] == 2 and stats["queue_size"] == 0 and stats["running"] is False
@@ -0,0 +1,109 @@
+# tests/test_llm_adapter_cache.py
+"""Precalentamiento: construye al arrancar exactamente los LLM (y respaldos) que pedirá el chat."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.config import settings
+from app.models.llm_model_config import LLMProviderType
+from app.services import llm_adapter_cache, tenant_config_service
+from app.services.tenant_config_service import LLM_PIPELINE_STEPS, CompiledTenantConfig, StepLLMConfig, TenantView
+
+
+def _stub_config(config_id: int, default_temperature=None, fallback_config_ids=None):
+    return SimpleNamespace(
+        id=config_id, updated_at=None, display_name=f"stub-{config_id}", model_identifier=f"stub-model-{config_id}",
+        provider=LLMProviderType.STUB, api_key_encrypted=None, config_json={}, default_max_tokens=None,
+        default_temperature=default_temperature, base_url=None, fallback_config_ids=fallback_config_ids, is_active=True
+    )
+
+
+class FakeSession:
+    def __init__(self, clients):
+        self.clients = clients
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def execute(self, statement):
+        return SimpleNamespace(scalars=lambda: SimpleNamespace(all=lambda: self.clients))
+
+
+def _compiled(view: TenantView) -> CompiledTenantConfig:
+    return CompiledTenantConfig(
+        api_client_id=1, all_allowed_contexts=(), public_view=None, authenticated_view=view,
+        public_error=(404, "Sin contextos públicos."), authenticated_error=None, compiled_at=0.0
+    )
+
+
+def _view(main_step: StepLLMConfig, step_llms=None) -> TenantView:
+    return TenantView(
+        active_contexts=(), vap=SimpleNamespace(name="Agente"), llm_config=main_step.llm_config,
+        temperature=main_step.temperature, max_tokens_override=main_step.max_tokens_override,
+        fallback_llm_configs=main_step.fallback_llm_configs,
+        step_llms=step_llms or dict.fromkeys(LLM_PIPELINE_STEPS, main_step)
+    )
+
+
+@pytest.fixture(autouse=True)
+def _clean_adapter_cache(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_CIRCUIT_BREAKER_ENABLED", False)
+    llm_adapter_cache.invalidate_config()
+    yield
+    llm_adapter_cache.invalidate_config()
+
+
+def _builds() -> int:
+    return llm_adapter_cache.get_adapter_cache_stats()["builds"]
+
+
+def _prewarm(monkeypatch, view: TenantView) -> int:
+    async def _get_compiled(session_factory, client):
+        return _compiled(view)
+
+    monkeypatch.setattr(tenant_config_service, "get_compiled_tenant_config", _get_compiled)
+    clients = [SimpleNamespace(id=1, name="portal", settings={})]
+    return asyncio.run(llm_adapter_cache.prewarm_async(lambda: FakeSession(clients)))
+
+
+def test_prewarm_builds_the_resolved_llm_and_its_fallbacks_for_every_step(monkeypatch):
+    # El LLM resuelto puede venir del override del cliente o del contexto: el agente no tiene uno propio.
+    main_config, fallback_config = _stub_config(1, fallback_config_ids=[2]), _stub_config(2)
+    main_step = StepLLMConfig(main_config, 0.2, 256, (fallback_config,))
+
+    builds_before = _builds()
+    assert _prewarm(monkeypatch, _view(main_step)) == len(LLM_PIPELINE_STEPS)
+    assert _builds() - builds_before == 2  # principal + respaldo
+    warmed_llms = len(llm_adapter_cache._resilient_llms)
+
+    for step in LLM_PIPELINE_STEPS:
+        llm = llm_adapter_cache.get_resilient_llm(main_config, 0.2, 256, (fallback_config,), step=step)
+        assert llm_adapter_cache.describe_llm(llm)["model"] == "1:stub-model-1|2:stub-model-2"
+    # Las peticiones encuentran lo ya construido: ni adaptadores ni composiciones nuevas.
+    assert _builds() - builds_before == 2
+    assert len(llm_adapter_cache._resilient_llms) == warmed_llms
+
+
+def test_prewarm_uses_each_step_config_temperature_and_max_tokens(monkeypatch):
+    main_config, routing_config, answer_config = _stub_config(1), _stub_config(3, default_temperature=0.0), _stub_config(4)
+    main_step = StepLLMConfig(main_config, 0.7, 512, ())
+    step_llms = {
+        **dict.fromkeys(LLM_PIPELINE_STEPS, main_step),
+        # Paso auxiliar: temperatura por defecto de su config y sin max_tokens del agente.
+        "routing": StepLLMConfig(routing_config, 0.0, None, ()),
+        # Respuesta: temperatura resuelta (override del agente) y max_tokens principal.
+        "answer": StepLLMConfig(answer_config, 0.7, 512, ()),
+    }
+    builds_before = _builds()
+    _prewarm(monkeypatch, _view(main_step, step_llms))
+    warmed_llms = len(llm_adapter_cache._resilient_llms)
+
+    llm_adapter_cache.get_resilient_llm(routing_config, 0.0, None, (), step="routing")
+    llm_adapter_cache.get_resilient_llm(answer_config, 0.7, 512, (), step="answer")
+    llm_adapter_cache.get_resilient_llm(main_config, 0.7, 512, (), step="condense")
+    assert len(llm_adapter_cache._resilient_llms) == warmed_llms
+    assert _builds() - builds_before == 3
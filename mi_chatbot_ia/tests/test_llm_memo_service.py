@@ -0,0 +1,103 @@
+# tests/test_llm_memo_service.py
+"""Reglas de elegibilidad de la memoización de sub-llamadas y su comportamiento con L1."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from app.config import settings
+from app.llm_integrations.stub_chat_model import StubChatModel
+from app.llm_integrations.stub_client import StubResponder
+from app.models.llm_model_config import LLMProviderType
+from app.services import llm_adapter_cache, llm_memo_service
+from app.services.cache_service import TTLLRUCache
+from app.services.llm_memo_service import MemoizedRunnable
+
+
+class CountingResponder(StubResponder):
+    def __init__(self, config_data=None):
+        super().__init__(config_data or {})
+        self.calls = 0
+
+    def respond(self, prompt: str):
+        self.calls += 1
+        return super().respond(prompt)
+
+
+def _stub_config(config_id: int = 1):
+    return SimpleNamespace(
+        id=config_id, updated_at=None, display_name=f"stub-{config_id}", model_identifier=f"stub-model-{config_id}",
+        provider=LLMProviderType.STUB, api_key_encrypted=None, config_json={}, default_max_tokens=None,
+        base_url=None, fallback_config_ids=None
+    )
+
+
+@pytest.fixture(autouse=True)
+def _memo_settings(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MEMO_ENABLED", True)
+    monkeypatch.setattr(settings, "LLM_MEMO_MAX_TEMPERATURE", 0.2)
+    monkeypatch.setattr(settings, "LLM_CIRCUIT_BREAKER_ENABLED", False)
+    monkeypatch.setattr(llm_memo_service, "_redis_client", None)
+    monkeypatch.setattr(llm_memo_service, "_memo_l1", TTLLRUCache(max_entries=100, ttl_seconds=60))
+    monkeypatch.setattr(llm_memo_service, "_memo_stats", dict.fromkeys(llm_memo_service._memo_stats, 0))
+    llm_adapter_cache.invalidate_config()
+    yield
+    llm_adapter_cache.invalidate_config()
+
+
+def _chain_for(llm):
+    return llm | JsonOutputParser()
+
+
+def test_low_temperature_cached_adapter_is_memoized():
+    llm = llm_adapter_cache.get_adapter(_stub_config(), temperature=0.0)
+    memoized = llm_memo_service.memoize("router", llm, _chain_for(llm))
+    assert isinstance(memoized, MemoizedRunnable)
+    assert memoized.model == "1:stub-model-1" and memoized.temperature == 0.0
+
+
+def test_high_temperature_adapter_is_not_memoized():
+    llm = llm_adapter_cache.get_adapter(_stub_config(), temperature=0.7)
+    chain = _chain_for(llm)
+    assert llm_memo_service.memoize("router", llm, chain) is chain
+    assert llm_memo_service.get_memo_stats()["ineligible_chains"] == 1
+
+
+def test_unknown_llm_is_not_memoized():
+    # Un modelo que no salió de llm_adapter_cache no tiene identidad conocida (modelo, temperatura).
+    llm = StubChatModel(responder=StubResponder({}), model_name="suelto")
+    chain = _chain_for(llm)
+    assert llm_memo_service.memoize("router", llm, chain) is chain
+    assert llm_memo_service.get_memo_stats()["ineligible_chains"] == 1
+
+
+def test_disabled_setting_returns_chain_untouched(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MEMO_ENABLED", False)
+    llm = llm_adapter_cache.get_adapter(_stub_config(), temperature=0.0)
+    chain = _chain_for(llm)
+    assert llm_memo_service.memoize("router", llm, chain) is chain
+    assert llm_memo_service.get_memo_stats()["ineligible_chains"] == 0
+
+
+def test_step_llm_keeps_its_identity_for_memoization():
+    llm = llm_adapter_cache.get_resilient_llm(_stub_config(), temperature=0.1, step="routing")
+    assert isinstance(llm_memo_service.memoize("router", llm, _chain_for(llm)), MemoizedRunnable)
+
+
+def test_identical_prompts_hit_l1_and_call_the_model_once():
+    llm = llm_adapter_cache.get_adapter(_stub_config(), temperature=0.0)
+    responder = CountingResponder({"scripted_responses": [{"match": "enruta", "response": {"tool_to_use": "DATABASE_TOOL"}}]})
+    llm.responder = responder
+    prompt = ChatPromptTemplate.from_template("enruta: {question}")
+    chain = prompt | llm_memo_service.memoize("router", llm, _chain_for(llm))
+
+    first = asyncio.run(chain.ainvoke({"question": "mis notas"}))
+    second = asyncio.run(chain.ainvoke({"question": "mis notas"}))
+    other = asyncio.run(chain.ainvoke({"question": "mi horario"}))
+
+    assert first == second == other == {"tool_to_use": "DATABASE_TOOL"}
+    assert responder.calls == 2
+    stats = llm_memo_service.get_memo_stats()
+    assert stats["l1_hits"] == 1 and stats["misses"] == 2 and stats["sets"] == 2
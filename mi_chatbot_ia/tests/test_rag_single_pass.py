@@ -0,0 +1,127 @@
+# tests/test_rag_single_pass.py
+"""
+Regresión del RAG en una sola pasada: por turno, UNA condensación, UNA recuperación y
+UNA respuesta. Cada paso usa su propio modelo de prueba, que cuenta sus llamadas.
+"""
+import asyncio
+from types import SimpleNamespace
+from typing import List
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+from app.api.endpoints._chat_history_logic import SUMMARY_MESSAGE_PREFIX
+from app.api.endpoints.chat_api_endpoints import TurnLLMs, handle_new_question
+from app.config import settings
+from app.models.context_definition import ContextMainType
+from app.schemas.schemas import ChatRequest
+from app.services import prompt_registry
+
+# Inicio fijo del prompt de condensación: distingue esa llamada de la de respuesta.
+CONDENSE_PROMPT_PREFIX = settings.DEFAULT_RAG_CONDENSE_QUESTION_TEMPLATE.split("{")[0]
+
+
+class CountingChatModel(BaseChatModel):
+    """Chat model de prueba: responde un texto fijo y guarda el tipo (y los mensajes) de cada llamada."""
+
+    calls: List[str] = []
+    received: List[List[BaseMessage]] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "counting"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        kind = "condense" if CONDENSE_PROMPT_PREFIX in prompt else "answer"
+        self.calls.append(kind)
+        self.received.append(list(messages))
+        text = "¿Cuándo vence el pago de la matrícula?" if kind == "condense" else "Vence el 30 de marzo."
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+
+class FakeVectorStore:
+    def __init__(self):
+        self.queries: List[str] = []
+
+    def _search(self, query: str):
+        self.queries.append(query)
+        return [Document(page_content="La matrícula se paga en la intranet.", metadata={"source": "guia.pdf", "page_number": 1})]
+
+    def as_retriever(self, search_kwargs=None):
+        return RunnableLambda(self._search)
+
+
+@pytest.fixture(autouse=True)
+def _isolated_prompt_registry():
+    # Las cadenas se registran por id(llm): un id reciclado de otra prueba devolvería su cadena.
+    prompt_registry.clear()
+    yield
+    prompt_registry.clear()
+
+
+def _run_turn(message: str, history_list: List, session_id: str, streaming: bool = False):
+    llms = TurnLLMs(
+        answer=CountingChatModel(calls=[], received=[]), routing=CountingChatModel(calls=[], received=[]),
+        extraction=CountingChatModel(calls=[], received=[]), condense=CountingChatModel(calls=[], received=[])
+    )
+    vector_store = FakeVectorStore()
+    doc_ctx = SimpleNamespace(id=7, name="guias", main_type=ContextMainType.DOCUMENTAL)
+    vap = SimpleNamespace(id=1, name="Agente de prueba", system_prompt="Responde solo con este contexto:\n{context}")
+    tokens: List[str] = []
+
+    async def _on_token(token: str) -> None:
+        tokens.append(token)
+
+    result = asyncio.run(handle_new_question(
+        req=ChatRequest(message=message, session_id=session_id), user_dni=None, llms=llms,
+        history_list=history_list, active_contexts=[doc_ctx], all_allowed_contexts=[doc_ctx],
+        vap=vap, db=None, vector_store=vector_store, app_state=SimpleNamespace(embedding_model=None),
+        redis_client=None, on_token=_on_token if streaming else None
+    ))
+    return result, llms, vector_store, tokens
+
+
+def test_follow_up_turn_condenses_retrieves_and_answers_once():
+    history = [HumanMessage(content="¿Cómo pago la matrícula?"), AIMessage(content="Desde la intranet, en Pagos.")]
+    result, llms, vector_store, _ = _run_turn("¿y cuándo vence?", history, "session-follow-up")
+
+    assert result["log"]["intent"] == "RAG_DOCUMENTAL"
+    assert result["response"] == "Vence el 30 de marzo."
+    assert llms.condense.calls == ["condense"] and llms.answer.calls == ["answer"]
+    assert llms.routing.calls == [] and llms.extraction.calls == []
+    assert vector_store.queries == ["¿Cuándo vence el pago de la matrícula?"]
+    assert result["metadata"]["source_documents"] == [{"source": "guia.pdf", "page": 1}]
+
+
+def test_standalone_first_question_skips_condensation():
+    result, llms, vector_store, _ = _run_turn("¿Cuáles son los requisitos para pagar la matrícula?", [], "session-standalone")
+
+    assert result["log"]["intent"] == "RAG_DOCUMENTAL"
+    assert llms.condense.calls == [] and llms.answer.calls == ["answer"]
+    assert vector_store.queries == ["¿Cuáles son los requisitos para pagar la matrícula?"]
+
+
+def test_streaming_turn_answers_once():
+    history = [HumanMessage(content="¿Cómo pago la matrícula?"), AIMessage(content="Desde la intranet, en Pagos.")]
+    result, llms, vector_store, tokens = _run_turn("¿y cuándo vence?", history, "session-streaming", streaming=True)
+
+    assert llms.condense.calls == ["condense"] and llms.answer.calls == ["answer"]
+    assert len(vector_store.queries) == 1
+    assert tokens and "".join(tokens) == result["response"]
+
+
+def test_history_summary_goes_into_the_leading_system_prompt():
+    summary = SystemMessage(content=f"{SUMMARY_MESSAGE_PREFIX}¿Qué carreras hay?")
+    history = [summary, HumanMessage(content="¿Cómo pago la matrícula?"), AIMessage(content="Desde la intranet, en Pagos.")]
+    _, llms, _, _ = _run_turn("¿y cuándo vence?", history, "session-summary")
+
+    answer_messages = llms.answer.received[0]
+    # Bedrock/Anthropic solo aceptan el mensaje de sistema al principio.
+    assert [m.type for m in answer_messages] == ["system", "human", "ai", "human"]
+    assert answer_messages[0].content.endswith(summary.content)
+    assert all(summary.content not in str(m.content) for m in llms.condense.received[0])
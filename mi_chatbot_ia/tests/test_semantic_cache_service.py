@@ -0,0 +1,85 @@
+# tests/test_semantic_cache_service.py
+"""Índice semántico en memoria: vecino más cercano, purga por versión de ingesta/TTL y ámbitos por agente."""
+import asyncio
+import datetime
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.config import settings
+from app.services import semantic_cache_service
+from app.services.semantic_cache_service import _SemanticIndex
+
+
+def _unit(*values) -> np.ndarray:
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def _entry(ingest_version: int = 0, expires_at: float = float("inf")):
+    return {"response": {"bot_response": "respuesta"}, "ingest_version": ingest_version, "expires_at": expires_at}
+
+
+@pytest.fixture(autouse=True)
+def _clean_semantic_cache(monkeypatch):
+    monkeypatch.setattr(semantic_cache_service, "_indexes", {})
+    monkeypatch.setattr(semantic_cache_service, "_local_ingest_versions", {})
+    monkeypatch.setattr(settings, "SEMANTIC_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "SEMANTIC_CACHE_SIMILARITY_THRESHOLD", 0.9)
+
+
+def test_nearest_returns_most_similar_entry():
+    index = _SemanticIndex(max_entries=10)
+    assert index.nearest(_unit(1, 0)) is None
+    index.add("pagos", _unit(1, 0), _entry())
+    index.add("horarios", _unit(0, 1), _entry())
+
+    position, similarity = index.nearest(_unit(0.1, 1))
+    assert index.questions[position] == "horarios"
+    assert similarity == pytest.approx(float(_unit(0.1, 1) @ _unit(0, 1)))
+
+
+def test_add_evicts_oldest_entry_when_full():
+    index = _SemanticIndex(max_entries=2)
+    for question, vector in (("a", _unit(1, 0)), ("b", _unit(0, 1)), ("c", _unit(1, 1))):
+        index.add(question, vector, _entry())
+    assert index.questions == ["b", "c"]
+
+
+def test_purge_drops_other_ingest_versions_and_expired_entries(monkeypatch):
+    monkeypatch.setattr(semantic_cache_service.time, "monotonic", lambda: 100.0)
+    index = _SemanticIndex(max_entries=10)
+    index.add("vigente", _unit(1, 0), _entry(ingest_version=2, expires_at=200.0))
+    index.add("version_antigua", _unit(0, 1), _entry(ingest_version=1, expires_at=200.0))
+    index.add("expirada", _unit(1, 1), _entry(ingest_version=2, expires_at=50.0))
+
+    index.purge(ingest_version=2)
+    assert index.questions == ["vigente"]
+    # La matriz se reconstruye tras purgar: el vecino sale de las entradas que quedan.
+    position, _ = index.nearest(_unit(0, 1))
+    assert index.questions[position] == "vigente"
+
+
+def test_bumping_ingest_version_invalidates_lookups():
+    vap = SimpleNamespace(id=1, updated_at=None)
+    vector = _unit(1, 0)
+    asyncio.run(semantic_cache_service.store_async(None, vap, 5, "¿cómo pago?", vector, {"bot_response": "En la intranet."}))
+    hit = asyncio.run(semantic_cache_service.lookup_async(None, vap, 5, vector))
+    assert hit["bot_response"] == "En la intranet." and hit["matched_question"] == "¿cómo pago?"
+
+    asyncio.run(semantic_cache_service.bump_ingest_version_async(None, 5))
+    assert asyncio.run(semantic_cache_service.lookup_async(None, vap, 5, vector)) is None
+
+
+def test_editing_the_agent_starts_a_new_scope():
+    vap = SimpleNamespace(id=1, updated_at=datetime.datetime(2026, 1, 1))
+    vector = _unit(1, 0)
+    asyncio.run(semantic_cache_service.store_async(None, vap, 5, "¿cómo pago?", vector, {"bot_response": "Respuesta antigua."}))
+
+    edited_vap = SimpleNamespace(id=1, updated_at=datetime.datetime(2026, 1, 2))
+    assert asyncio.run(semantic_cache_service.lookup_async(None, edited_vap, 5, vector)) is None
+
+    asyncio.run(semantic_cache_service.store_async(None, edited_vap, 5, "¿cómo pago?", vector, {"bot_response": "Respuesta nueva."}))
+    assert len(semantic_cache_service._indexes) == 1  # El índice de la versión anterior se descarta.
+    assert asyncio.run(semantic_cache_service.lookup_async(None, edited_vap, 5, vector))["bot_response"] == "Respuesta nueva."